@@ -1,3 +1,5 @@
+from typing import List, Literal, Optional
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -6,6 +8,86 @@ class Settings(BaseSettings):
     db_url: str 
     admin_db_url: str 
 
+    # Реплики для чтения организаций: JSON-список URL, у каждой свой пул. Выбор по кругу или
+    # по наименьшему числу занятых соединений; недоступная реплика исключается на
+    # db_replica_check_seconds, с той же периодичностью реплики проверяются в фоне (0 - без проверки).
+    # Реплика, не отдавшая соединение за db_replica_ping_timeout секунд, считается недоступной
+    db_replica_urls: List[str] = []
+    db_replica_strategy: Literal["round_robin", "least_loaded"] = "round_robin"
+    db_replica_check_seconds: float = 5
+    db_replica_ping_timeout: float = 2
+
+    # Кэши запросов: скомпилированный SQL в SQLAlchemy (на движок) и подготовленные
+    # запросы asyncpg (на соединение, 0 - без подготовки)
+    db_query_cache_size: int = 500
+    db_prepared_statement_cache_size: int = 100
+
+    # Ключи API: API_KEY - основной, API_KEYS - JSON-список дополнительных (например, для ротации)
+    api_key: Optional[str] = None
+    api_keys: List[str] = []
+
+    # Движок чтения организаций: ORM (joinedload) или сборка JSON-документов в Postgres
+    repository_engine: Literal["orm", "json"] = "orm"
+
+    # In-memory индекс зданий для геопоиска
+    spatial_index_enabled: bool = False
+    spatial_index_cell_degrees: float = 0.01
+    # Проверка устаревания снимка: сравнение штампа таблицы buildings (число строк и наибольший
+    # xmin), здания перечитываются только при изменении; 0 - обновлять только по запросу
+    spatial_index_refresh_seconds: float = 5
+
+    # Проверка устаревания кэша дерева деятельностей: сравнение штампа таблицы activities
+    # (число строк и наибольший xmin), дерево перечитывается только при изменении; 0 - только по запросу
+    activity_tree_check_seconds: float = 5
+
+    # Кэш ответов by-id / by-building
+    response_cache_enabled: bool = True
+    response_cache_ttl_seconds: float = 30
+    response_cache_max_bytes: int = 64 * 1024 * 1024
+    response_cache_max_entries: Optional[int] = None
+
+    # Векторные тайлы: до tile_cluster_max_zoom включительно здания группируются по сетке
+    # tile_cluster_grid x tile_cluster_grid ячеек на тайл; свой кэш тайлов по (z, x, y, фильтр)
+    tile_cluster_max_zoom: int = 14
+    tile_cluster_grid: int = 64
+    tile_cache_enabled: bool = True
+    tile_cache_ttl_seconds: float = 300
+    tile_cache_max_bytes: int = 128 * 1024 * 1024
+
+    # Объединение одинаковых одновременных вызовов сервиса организаций в один запрос к базе;
+    # к одному выполнению присоединяется не больше single_flight_max_waiters вызовов
+    single_flight_enabled: bool = True
+    single_flight_max_waiters: int = 1000
+
+    # Поиск по названию: порог триграммной схожести и бюджет времени запроса
+    search_similarity_threshold: float = 0.3
+    search_timeout_ms: int = 1000
+
+    # Выгрузка NDJSON: организаций в одной части, читаемой из серверного курсора
+    export_chunk_size: int = 1000
+
+    # Метрики Prometheus на /metrics
+    metrics_enabled: bool = True
+
+    # Заголовок Server-Timing со временем запросов к базе (для нагрузочных тестов)
+    server_timing_enabled: bool = False
+
+    # Журнал медленных запросов: порог (не задан - выключен), доля запросов с EXPLAIN ANALYZE,
+    # размер кольцевого буфера и необязательный файл JSON Lines с ротацией
+    slow_query_threshold_ms: Optional[float] = None
+    slow_query_explain_sample_rate: float = 0.1
+    slow_query_explain_timeout_ms: int = 10000
+    slow_query_buffer_size: int = 200
+    slow_query_log_path: Optional[str] = None
+    # Значения параметров в журнале (поисковые строки, id); по умолчанию только их типы,
+    # потому что журнал отдается в /admin/slow-queries любому держателю ключа API
+    slow_query_log_parameters: bool = False
+
+    @property
+    def auth_api_keys(self) -> List[str]:
+        """Все действующие ключи API"""
+        return [key for key in [self.api_key, *self.api_keys] if key]
+
     class Config:
         env_file = ".env"
 
@@ -1,35 +1,115 @@
+import asyncio
+import logging
+import time
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import AsyncGenerator, List, Literal, Optional, Sequence, Tuple
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.database.query_timing import instrument_engine
+from app.database.slow_queries import SlowQueryRecorder
+from app.metrics import (
+    DB_POOL_TIMEOUTS,
+    DB_POOL_WAIT,
+    DB_READ_SESSIONS,
+    DB_REPLICA_FAILURES,
+    instrument_engine_metrics
+)
+
+logger = logging.getLogger(__name__)
+
+# Ошибки подключения к реплике, после которых чтение уходит на другую базу
+REPLICA_CONNECTION_ERRORS = (DBAPIError, OSError, asyncio.TimeoutError)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, измеряющий время получения соединения (ожидание или открытие нового)"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started)
+
+
+class ReadReplica:
+    """Реплика для чтения: свой движок и пул, исключается из выбора до down_until после сбоя"""
+
+    def __init__(self, name: str, engine: AsyncEngine):
+        self.name = name
+        self.engine = engine
+        self.session_factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        self.down_until = 0.0
+        self.last_error: Optional[str] = None
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "available": self.available,
+            "checked_out": self.engine.pool.checkedout(),
+            "last_error": self.last_error,
+        }
+
 
 class AsyncDatabaseHelper:
-    """Асинхронный хелпер для работы с БД и управлением сессиями."""
+    """Асинхронный хелпер для работы с БД и управлением сессиями.
 
-    def __init__(self, database_url: str):
-        self.database_url = database_url.replace("postgresql://", "postgresql+asyncpg://")
+    Запись и чтение, которому нужны только что записанные данные, идут через
+    session_only в основную базу. read_session отдает сессию реплики, если они
+    заданы, и переключается на основную базу, когда доступных реплик нет.
+    """
+
+    def __init__(
+        self,
+        database_url: str,
+        replica_urls: Sequence[str] = (),
+        replica_strategy: Literal["round_robin", "least_loaded"] = "round_robin",
+        replica_retry_seconds: float = 5,
+        replica_ping_timeout: float = 2.0,
+        query_cache_size: int = 500,
+        prepared_statement_cache_size: int = 100,
+        slow_query_recorder: Optional[SlowQueryRecorder] = None
+    ):
+        self.database_url = self._async_url(database_url)
+        self.replica_urls = [self._async_url(url) for url in replica_urls]
+        self.replica_strategy = replica_strategy
+        self.replica_retry_seconds = replica_retry_seconds
+        self.replica_ping_timeout = replica_ping_timeout
+        self.query_cache_size = query_cache_size
+        self.prepared_statement_cache_size = prepared_statement_cache_size
+        self.slow_query_recorder = slow_query_recorder
 
         self.engine = None
         self.async_session_factory = None
+        self.replicas: List[ReadReplica] = []
+        self._replica_turn = 0
         self.Base = declarative_base()
 
     async def connect(self):
-        """Создает подключение и инициализирует пул соединений."""
+        """Создает подключение и инициализирует пулы соединений основной базы и реплик."""
         if self.engine:
             return  # уже инициализирован
 
-        self.engine = create_async_engine(
-            self.database_url,
-            echo=False,
-            pool_size=10,
-            max_overflow=20,
-            pool_pre_ping=True,
-            pool_recycle=3600,
-            pool_timeout=30
-        )
-        
+        self.engine = self._create_engine(self.database_url, "primary")
+        self.replicas = [
+            ReadReplica(f"replica{number}", self._create_engine(url, f"replica{number}"))
+            for number, url in enumerate(self.replica_urls, start=1)
+        ]
+
         self.async_session_factory = async_sessionmaker(
             self.engine,
             expire_on_commit=False,
@@ -46,9 +126,127 @@ class AsyncDatabaseHelper:
                 await session.rollback()
                 raise
 
+    @asynccontextmanager
+    async def read_session(self) -> AsyncGenerator[AsyncSession, None]:
+        """Сессия только для чтения на реплике; без доступных реплик - на основной базе.
+
+        Соединение берется до передачи сессии вызывающему: если реплика не
+        отвечает за replica_ping_timeout (в том числе принимает TCP, но зависает),
+        она исключается на replica_retry_seconds и выбирается следующая.
+        Ошибки самих запросов не переключают базу.
+        """
+        replica = self._choose_replica()
+        while replica is not None:
+            session = replica.session_factory()
+            try:
+                await asyncio.wait_for(session.connection(), self.replica_ping_timeout)
+            except REPLICA_CONNECTION_ERRORS as e:
+                await session.close()
+                self._mark_down(replica, e)
+                replica = self._choose_replica()
+                continue
+
+            DB_READ_SESSIONS.inc(replica.name)
+            async with session:
+                try:
+                    yield session
+                except Exception:
+                    await session.rollback()
+                    raise
+            return
+
+        DB_READ_SESSIONS.inc("primary")
+        async with self.session_only() as session:
+            yield session
+
+    def read_session_factories(self) -> List[Tuple[str, async_sessionmaker]]:
+        """Фабрики сессий всех баз, обслуживающих чтение: для прогрева кэшей на каждой"""
+        return [(replica.name, replica.session_factory) for replica in self.replicas] + [
+            ("primary", self.async_session_factory)
+        ]
+
+    async def check_replicas(self, timeout: Optional[float] = None) -> List[dict]:
+        """Проверить реплики запросом SELECT 1: ответившие за timeout (по умолчанию replica_ping_timeout)
+        возвращаются в выбор, остальные исключаются"""
+        timeout = self.replica_ping_timeout if timeout is None else timeout
+        for replica in self.replicas:
+            try:
+                # Таймаут покрывает и подключение: недоступный адрес может не отвечать на connect
+                await asyncio.wait_for(self._ping(replica.engine), timeout)
+            except REPLICA_CONNECTION_ERRORS as e:
+                self._mark_down(replica, e)
+            else:
+                if not replica.available:
+                    logger.info("Replica %s is back", replica.name)
+                replica.down_until = 0.0
+                replica.last_error = None
+        return [replica.stats() for replica in self.replicas]
+
+    async def check_replicas_periodically(self, interval: float):
+        """Фоновая проверка реплик; ошибки не останавливают цикл"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check_replicas()
+            except Exception:
+                logger.exception("Replica health check failed")
+
     async def close(self):
-        """Закрывает соединения и пул."""
+        """Закрывает соединения и пулы."""
+        for replica in self.replicas:
+            await replica.engine.dispose()
+        self.replicas = []
         if self.engine:
             await self.engine.dispose()
             self.engine = None
             self.async_session_factory = None
+
+    def _create_engine(self, url: str, name: str) -> AsyncEngine:
+        """Движок со своим пулом, учетом времени запросов и метриками пула с меткой name.
+
+        query_cache_size - кэш скомпилированного SQL в SQLAlchemy (на движок),
+        prepared_statement_cache_size - кэш подготовленных asyncpg запросов (на соединение).
+        """
+        engine = create_async_engine(
+            url,
+            echo=False,
+            query_cache_size=self.query_cache_size,
+            connect_args={"prepared_statement_cache_size": self.prepared_statement_cache_size},
+            poolclass=TimedQueuePool,
+            pool_size=10,
+            max_overflow=20,
+            pool_pre_ping=True,
+            pool_recycle=3600,
+            pool_timeout=30
+        )
+        instrument_engine(engine.sync_engine)
+        instrument_engine_metrics(engine.sync_engine, name)
+        if self.slow_query_recorder:
+            self.slow_query_recorder.attach(engine)
+        return engine
+
+    @staticmethod
+    async def _ping(engine: AsyncEngine) -> None:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    def _choose_replica(self) -> Optional[ReadReplica]:
+        """Доступная реплика по стратегии: по кругу или с наименьшим числом занятых соединений"""
+        available = [replica for replica in self.replicas if replica.available]
+        if not available:
+            return None
+        if self.replica_strategy == "least_loaded":
+            return min(available, key=lambda replica: replica.engine.pool.checkedout())
+        self._replica_turn += 1
+        return available[self._replica_turn % len(available)]
+
+    def _mark_down(self, replica: ReadReplica, error: Exception) -> None:
+        if replica.available:
+            logger.warning("Replica %s excluded from reads: %s", replica.name, error)
+        DB_REPLICA_FAILURES.inc(replica.name)
+        replica.down_until = time.monotonic() + self.replica_retry_seconds
+        replica.last_error = str(error)
+
+    @staticmethod
+    def _async_url(url: str) -> str:
+        return url.replace("postgresql://", "postgresql+asyncpg://")
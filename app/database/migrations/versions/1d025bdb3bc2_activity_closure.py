@@ -0,0 +1,121 @@
+"""activity closure table
+
+Revision ID: 1d025bdb3bc2
+Revises: aad389aa1227
+Create Date: 2026-10-17 12:20:05.331847
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1d025bdb3bc2'
+down_revision: Union[str, Sequence[str], None] = 'aad389aa1227'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблица замыкания: все пары (предок, потомок) дерева деятельностей,
+    # включая пару (узел, узел) с глубиной 0
+    op.create_table('activity_closure',
+    sa.Column('ancestor_id', sa.UUID(), nullable=False),
+    sa.Column('descendant_id', sa.UUID(), nullable=False),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ancestor_id'], ['activities.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['descendant_id'], ['activities.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    op.create_index('idx_activity_closure_descendant_id', 'activity_closure', ['descendant_id'])
+
+    # Организации ищутся по деятельности, а первичный ключ начинается с organization_id
+    op.create_index('idx_organization_activities_activity_id', 'organization_activities', ['activity_id'])
+
+    op.execute("""
+        INSERT INTO activity_closure (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE paths AS (
+            SELECT id AS ancestor_id, id AS descendant_id, 0 AS depth
+            FROM activities
+
+            UNION ALL
+
+            SELECT p.ancestor_id, a.id, p.depth + 1
+            FROM paths p
+            INNER JOIN activities a ON a.parent_id = p.descendant_id
+        )
+        SELECT ancestor_id, descendant_id, depth FROM paths
+    """)
+
+    # Новая деятельность наследует пути родителя
+    op.execute("""
+        CREATE FUNCTION activity_closure_insert() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO activity_closure (ancestor_id, descendant_id, depth)
+            SELECT ancestor_id, NEW.id, depth + 1
+            FROM activity_closure
+            WHERE descendant_id = NEW.parent_id
+            UNION ALL
+            SELECT NEW.id, NEW.id, 0;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER activity_closure_insert
+        AFTER INSERT ON activities
+        FOR EACH ROW EXECUTE FUNCTION activity_closure_insert()
+    """)
+
+    # Перенос поддерева: удаляем пути от старых предков и строим пути от новых.
+    # Удаление деятельности обрабатывается каскадом внешних ключей
+    op.execute("""
+        CREATE FUNCTION activity_closure_move() RETURNS trigger AS $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM activity_closure
+                WHERE ancestor_id = NEW.id AND descendant_id = NEW.parent_id
+            ) THEN
+                RAISE EXCEPTION 'Activity % cannot be moved under its own descendant %', NEW.id, NEW.parent_id;
+            END IF;
+
+            DELETE FROM activity_closure c
+            USING activity_closure subtree
+            WHERE subtree.ancestor_id = NEW.id
+              AND c.descendant_id = subtree.descendant_id
+              AND c.ancestor_id IN (
+                  SELECT ancestor_id FROM activity_closure
+                  WHERE descendant_id = NEW.id AND ancestor_id <> NEW.id
+              );
+
+            INSERT INTO activity_closure (ancestor_id, descendant_id, depth)
+            SELECT parent_path.ancestor_id, subtree.descendant_id, parent_path.depth + subtree.depth + 1
+            FROM activity_closure parent_path
+            CROSS JOIN activity_closure subtree
+            WHERE parent_path.descendant_id = NEW.parent_id
+              AND subtree.ancestor_id = NEW.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER activity_closure_move
+        AFTER UPDATE OF parent_id ON activities
+        FOR EACH ROW
+        WHEN (OLD.parent_id IS DISTINCT FROM NEW.parent_id)
+        EXECUTE FUNCTION activity_closure_move()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS activity_closure_move ON activities")
+    op.execute("DROP TRIGGER IF EXISTS activity_closure_insert ON activities")
+    op.execute("DROP FUNCTION IF EXISTS activity_closure_move()")
+    op.execute("DROP FUNCTION IF EXISTS activity_closure_insert()")
+    op.drop_index('idx_organization_activities_activity_id', table_name='organization_activities')
+    op.drop_index('idx_activity_closure_descendant_id', table_name='activity_closure')
+    op.drop_table('activity_closure')
@@ -0,0 +1,33 @@
+"""organizations name trigram index
+
+Revision ID: 5d57c73394f8
+Revises: 1d025bdb3bc2
+Create Date: 2026-10-17 14:02:48.120934
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d57c73394f8'
+down_revision: Union[str, Sequence[str], None] = '1d025bdb3bc2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Триграммный индекс обслуживает ILIKE 'префикс%', оператор схожести % и точное равенство
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_organizations_name_trgm
+        ON organizations USING gin (name gin_trgm_ops)
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_organizations_name_trgm', table_name='organizations')
@@ -0,0 +1,244 @@
+"""organization counters
+
+Revision ID: 7b3e91c0d4a6
+Revises: 5d57c73394f8
+Create Date: 2026-10-17 16:41:12.508213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b3e91c0d4a6'
+down_revision: Union[str, Sequence[str], None] = '5d57c73394f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Число организаций в здании. Строки с нулем удаляются
+    op.create_table('building_organization_counts',
+    sa.Column('building_id', sa.UUID(), nullable=False),
+    sa.Column('organizations', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('building_id')
+    )
+    # Пары (предок в дереве деятельностей, организация) с числом связей организации
+    # с деятельностями поддерева: организация считается в поддереве один раз,
+    # пока у нее есть хотя бы одна такая связь
+    op.create_table('activity_subtree_organizations',
+    sa.Column('ancestor_id', sa.UUID(), nullable=False),
+    sa.Column('organization_id', sa.UUID(), nullable=False),
+    sa.Column('links', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('ancestor_id', 'organization_id')
+    )
+    # Число различных организаций в поддереве деятельности, включая ее саму
+    op.create_table('activity_organization_counts',
+    sa.Column('activity_id', sa.UUID(), nullable=False),
+    sa.Column('organizations', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('activity_id')
+    )
+
+    # Полный пересчет: начальное заполнение, перенос поддерева деятельностей,
+    # массовая загрузка с отключенными триггерами
+    op.execute("""
+        CREATE FUNCTION building_organization_counts_rebuild() RETURNS void AS $$
+        BEGIN
+            DELETE FROM building_organization_counts;
+            INSERT INTO building_organization_counts (building_id, organizations)
+            SELECT building_id, count(*) FROM organizations GROUP BY building_id;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE FUNCTION activity_organization_counts_rebuild() RETURNS void AS $$
+        BEGIN
+            DELETE FROM activity_organization_counts;
+            DELETE FROM activity_subtree_organizations;
+            INSERT INTO activity_subtree_organizations (ancestor_id, organization_id, links)
+            SELECT c.ancestor_id, l.organization_id, count(*)
+            FROM organization_activities l
+            INNER JOIN activity_closure c ON c.descendant_id = l.activity_id
+            GROUP BY c.ancestor_id, l.organization_id;
+            INSERT INTO activity_organization_counts (activity_id, organizations)
+            SELECT ancestor_id, count(*) FROM activity_subtree_organizations GROUP BY ancestor_id;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("SELECT building_organization_counts_rebuild()")
+    op.execute("SELECT activity_organization_counts_rebuild()")
+
+    # Триггеры уровня оператора с таблицами переходов: пакетная вставка
+    # обновляет счетчики одним запросом на пакет, а не на строку
+    op.execute("""
+        CREATE FUNCTION building_organization_counts_update() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' THEN
+                -- Учитываются только организации, сменившие здание
+                INSERT INTO building_organization_counts AS c (building_id, organizations)
+                SELECT n.building_id, count(*)
+                FROM new_rows n INNER JOIN old_rows o ON o.id = n.id
+                WHERE n.building_id IS DISTINCT FROM o.building_id
+                GROUP BY n.building_id
+                ON CONFLICT (building_id) DO UPDATE SET organizations = c.organizations + EXCLUDED.organizations;
+
+                UPDATE building_organization_counts c SET organizations = c.organizations - moved.organizations
+                FROM (
+                    SELECT o.building_id, count(*) AS organizations
+                    FROM old_rows o INNER JOIN new_rows n ON n.id = o.id
+                    WHERE n.building_id IS DISTINCT FROM o.building_id
+                    GROUP BY o.building_id
+                ) moved
+                WHERE c.building_id = moved.building_id;
+            ELSIF TG_OP = 'INSERT' THEN
+                INSERT INTO building_organization_counts AS c (building_id, organizations)
+                SELECT building_id, count(*) FROM new_rows GROUP BY building_id
+                ON CONFLICT (building_id) DO UPDATE SET organizations = c.organizations + EXCLUDED.organizations;
+            ELSE
+                UPDATE building_organization_counts c SET organizations = c.organizations - removed.organizations
+                FROM (SELECT building_id, count(*) AS organizations FROM old_rows GROUP BY building_id) removed
+                WHERE c.building_id = removed.building_id;
+            END IF;
+
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM building_organization_counts
+                WHERE organizations <= 0 AND building_id IN (SELECT building_id FROM old_rows);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER organization_counters_insert
+        AFTER INSERT ON organizations REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION building_organization_counts_update()
+    """)
+    op.execute("""
+        CREATE TRIGGER organization_counters_update
+        AFTER UPDATE ON organizations REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION building_organization_counts_update()
+    """)
+    op.execute("""
+        CREATE TRIGGER organization_counters_delete
+        AFTER DELETE ON organizations REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION building_organization_counts_update()
+    """)
+
+    # Связь организации с деятельностью меняет счетчики всех предков деятельности.
+    # Счетчик поддерева растет, когда у организации появляется первая связь
+    # в поддереве (links после вставки равно добавленным связям), и уменьшается,
+    # когда links доходит до нуля
+    op.execute("""
+        CREATE FUNCTION activity_organization_counts_update() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE activity_subtree_organizations s SET links = s.links - removed.links
+                FROM (
+                    SELECT c.ancestor_id, o.organization_id, count(*) AS links
+                    FROM old_rows o INNER JOIN activity_closure c ON c.descendant_id = o.activity_id
+                    GROUP BY c.ancestor_id, o.organization_id
+                ) removed
+                WHERE s.ancestor_id = removed.ancestor_id AND s.organization_id = removed.organization_id;
+
+                WITH emptied AS (
+                    DELETE FROM activity_subtree_organizations s
+                    USING (
+                        SELECT DISTINCT c.ancestor_id, o.organization_id
+                        FROM old_rows o INNER JOIN activity_closure c ON c.descendant_id = o.activity_id
+                    ) removed
+                    WHERE s.ancestor_id = removed.ancestor_id
+                      AND s.organization_id = removed.organization_id
+                      AND s.links <= 0
+                    RETURNING s.ancestor_id
+                )
+                UPDATE activity_organization_counts a SET organizations = a.organizations - e.organizations
+                FROM (SELECT ancestor_id, count(*) AS organizations FROM emptied GROUP BY ancestor_id) e
+                WHERE a.activity_id = e.ancestor_id;
+            END IF;
+
+            IF TG_OP IN ('UPDATE', 'INSERT') THEN
+                WITH added AS (
+                    SELECT c.ancestor_id, n.organization_id, count(*) AS links
+                    FROM new_rows n INNER JOIN activity_closure c ON c.descendant_id = n.activity_id
+                    GROUP BY c.ancestor_id, n.organization_id
+                ), upserted AS (
+                    INSERT INTO activity_subtree_organizations AS s (ancestor_id, organization_id, links)
+                    SELECT ancestor_id, organization_id, links FROM added
+                    ON CONFLICT (ancestor_id, organization_id) DO UPDATE SET links = s.links + EXCLUDED.links
+                    RETURNING s.ancestor_id, s.organization_id, s.links
+                )
+                INSERT INTO activity_organization_counts AS a (activity_id, organizations)
+                SELECT u.ancestor_id, count(*)
+                FROM upserted u
+                INNER JOIN added ON added.ancestor_id = u.ancestor_id AND added.organization_id = u.organization_id
+                WHERE u.links = added.links
+                GROUP BY u.ancestor_id
+                ON CONFLICT (activity_id) DO UPDATE SET organizations = a.organizations + EXCLUDED.organizations;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER organization_activity_counters_insert
+        AFTER INSERT ON organization_activities REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION activity_organization_counts_update()
+    """)
+    op.execute("""
+        CREATE TRIGGER organization_activity_counters_update
+        AFTER UPDATE ON organization_activities REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION activity_organization_counts_update()
+    """)
+    op.execute("""
+        CREATE TRIGGER organization_activity_counters_delete
+        AFTER DELETE ON organization_activities REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION activity_organization_counts_update()
+    """)
+
+    # Перенос поддерева меняет предков у всех его связей - пересчет целиком.
+    # Срабатывает после строковых триггеров activity_closure_move. Таблицы
+    # переходов несовместимы со списком столбцов (UPDATE OF parent_id), поэтому
+    # триггер срабатывает на любое обновление и сразу выходит, если ни одна
+    # строка не сменила родителя (например, при переименовании)
+    op.execute("""
+        CREATE FUNCTION activity_tree_counters_rebuild() RETURNS trigger AS $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM new_rows n INNER JOIN old_rows o ON o.id = n.id
+                WHERE n.parent_id IS DISTINCT FROM o.parent_id
+            ) THEN
+                RETURN NULL;
+            END IF;
+            PERFORM activity_organization_counts_rebuild();
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER activity_tree_counters_rebuild
+        AFTER UPDATE ON activities
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION activity_tree_counters_rebuild()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS activity_tree_counters_rebuild ON activities")
+    op.execute("DROP TRIGGER IF EXISTS organization_activity_counters_delete ON organization_activities")
+    op.execute("DROP TRIGGER IF EXISTS organization_activity_counters_update ON organization_activities")
+    op.execute("DROP TRIGGER IF EXISTS organization_activity_counters_insert ON organization_activities")
+    op.execute("DROP TRIGGER IF EXISTS organization_counters_delete ON organizations")
+    op.execute("DROP TRIGGER IF EXISTS organization_counters_update ON organizations")
+    op.execute("DROP TRIGGER IF EXISTS organization_counters_insert ON organizations")
+    op.execute("DROP FUNCTION IF EXISTS activity_tree_counters_rebuild()")
+    op.execute("DROP FUNCTION IF EXISTS activity_organization_counts_update()")
+    op.execute("DROP FUNCTION IF EXISTS building_organization_counts_update()")
+    op.execute("DROP FUNCTION IF EXISTS activity_organization_counts_rebuild()")
+    op.execute("DROP FUNCTION IF EXISTS building_organization_counts_rebuild()")
+    op.drop_table('activity_organization_counts')
+    op.drop_table('activity_subtree_organizations')
+    op.drop_table('building_organization_counts')
@@ -0,0 +1,34 @@
+"""buildings geography index
+
+Revision ID: aad389aa1227
+Revises: bd5aeee64755
+Create Date: 2026-10-17 11:03:27.904117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'aad389aa1227'
+down_revision: Union[str, Sequence[str], None] = 'bd5aeee64755'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Функциональный индекс для ST_DWithin по geography (радиус в настоящих метрах).
+    # Выражение должно совпадать с запросом репозитория: geography(location)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_buildings_location_geography
+        ON buildings USING gist (geography(location))
+    """)
+    op.execute("ANALYZE buildings")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_buildings_location_geography', table_name='buildings')
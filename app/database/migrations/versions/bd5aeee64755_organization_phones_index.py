@@ -0,0 +1,29 @@
+"""organization_phones index
+
+Revision ID: bd5aeee64755
+Revises: 94e2a8885f74
+Create Date: 2026-10-17 10:12:41.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bd5aeee64755'
+down_revision: Union[str, Sequence[str], None] = '94e2a8885f74'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Телефоны выбираются по организации (joinedload и подзапрос jsonb_agg)
+    op.create_index('idx_organization_phones_organization_id', 'organization_phones', ['organization_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_organization_phones_organization_id', table_name='organization_phones')
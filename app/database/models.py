@@ -1,7 +1,7 @@
 """ORM для Postgres"""
 from uuid import uuid4
-from sqlalchemy import Column, ForeignKey, String, Table, UUID, Integer
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, ForeignKey, String, Table, UUID, Integer, func
+from sqlalchemy.orm import relationship, declarative_base, column_property
 from geoalchemy2 import Geometry
 
 Base = declarative_base()
@@ -14,6 +14,40 @@ organization_activities = Table(
     Column("activity_id", UUID, ForeignKey("activities.id"), primary_key=True)
 )
 
+# Таблица замыкания дерева деятельностей: все пары (предок, потомок), включая (узел, узел).
+# Поддерживается триггерами на activities, см. миграцию activity_closure
+activity_closure = Table(
+    "activity_closure",
+    Base.metadata,
+    Column("ancestor_id", UUID, ForeignKey("activities.id", ondelete="CASCADE"), primary_key=True),
+    Column("descendant_id", UUID, ForeignKey("activities.id", ondelete="CASCADE"), primary_key=True),
+    Column("depth", Integer, nullable=False)
+)
+
+# Счетчики организаций по зданиям и поддеревьям деятельностей.
+# Поддерживаются триггерами, см. миграцию organization_counters
+building_organization_counts = Table(
+    "building_organization_counts",
+    Base.metadata,
+    Column("building_id", UUID, primary_key=True),
+    Column("organizations", Integer, nullable=False)
+)
+
+activity_subtree_organizations = Table(
+    "activity_subtree_organizations",
+    Base.metadata,
+    Column("ancestor_id", UUID, primary_key=True),
+    Column("organization_id", UUID, primary_key=True),
+    Column("links", Integer, nullable=False)
+)
+
+activity_organization_counts = Table(
+    "activity_organization_counts",
+    Base.metadata,
+    Column("activity_id", UUID, primary_key=True),
+    Column("organizations", Integer, nullable=False)
+)
+
 # Связующая таблица для организации и телефонов (можно хранить несколько телефонов)
 class OrganizationPhone(Base):
     __tablename__ = "organization_phones"
@@ -37,6 +71,9 @@ class Building(Base):
     id = Column(UUID, primary_key=True, default=uuid4)
     address = Column(String, nullable=False)
     location = Column(Geometry(geometry_type='POINT', srid=4326)) 
+    # Координаты проецируются в запросе, чтобы не разбирать WKB в Python
+    longitude = column_property(func.ST_X(location))
+    latitude = column_property(func.ST_Y(location))
     
     organizations = relationship("Organization", back_populates="building")
 
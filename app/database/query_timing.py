@@ -0,0 +1,39 @@
+"""Учет времени запросов к базе в рамках одного HTTP-запроса"""
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryTimer:
+    """Суммарное время и число запросов к базе"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.queries = 0
+
+
+# Таймер текущего HTTP-запроса; SQLAlchemy переносит контекст задачи в greenlet драйвера,
+# поэтому события движка видят таймер, установленный middleware
+current_query_timer: ContextVar[Optional[QueryTimer]] = ContextVar("current_query_timer", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_query_timer.get() is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timer = current_query_timer.get()
+    started = getattr(context, "_query_started", None)
+    if timer is not None and started is not None:
+        timer.seconds += time.perf_counter() - started
+        timer.queries += 1
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Подключить учет времени к движку (синхронному движку AsyncEngine)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
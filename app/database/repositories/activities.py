@@ -0,0 +1,32 @@
+from typing import List, Tuple
+
+from sqlalchemy import select, text
+
+from app.database.db_helper import AsyncDatabaseHelper
+from app.metrics import instrumented_repository
+from app.database.models import Activity
+
+
+@instrumented_repository
+class ActivitiesRepository:
+    """Репозиторий видов деятельности"""
+
+    def __init__(self, db_helper: AsyncDatabaseHelper):
+        self.db_helper = db_helper
+
+    async def all_activities(self) -> List[tuple]:
+        """Получить (id, name, parent_id, level) всех видов деятельности"""
+        async with self.db_helper.session_only() as session:
+            query = (
+                select(Activity.id, Activity.name, Activity.parent_id, Activity.level)
+                .order_by(Activity.level, Activity.name, Activity.id)
+            )
+            result = await session.execute(query)
+            return result.all()
+
+    async def tree_stamp(self) -> Tuple[int, int]:
+        """Штамп таблицы: (число строк, наибольший xmin). Любая вставка, перенос или
+        переименование дает строку с новым xmin, удаление уменьшает число строк"""
+        async with self.db_helper.session_only() as session:
+            result = await session.execute(text("SELECT count(*), coalesce(max(xmin::text::bigint), 0) FROM activities"))
+            return tuple(result.one())
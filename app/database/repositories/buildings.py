@@ -0,0 +1,32 @@
+from typing import List, Tuple
+
+from sqlalchemy import select, text
+
+from app.database.db_helper import AsyncDatabaseHelper
+from app.metrics import instrumented_repository
+from app.database.models import Building
+
+
+@instrumented_repository
+class BuildingsRepository:
+    """Репозиторий зданий"""
+
+    def __init__(self, db_helper: AsyncDatabaseHelper):
+        self.db_helper = db_helper
+
+    async def building_locations(self) -> List[tuple]:
+        """Получить (id, широта, долгота) всех зданий с координатами"""
+        async with self.db_helper.session_only() as session:
+            query = (
+                select(Building.id, Building.latitude, Building.longitude)
+                .where(Building.location.isnot(None))
+            )
+            result = await session.execute(query)
+            return result.all()
+
+    async def locations_stamp(self) -> Tuple[int, int]:
+        """Штамп таблицы: (число строк, наибольший xmin). Вставка и перенос здания дают
+        строку с новым xmin, удаление уменьшает число строк"""
+        async with self.db_helper.session_only() as session:
+            result = await session.execute(text("SELECT count(*), coalesce(max(xmin::text::bigint), 0) FROM buildings"))
+            return tuple(result.one())
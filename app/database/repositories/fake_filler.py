@@ -1,4 +1,6 @@
-from typing import List
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Sequence, Tuple
 from sqlalchemy import select, text
 
 from app.database.db_helper import AsyncDatabaseHelper
@@ -10,6 +12,90 @@ from app.database.models import (
     organization_activities
 )
 
+# Таблицы, на время загрузки которых снимаются вторичные индексы и внешние ключи.
+# activities не входит: она маленькая, а ее триггеры поддерживают activity_closure
+BULK_TABLES = ("buildings", "organizations", "organization_phones", "organization_activities")
+
+# Триггеры счетчиков организаций (миграция organization_counters). На время загрузки
+# отключаются, счетчики пересчитываются целиком одним проходом после нее
+COUNTER_TRIGGERS = {
+    "organizations": (
+        "organization_counters_insert",
+        "organization_counters_update",
+        "organization_counters_delete"
+    ),
+    "organization_activities": (
+        "organization_activity_counters_insert",
+        "organization_activity_counters_update",
+        "organization_activity_counters_delete"
+    ),
+}
+
+# Память на сортировку при пересоздании индексов после загрузки
+BULK_MAINTENANCE_WORK_MEM = "512MB"
+
+
+class BulkLoader:
+    """Загрузка строк через COPY на одном соединении asyncpg с отчетом о скорости.
+
+    Строки отправляются пакетами по batch_size, каждый пакет - отдельный COPY
+    в своей транзакции, так что размер транзакции ограничен размером пакета.
+    """
+
+    def __init__(self, connection, batch_size: int = 10000, report_every: float = 5.0):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.report_every = report_every
+        self.rows: Dict[str, int] = {}
+        self.started = time.perf_counter()
+        self._reported = self.started
+
+    async def copy(self, table: str, columns: Sequence[str], records: List[tuple]) -> None:
+        """COPY кортежей в таблицу"""
+        for start in range(0, len(records), self.batch_size):
+            batch = records[start:start + self.batch_size]
+            await self.connection.copy_records_to_table(table, records=batch, columns=list(columns))
+            self._count(table, len(batch))
+
+    async def copy_buildings(self, records: List[Tuple]) -> None:
+        """COPY зданий (id, address, longitude, latitude).
+
+        У asyncpg нет кодека geometry, поэтому координаты загружаются
+        во временную таблицу и переносятся одним INSERT ... SELECT.
+        """
+        async with self.connection.transaction():
+            await self.connection.execute("""
+                CREATE TEMP TABLE buildings_staging (
+                    id uuid, address text, longitude float8, latitude float8
+                ) ON COMMIT DROP
+            """)
+            for start in range(0, len(records), self.batch_size):
+                await self.connection.copy_records_to_table(
+                    "buildings_staging",
+                    records=records[start:start + self.batch_size],
+                    columns=["id", "address", "longitude", "latitude"]
+                )
+            await self.connection.execute("""
+                INSERT INTO buildings (id, address, location)
+                SELECT id, address, ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)
+                FROM buildings_staging
+            """)
+        self._count("buildings", len(records))
+
+    def report(self) -> None:
+        elapsed = time.perf_counter() - self.started
+        total = sum(self.rows.values())
+        tables = ", ".join(f"{table}: {rows}" for table, rows in self.rows.items())
+        print(f"   {total} строк за {elapsed:.1f} с ({total / elapsed:.0f} строк/с) - {tables}")
+
+    def _count(self, table: str, rows: int) -> None:
+        self.rows[table] = self.rows.get(table, 0) + rows
+        now = time.perf_counter()
+        if now - self._reported >= self.report_every:
+            self._reported = now
+            self.report()
+
+
 class FakeFillerRepository:
     """Репозиторий для заполнения базы данных тестовыми данными"""
     
@@ -48,11 +134,106 @@ class FakeFillerRepository:
     async def create_organization_activity_relations(self, relations: List[dict]) -> None:
         """Создает связи между организациями и видами деятельности"""
         async with self.db_helper.session_only() as session:
-            for relation in relations:
-                stmt = organization_activities.insert().values(**relation)
-                await session.execute(stmt)
+            # executemany одним вызовом вместо запроса на каждую связь
+            if relations:
+                await session.execute(organization_activities.insert(), relations)
             await session.commit()
 
+    @asynccontextmanager
+    async def bulk_loader(
+        self,
+        batch_size: int = 10000,
+        tables: Sequence[str] = BULK_TABLES,
+        defer_constraints: bool = True
+    ) -> AsyncIterator[BulkLoader]:
+        """Соединение для COPY-загрузки.
+
+        С defer_constraints вторичные индексы и внешние ключи таблиц снимаются
+        перед загрузкой и создаются заново после нее: построить индекс и проверить
+        ключ одним проходом быстрее, чем обновлять их на каждую строку. Определения
+        берутся из каталога, поэтому список индексов не дублирует миграции.
+        Триггеры счетчиков тоже отключаются, счетчики пересчитываются в конце.
+        Если процесс прервется до восстановления, определения остаются в выводе.
+        """
+        async with self.db_helper.engine.connect() as conn:
+            connection = (await conn.get_raw_connection()).driver_connection
+            deferred = await self._drop_constraints(connection, tables) if defer_constraints else []
+            triggers = await self._disable_counter_triggers(connection, tables) if defer_constraints else []
+            loader = BulkLoader(connection, batch_size)
+            try:
+                yield loader
+            finally:
+                loader.report()
+                await self._restore_constraints(connection, deferred)
+                await self._rebuild_counters(connection, triggers)
+                for table in tables:
+                    await connection.execute(f"ANALYZE {table}")
+
+    async def _drop_constraints(self, connection, tables: Sequence[str]) -> List[str]:
+        """Снять вторичные индексы и внешние ключи; возвращает DDL для их восстановления"""
+        foreign_keys = await connection.fetch("""
+            SELECT conrelid::regclass::text AS table_name, conname, pg_get_constraintdef(oid) AS definition
+            FROM pg_constraint
+            WHERE contype = 'f' AND conrelid = ANY($1::regclass[])
+        """, list(tables))
+        # Индексы первичных ключей и ограничений уникальности не трогаем
+        indexes = await connection.fetch("""
+            SELECT indexrelid::regclass::text AS index_name, pg_get_indexdef(indexrelid) AS definition
+            FROM pg_index
+            WHERE indrelid = ANY($1::regclass[])
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = pg_index.indexrelid)
+        """, list(tables))
+
+        restore = [row["definition"] for row in indexes] + [
+            f'ALTER TABLE {row["table_name"]} ADD CONSTRAINT {row["conname"]} {row["definition"]}'
+            for row in foreign_keys
+        ]
+        async with connection.transaction():
+            for row in foreign_keys:
+                await connection.execute(f'ALTER TABLE {row["table_name"]} DROP CONSTRAINT {row["conname"]}')
+            for row in indexes:
+                await connection.execute(f'DROP INDEX {row["index_name"]}')
+
+        print(f"Сняты индексы и внешние ключи на время загрузки ({len(restore)}):")
+        for statement in restore:
+            print(f"   {statement};")
+        return restore
+
+    async def _restore_constraints(self, connection, restore: List[str]) -> None:
+        """Пересоздать индексы и внешние ключи после загрузки"""
+        if not restore:
+            return
+        started = time.perf_counter()
+        await connection.execute(f"SET maintenance_work_mem = '{BULK_MAINTENANCE_WORK_MEM}'")
+        for statement in restore:
+            await connection.execute(statement)
+        await connection.execute("RESET maintenance_work_mem")
+        print(f"Индексы и внешние ключи восстановлены за {time.perf_counter() - started:.1f} с")
+
+    async def _disable_counter_triggers(self, connection, tables: Sequence[str]) -> List[Tuple[str, str]]:
+        """Отключить триггеры счетчиков загружаемых таблиц; возвращает (таблица, триггер)"""
+        triggers = [(table, trigger) for table in tables for trigger in COUNTER_TRIGGERS.get(table, ())]
+        async with connection.transaction():
+            for table, trigger in triggers:
+                await connection.execute(f"ALTER TABLE {table} DISABLE TRIGGER {trigger}")
+        if triggers:
+            print(f"Отключены триггеры счетчиков на время загрузки ({len(triggers)}):")
+            for table, trigger in triggers:
+                print(f"   ALTER TABLE {table} ENABLE TRIGGER {trigger};")
+        return triggers
+
+    async def _rebuild_counters(self, connection, triggers: List[Tuple[str, str]]) -> None:
+        """Включить триггеры счетчиков и пересчитать счетчики в одной транзакции с включением"""
+        if not triggers:
+            return
+        started = time.perf_counter()
+        async with connection.transaction():
+            for table, trigger in triggers:
+                await connection.execute(f"ALTER TABLE {table} ENABLE TRIGGER {trigger}")
+            await connection.execute("SELECT building_organization_counts_rebuild()")
+            await connection.execute("SELECT activity_organization_counts_rebuild()")
+        print(f"Счетчики организаций пересчитаны за {time.perf_counter() - started:.1f} с")
+
     async def get_all_activities(self) -> List[Activity]:
         """Получает все виды деятельности из базы данных"""
         async with self.db_helper.session_only() as session:
@@ -102,12 +283,14 @@ class FakeFillerRepository:
             await session.commit()
 
     async def clear_all_tables(self) -> None:
-        """Очищает все таблицы в правильном порядке из-за внешних ключей"""
-        await self.clear_organization_activities()
-        await self.clear_organization_phones()
-        await self.clear_organizations()
-        await self.clear_activities()
-        await self.clear_buildings()
+        """Очищает все таблицы одним TRUNCATE: на миллионах строк DELETE слишком медленный"""
+        async with self.db_helper.session_only() as session:
+            await session.execute(text(
+                "TRUNCATE organization_activities, organization_phones, organizations, "
+                "activity_closure, activities, buildings, building_organization_counts, "
+                "activity_subtree_organizations, activity_organization_counts"
+            ))
+            await session.commit()
 
     async def get_activities_count(self) -> int:
         """Получает количество видов деятельности"""
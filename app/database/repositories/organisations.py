@@ -1,193 +1,650 @@
-from app.database.db_helper import AsyncDatabaseHelper
-from app.database.models import Organization, Building, organization_activities
-from sqlalchemy import select, func, text
-from sqlalchemy.orm import joinedload
+import logging
+import math
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, FrozenSet, List, Optional, Tuple
+
+from app.database.db_helper import REPLICA_CONNECTION_ERRORS, AsyncDatabaseHelper
+from app.database.models import (
+    Organization,
+    Building,
+    organization_activities,
+    activity_closure,
+    activity_organization_counts,
+    building_organization_counts
+)
+from app.database.repositories.statements import StatementCache
+from app.metrics import instrumented_repository
+from sqlalchemy import Float, Integer, String, select, func, tuple_, any_, bindparam, or_, and_
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import joinedload, load_only, raiseload, selectinload
 from uuid import UUID
 
-class OrganizationsRepository:
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6371008.8  # Средний радиус Земли в метрах
+# Запас на расхождение сферы и эллипсоида, по которому считает geography (до ~0.6%)
+SPHEROID_MARGIN = 1.01
+
+
+def degree_bounds(
+    latitude: float,
+    longitude: float,
+    half_width: float,
+    half_height: float,
+    width_latitude: Optional[float] = None
+) -> Tuple[float, float, float, float]:
+    """Границы (min_lon, min_lat, max_lon, max_lat) области 2*half_width x 2*half_height метров вокруг точки.
+
+    Ширина отсчитывается по параллели width_latitude. По умолчанию это самая удаленная
+    от экватора сторона, так что границы для (r, r) гарантированно покрывают круг радиуса r.
+    """
+    delta_latitude = math.degrees(half_height / EARTH_RADIUS)
+    if width_latitude is None:
+        width_latitude = min(abs(latitude) + delta_latitude, 90.0)
+    width_cos = math.cos(math.radians(width_latitude))
+    delta_longitude = math.degrees(half_width / (EARTH_RADIUS * width_cos)) if width_cos > 1e-9 else 180.0
+    if delta_longitude >= 180.0:
+        # Область захватывает полюс или шире полушария: все долготы
+        return (-180.0, max(latitude - delta_latitude, -90.0), 180.0, min(latitude + delta_latitude, 90.0))
+    
+    return (
+        max(longitude - delta_longitude, -180.0),
+        max(latitude - delta_latitude, -90.0),
+        min(longitude + delta_longitude, 180.0),
+        min(latitude + delta_latitude, 90.0)
+    )
+
+
+def bounding_box(*args, **kwargs):
+    """Прямоугольник degree_bounds в SRID 4326 для запроса"""
+    return func.ST_MakeEnvelope(*degree_bounds(*args, **kwargs), 4326)
+
+
+# Параметры прямоугольника ST_MakeEnvelope в порядке degree_bounds
+ENVELOPE_PARAMETERS = ("min_longitude", "min_latitude", "max_longitude", "max_latitude")
+
+# SQLSTATE query_canceled: сработал statement_timeout
+QUERY_CANCELED = "57014"
+
+
+class SearchTimeoutError(Exception):
+    """Поиск не уложился в бюджет времени"""
+
+
+def escape_like(value: str) -> str:
+    """Экранирование спецсимволов LIKE, экранирующий символ - обратная косая черта"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@dataclass
+class Page:
+    """Страница результатов keyset-пагинации"""
+    items: List[Any]
+    # Ключ сортировки последней записи, None если страница последняя
+    next_key: Optional[Tuple] = None
+
+
+# Поля организации, которые можно запросить: колонки и связи, в порядке схемы ответа
+ORGANIZATION_COLUMNS = ("id", "name", "building_id")
+ORGANIZATION_RELATIONS = ("building", "phones", "activities")
+
+
+@dataclass(frozen=True)
+class Projection:
+    """Запрошенные колонки и связи организации; по умолчанию все. id загружается всегда"""
+    columns: FrozenSet[str] = frozenset(ORGANIZATION_COLUMNS)
+    relations: FrozenSet[str] = frozenset(ORGANIZATION_RELATIONS)
+
+    def fields(self) -> List[str]:
+        """Поля документа организации в порядке схемы"""
+        return [field for field in (*ORGANIZATION_COLUMNS, *ORGANIZATION_RELATIONS) if field in self.columns or field in self.relations]
+
+
+FULL_PROJECTION = Projection()
+
+
+@instrumented_repository
+class OrganizationsRepository(StatementCache):
+    """Чтение организаций.
+
+    Запросы горячих методов строятся один раз на экземпляр (StatementCache)
+    и выполняются с параметрами.
+    """
+
     def __init__(self, db_helper: AsyncDatabaseHelper):
         self.db_helper = db_helper
 
-    async def organizations_by_building(self, building_id: UUID):
+    async def warm_up(self) -> None:
+        """Скомпилировать запросы горячих методов (со всеми полями) на каждой базе чтения до первых запросов.
+
+        Запросы выполняются с LIMIT 0 и несуществующими ключами; недоступная
+        реплика пропускается.
+        """
+        for name, session_factory in self.db_helper.read_session_factories():
+            try:
+                async with session_factory() as session:
+                    for key, parameters in self._warm_up_statements():
+                        await session.execute(self._statement(*key), parameters)
+            except REPLICA_CONNECTION_ERRORS as e:
+                logger.warning("Statement warm-up skipped on %s: %s", name, e)
+
+    async def organizations_by_building(
+        self,
+        building_id: UUID,
+        limit: int,
+        after_id: Optional[UUID] = None,
+        projection: Projection = FULL_PROJECTION
+    ) -> Page:
         """Получить организации по зданию"""
-        async with self.db_helper.session_only() as session:
-            query = (
-                select(Organization)
-                .options(
-                    joinedload(Organization.building),
-                    joinedload(Organization.phones),
-                    joinedload(Organization.activities)
-                )
-                .where(Organization.building_id == building_id)
-            )
-            result = await session.execute(query)
-            return result.scalars().unique().all()
+        async with self.db_helper.read_session() as session:
+            statement = self._statement("by_building", projection, after_id is not None)
+            parameters = {"building_id": building_id, **self._id_page(limit, after_id)}
+            return await self._fetch_page(session, statement, parameters, limit)
         
-    async def organizations_by_activity(self, activity_id: UUID):
+    async def organizations_by_activity(
+        self,
+        activity_id: UUID,
+        limit: int,
+        after_id: Optional[UUID] = None,
+        projection: Projection = FULL_PROJECTION
+    ) -> Page:
         """Получить организации по определенной активности"""
-        async with self.db_helper.session_only() as session:
-            query = (
-                select(Organization)
-                .join(organization_activities)
-                .options(
-                    joinedload(Organization.building),
-                    joinedload(Organization.phones),
-                    joinedload(Organization.activities)
-                )
-                .where(organization_activities.c.activity_id == activity_id)
-            )
-            result = await session.execute(query)
-            return result.scalars().unique().all()
+        async with self.db_helper.read_session() as session:
+            statement = self._statement("by_activity", projection, after_id is not None)
+            parameters = {"activity_id": activity_id, **self._id_page(limit, after_id)}
+            return await self._fetch_page(session, statement, parameters, limit)
         
-    async def organizations_in_circle(self, latitude: float, longitude: float, radius: float):
-        """Получить организации в радиусе от указанной точки"""
-        async with self.db_helper.session_only() as session:
-            center_point = func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326)
-            
-            # Загружаем все связанные данные в одном запросе
-            query = (
-                select(Organization)
-                .join(Building, Organization.building_id == Building.id)
-                .options(
-                    joinedload(Organization.building),
-                    joinedload(Organization.phones),
-                    joinedload(Organization.activities)
-                )
-                .where(
-                    func.ST_DWithin(
-                        func.ST_Transform(Building.location, 3857), 
-                        func.ST_Transform(center_point, 3857),       
-                        radius
-                    )
-                )
-            )
-            
-            result = await session.execute(query)
-            return result.scalars().unique().all()
+    async def organizations_in_circle(
+        self,
+        latitude: float,
+        longitude: float,
+        radius: float,
+        limit: int,
+        after: Optional[Tuple[float, UUID]] = None,
+        building_ids: Optional[List[UUID]] = None,
+        projection: Projection = FULL_PROJECTION
+    ) -> Page:
+        """Получить организации в радиусе от указанной точки, ближайшие первыми.
+
+        building_ids - кандидаты, уже найденные in-memory индексом: вместо
+        индексного поиска по buildings проверяются только они.
+        """
+        if building_ids is not None and not building_ids:
+            return Page(items=[])
+
+        async with self.db_helper.read_session() as session:
+            statement = self._statement("in_circle", projection, after is not None, building_ids is not None)
+            parameters = {
+                "latitude": latitude,
+                "longitude": longitude,
+                "radius": radius,
+                **self._distance_page(limit, after)
+            }
+            if building_ids is None:
+                envelope_radius = radius * SPHEROID_MARGIN
+                parameters.update(self._envelope(latitude, longitude, envelope_radius, envelope_radius))
+            else:
+                parameters["building_ids"] = building_ids
+            return await self._fetch_page(session, statement, parameters, limit)
         
-    async def organizations_in_rectangle(self, center_latitude: float, center_longitude: float, width: float, height: float):
-        """Получить организации в прямоугольной области от указанной точки"""
-        async with self.db_helper.session_only() as session:
-            # Создаем центр в Web Mercator проекции
-            center_point = func.ST_Transform(
-                func.ST_SetSRID(func.ST_MakePoint(center_longitude, center_latitude), 4326),
-                3857
-            )
-            
-            # Создаем прямоугольник в Web Mercator (единицы - метры)
-            half_width = width / 2
-            half_height = height / 2
-            
-            rectangle = func.ST_MakeEnvelope(
-                func.ST_X(center_point) - half_width,
-                func.ST_Y(center_point) - half_height,
-                func.ST_X(center_point) + half_width,
-                func.ST_Y(center_point) + half_height,
-                3857
-            )
-            
-            # Загружаем все связанные данные в одном запросе
-            query = (
-                select(Organization)
-                .join(Building, Organization.building_id == Building.id)
-                .options(
-                    joinedload(Organization.building),
-                    joinedload(Organization.phones),
-                    joinedload(Organization.activities)
-                )
-                .where(
-                    func.ST_Within(
-                        func.ST_Transform(Building.location, 3857),
-                        rectangle
-                    )
-                )
-            )
-            
-            result = await session.execute(query)
-            return result.scalars().unique().all()
+    async def organizations_in_rectangle(
+        self,
+        center_latitude: float,
+        center_longitude: float,
+        width: float,
+        height: float,
+        limit: int,
+        after: Optional[Tuple[float, UUID]] = None,
+        building_ids: Optional[List[UUID]] = None,
+        projection: Projection = FULL_PROJECTION
+    ) -> Page:
+        """Получить организации в прямоугольной области от указанной точки, ближайшие к центру первыми"""
+        if building_ids is not None and not building_ids:
+            return Page(items=[])
+
+        async with self.db_helper.read_session() as session:
+            statement = self._statement("in_rectangle", projection, after is not None, building_ids is not None)
+            # Прямоугольник переводится из метров в градусы на широте центра,
+            # поэтому колонка не оборачивается в ST_Transform и индекс используется
+            parameters = {
+                "latitude": center_latitude,
+                "longitude": center_longitude,
+                **self._envelope(center_latitude, center_longitude, width / 2, height / 2, width_latitude=center_latitude),
+                **self._distance_page(limit, after)
+            }
+            if building_ids is not None:
+                parameters["building_ids"] = building_ids
+            return await self._fetch_page(session, statement, parameters, limit)
         
-    async def organization_by_id(self, organization_id: UUID):
+    async def organization_by_id(self, organization_id: UUID, projection: Projection = FULL_PROJECTION):
         """Получить организацию по ID"""
-        async with self.db_helper.session_only() as session:
-            query = (
-                select(Organization)
-                .options(
-                    joinedload(Organization.building),
-                    joinedload(Organization.phones),
-                    joinedload(Organization.activities)
-                )
-                .where(Organization.id == organization_id)
-            )
-            result = await session.execute(query)
-            organizations = result.scalars().unique().all()
-            return organizations[0] if organizations else None
+        async with self.db_helper.read_session() as session:
+            return await self._fetch_one(session, self._statement("by_id", projection), {"organization_id": organization_id})
 
+
+    async def organizations_by_ids(self, organization_ids: List[UUID], projection: Projection = FULL_PROJECTION) -> List[Any]:
+        """Получить организации по списку ID одним запросом (порядок не гарантируется)"""
+        async with self.db_helper.read_session() as session:
+            result = await session.execute(self._statement("by_ids", projection), {"organization_ids": organization_ids})
+            return [row[0] for row in self._fetch_rows(result)]
         
-    async def organizations_by_activity_type(self, activity_id: UUID):
+    async def organizations_by_activity_type(
+        self,
+        activity_id: UUID,
+        limit: int,
+        after_id: Optional[UUID] = None,
+        projection: Projection = FULL_PROJECTION
+    ) -> Page:
         """Получить организации по типу деятельности с поиском по дереву деятельностей"""
-        async with self.db_helper.session_only() as session:
-            # Используем рекурсивный CTE для поиска всех дочерних деятельностей
-            cte_query = text("""
-                WITH RECURSIVE activity_tree AS (
-                    -- Базовый случай: начальная деятельность
-                    SELECT id, name, parent_id, level
-                    FROM activities 
-                    WHERE id = :activity_id
-                    
-                    UNION ALL
-                    
-                    -- Рекурсивный случай: все дочерние деятельности
-                    SELECT a.id, a.name, a.parent_id, a.level
-                    FROM activities a
-                    INNER JOIN activity_tree at ON a.parent_id = at.id
-                )
-                SELECT DISTINCT o.id
-                FROM organizations o
-                INNER JOIN organization_activities oa ON o.id = oa.organization_id
-                INNER JOIN activity_tree at ON oa.activity_id = at.id
-            """)
+        async with self.db_helper.read_session() as session:
+            statement = self._statement("by_activity_type", projection, after_id is not None)
+            parameters = {"activity_id": activity_id, **self._id_page(limit, after_id)}
+            return await self._fetch_page(session, statement, parameters, limit)
             
-            result = await session.execute(cte_query, {"activity_id": activity_id})
-            organization_ids = [row.id for row in result.fetchall()]
-            
-            if not organization_ids:
-                return []
-            
-            # Теперь загружаем полные объекты с связанными данными
-            query = (
-                select(Organization)
-                .options(
-                    joinedload(Organization.building),
-                    joinedload(Organization.phones),
-                    joinedload(Organization.activities)
-                )
-                .where(Organization.id.in_(organization_ids))
+    async def organizations_by_activities(
+        self,
+        activity_ids: List[UUID],
+        limit: int,
+        after_id: Optional[UUID] = None,
+        projection: Projection = FULL_PROJECTION
+    ) -> Page:
+        """Получить организации, связанные с любой из деятельностей (поддерево уже известно вызывающему)"""
+        async with self.db_helper.read_session() as session:
+            statement = self._statement("by_activities", projection, after_id is not None)
+            parameters = {"activity_ids": activity_ids, **self._id_page(limit, after_id)}
+            return await self._fetch_page(session, statement, parameters, limit)
+
+    async def search_organizations(
+        self,
+        search_query: str,
+        limit: int,
+        after: Optional[Tuple[float, UUID]] = None,
+        similarity_threshold: float = 0.3,
+        timeout_ms: int = 1000,
+        projection: Projection = FULL_PROJECTION
+    ) -> Page:
+        """Поиск организаций по префиксу или триграммной схожести названия, самые похожие первыми.
+
+        Оба условия обслуживаются GIN-индексом idx_organizations_name_trgm. Запрос
+        ограничен statement_timeout; при превышении бросается SearchTimeoutError.
+        """
+        async with self.db_helper.read_session() as session:
+            # Параметры действуют только до конца транзакции сессии
+            await session.execute(self._statement("search_settings"), {
+                "similarity_threshold": str(similarity_threshold),
+                "statement_timeout": str(timeout_ms)
+            })
+
+            statement = self._statement("search", projection, after is not None)
+            parameters = {
+                "search_query": search_query,
+                "name_prefix": escape_like(search_query) + "%",
+                "limit": limit + 1
+            }
+            if after:
+                parameters["after_similarity"], parameters["after_id"] = after
+
+            try:
+                return await self._fetch_page(session, statement, parameters, limit)
+            except DBAPIError as e:
+                if getattr(e.orig, "pgcode", None) == QUERY_CANCELED:
+                    raise SearchTimeoutError(f"Search exceeded {timeout_ms} ms") from e
+                raise
+
+    async def stream_organizations(
+        self,
+        chunk_size: int,
+        building_id: Optional[UUID] = None,
+        activity_id: Optional[UUID] = None,
+        circle: Optional[Tuple[float, float, float]] = None,
+        projection: Projection = FULL_PROJECTION
+    ) -> AsyncIterator[List[Any]]:
+        """Выгрузка организаций по id частями не больше chunk_size через серверный курсор.
+
+        Фильтры необязательны и объединяются по И: здание, поддерево деятельности,
+        круг (широта, долгота, радиус в метрах). Следующая часть читается из курсора
+        только когда вызывающий запросил ее, так что в памяти не больше одной части.
+        """
+        query = self._select_export_organizations(projection)
+        if building_id:
+            query = query.where(Organization.building_id == building_id)
+        if activity_id:
+            subtree = (
+                select(activity_closure.c.descendant_id)
+                .where(activity_closure.c.ancestor_id == activity_id)
             )
-            
-            result = await session.execute(query)
-            return result.scalars().unique().all()
-            
-    async def organization_by_name(self, name: str):
-        """Получить организацию по имени"""
-        async with self.db_helper.session_only() as session:
+            query = query.where(Organization.id.in_(
+                select(organization_activities.c.organization_id)
+                .where(organization_activities.c.activity_id.in_(subtree))
+            ))
+        if circle:
+            latitude, longitude, radius = circle
+            center_point = func.geography(func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326))
+            envelope_radius = radius * SPHEROID_MARGIN
             query = (
-                select(Organization)
-                .options(
-                    joinedload(Organization.building),
-                    joinedload(Organization.phones),
-                    joinedload(Organization.activities)
+                query.join(Building, Organization.building_id == Building.id)
+                .where(
+                    Building.location.op("&&")(bounding_box(latitude, longitude, envelope_radius, envelope_radius)),
+                    func.ST_DWithin(func.geography(Building.location), center_point, radius)
                 )
-                .where(Organization.name == name)
             )
-            result = await session.execute(query)
-            organizations = result.scalars().unique().all()
-            return organizations[0] if organizations else None
+        query = query.order_by(Organization.id).execution_options(yield_per=chunk_size)
+
+        async with self.db_helper.read_session() as session:
+            result = await session.stream(query)
+            try:
+                async for partition in result.partitions():
+                    yield [row[0] for row in partition]
+            finally:
+                await result.close()
+
+    async def organization_by_name(self, name: str, projection: Projection = FULL_PROJECTION):
+        """Получить организацию по имени"""
+        async with self.db_helper.read_session() as session:
+            return await self._fetch_one(session, self._statement("by_name", projection), {"name": name})
+
+    async def organizations_count_by_activity_type(self, activity_id: UUID) -> int:
+        """Число организаций в поддереве деятельности из счетчика, без чтения организаций"""
+        async with self.db_helper.read_session() as session:
+            result = await session.execute(self._statement("count_by_activity_type"), {"activity_id": activity_id})
+            return result.scalar() or 0
+
+    async def organizations_count_by_building(self, building_id: UUID) -> int:
+        """Число организаций в здании из счетчика"""
+        async with self.db_helper.read_session() as session:
+            result = await session.execute(self._statement("count_by_building"), {"building_id": building_id})
+            return result.scalar() or 0
+
+    async def organizations_count_in_circle(
+        self,
+        latitude: float,
+        longitude: float,
+        radius: float,
+        building_ids: Optional[List[UUID]] = None
+    ) -> int:
+        """Число организаций в радиусе: сумма счетчиков зданий в круге"""
+        if building_ids is not None and not building_ids:
+            return 0
+
+        async with self.db_helper.read_session() as session:
+            parameters = {"latitude": latitude, "longitude": longitude, "radius": radius}
+            if building_ids is None:
+                envelope_radius = radius * SPHEROID_MARGIN
+                parameters.update(self._envelope(latitude, longitude, envelope_radius, envelope_radius))
+            else:
+                parameters["building_ids"] = building_ids
+            result = await session.execute(self._statement("count_in_circle", building_ids is not None), parameters)
+            return result.scalar()
+
+    async def organizations_count_in_rectangle(
+        self,
+        center_latitude: float,
+        center_longitude: float,
+        width: float,
+        height: float,
+        building_ids: Optional[List[UUID]] = None
+    ) -> int:
+        """Число организаций в прямоугольной области: сумма счетчиков зданий в ней"""
+        if building_ids is not None and not building_ids:
+            return 0
+
+        async with self.db_helper.read_session() as session:
+            parameters = self._envelope(center_latitude, center_longitude, width / 2, height / 2, width_latitude=center_latitude)
+            if building_ids is not None:
+                parameters["building_ids"] = building_ids
+            result = await session.execute(self._statement("count_in_rectangle", building_ids is not None), parameters)
+            return result.scalar()
 
     # Приватные методы     
-    def _build_organizations_with_building_query(self):
-        """Создать базовый запрос для организаций с загрузкой зданий"""
-        return (
-            select(Organization)
+    def _build_by_building(self, projection: Projection, paged: bool):
+        query = (
+            self._select_organizations(projection, Organization.id)
+            .where(Organization.building_id == bindparam("building_id"))
+        )
+        return self._paginate_by_id(query, paged)
+
+    def _build_by_activity(self, projection: Projection, paged: bool):
+        query = (
+            self._select_organizations(projection, Organization.id)
+            .join(organization_activities)
+            .where(organization_activities.c.activity_id == bindparam("activity_id"))
+        )
+        return self._paginate_by_id(query, paged)
+
+    def _build_by_activity_type(self, projection: Projection, paged: bool):
+        # Поддерево берется из таблицы замыкания одним индексным соединением
+        subtree = (
+            select(activity_closure.c.descendant_id)
+            .where(activity_closure.c.ancestor_id == bindparam("activity_id"))
+        )
+        matching_organizations = (
+            select(organization_activities.c.organization_id)
+            .where(organization_activities.c.activity_id.in_(subtree))
+        )
+        query = (
+            self._select_organizations(projection, Organization.id)
+            .where(Organization.id.in_(matching_organizations))
+        )
+        return self._paginate_by_id(query, paged)
+
+    def _build_by_activities(self, projection: Projection, paged: bool):
+        matching_organizations = (
+            select(organization_activities.c.organization_id)
+            .where(organization_activities.c.activity_id == any_(
+                bindparam("activity_ids", type_=ARRAY(organization_activities.c.activity_id.type))
+            ))
+        )
+        query = (
+            self._select_organizations(projection, Organization.id)
+            .where(Organization.id.in_(matching_organizations))
+        )
+        return self._paginate_by_id(query, paged)
+
+    def _build_in_circle(self, projection: Projection, paged: bool, with_candidates: bool):
+        center_point = self._center_point()
+        location = func.geography(Building.location)
+        distance = func.ST_Distance(location, center_point)
+
+        # Грубый фильтр && по индексу idx_buildings_location, точный - ST_DWithin
+        # по geography (индекс idx_buildings_location_geography), радиус в метрах
+        if with_candidates:
+            candidates = self._building_in()
+        else:
+            candidates = Building.location.op("&&")(self._envelope_clause())
+        query = (
+            self._select_organizations(projection, distance, Organization.id)
+            .join(Building, Organization.building_id == Building.id)
+            .where(candidates, func.ST_DWithin(location, center_point, bindparam("radius", type_=Float)))
+        )
+        return self._paginate_by_distance(query, distance, paged)
+
+    def _build_in_rectangle(self, projection: Projection, paged: bool, with_candidates: bool):
+        distance = func.ST_Distance(func.geography(Building.location), self._center_point())
+        query = (
+            self._select_organizations(projection, distance, Organization.id)
             .join(Building, Organization.building_id == Building.id)
-            .options(joinedload(Organization.building))
+            .where(func.ST_Intersects(Building.location, self._envelope_clause()))
+        )
+        if with_candidates:
+            query = query.where(self._building_in())
+        return self._paginate_by_distance(query, distance, paged)
+
+    def _build_by_id(self, projection: Projection):
+        return self._select_organizations(projection).where(Organization.id == bindparam("organization_id"))
+
+    def _build_by_ids(self, projection: Projection):
+        return self._select_organizations(projection).where(Organization.id == any_(
+            bindparam("organization_ids", type_=ARRAY(Organization.id.type))
+        ))
+
+    def _build_by_name(self, projection: Projection):
+        return self._select_organizations(projection).where(Organization.name == bindparam("name"))
+
+    def _build_search_settings(self):
+        return select(
+            func.set_config("pg_trgm.similarity_threshold", bindparam("similarity_threshold", type_=String), True),
+            func.set_config("statement_timeout", bindparam("statement_timeout", type_=String), True)
+        )
+
+    def _build_search(self, projection: Projection, paged: bool):
+        search_query = bindparam("search_query", type_=String)
+        similarity = func.similarity(Organization.name, search_query)
+        query = (
+            self._select_organizations(projection, similarity, Organization.id)
+            .where(or_(
+                Organization.name.ilike(bindparam("name_prefix", type_=String), escape="\\"),
+                Organization.name.op("%")(search_query)
+            ))
         )
+        if paged:
+            after_similarity = bindparam("after_similarity", type_=Float)
+            query = query.where(or_(
+                similarity < after_similarity,
+                and_(similarity == after_similarity, Organization.id > bindparam("after_id"))
+            ))
+        return query.order_by(similarity.desc(), Organization.id).limit(bindparam("limit", type_=Integer))
+
+    def _build_count_by_activity_type(self):
+        counts = activity_organization_counts
+        return select(counts.c.organizations).where(counts.c.activity_id == bindparam("activity_id"))
+
+    def _build_count_by_building(self):
+        counts = building_organization_counts
+        return select(counts.c.organizations).where(counts.c.building_id == bindparam("building_id"))
+
+    def _build_count_in_circle(self, with_candidates: bool):
+        # Те же фильтры зданий, что в _build_in_circle, но строки организаций не читаются:
+        # к каждому зданию в круге присоединяется его счетчик по первичному ключу
+        location = func.geography(Building.location)
+        if with_candidates:
+            candidates = self._building_in()
+        else:
+            candidates = Building.location.op("&&")(self._envelope_clause())
+        return self._select_building_counts().where(
+            candidates,
+            func.ST_DWithin(location, self._center_point(), bindparam("radius", type_=Float))
+        )
+
+    def _build_count_in_rectangle(self, with_candidates: bool):
+        query = self._select_building_counts().where(func.ST_Intersects(Building.location, self._envelope_clause()))
+        if with_candidates:
+            query = query.where(self._building_in())
+        return query
+
+    def _warm_up_statements(self):
+        """Ключи запросов горячих методов и параметры, с которыми запросы ничего не возвращают"""
+        missing = UUID(int=0)
+        point = {"latitude": 0.0, "longitude": 0.0, "radius": 1.0, **self._envelope(0.0, 0.0, 1.0, 1.0)}
+        yield ("by_id", FULL_PROJECTION), {"organization_id": missing}
+        yield ("by_ids", FULL_PROJECTION), {"organization_ids": [missing]}
+        yield ("by_name", FULL_PROJECTION), {"name": ""}
+        yield ("search_settings",), {"similarity_threshold": "0.3", "statement_timeout": "1000"}
+        yield ("count_by_activity_type",), {"activity_id": missing}
+        yield ("count_by_building",), {"building_id": missing}
+        for with_candidates in (False, True):
+            yield ("count_in_circle", with_candidates), {**point, "building_ids": [missing]}
+            yield ("count_in_rectangle", with_candidates), {**point, "building_ids": [missing]}
+        for paged in (False, True):
+            id_page = {"limit": 0, "after_id": missing}
+            yield ("by_building", FULL_PROJECTION, paged), {"building_id": missing, **id_page}
+            yield ("by_activity", FULL_PROJECTION, paged), {"activity_id": missing, **id_page}
+            yield ("by_activity_type", FULL_PROJECTION, paged), {"activity_id": missing, **id_page}
+            yield ("by_activities", FULL_PROJECTION, paged), {"activity_ids": [missing], **id_page}
+            yield ("search", FULL_PROJECTION, paged), {"search_query": "", "name_prefix": "", "after_similarity": 0.0, **id_page}
+            for with_candidates in (False, True):
+                parameters = {**point, **id_page, "after_distance": 0.0, "building_ids": [missing]}
+                yield ("in_circle", FULL_PROJECTION, paged, with_candidates), parameters
+                yield ("in_rectangle", FULL_PROJECTION, paged, with_candidates), parameters
+
+    def _select_organizations(self, projection: Projection, *key_columns):
+        """Базовый запрос организаций с запрошенными колонками и связями и колонками ключа сортировки"""
+        return select(Organization, *key_columns).options(*self._load_options(projection, joinedload))
+
+    def _select_export_organizations(self, projection: Projection):
+        """Запрос выгрузки: коллекции через selectinload, так как joinedload коллекций
+        несовместим с yield_per (дедупликация потребовала бы весь результат)"""
+        return select(Organization).options(*self._load_options(projection, selectinload))
+
+    def _load_options(self, projection: Projection, collection_loader) -> list:
+        """Загружаются только запрошенные колонки и связи; остальные связи не присоединяются
+        и закрыты raiseload, чтобы случайное обращение к ним не ушло в базу"""
+        options = [load_only(*(getattr(Organization, column) for column in ORGANIZATION_COLUMNS if column in projection.columns))]
+        if "building" in projection.relations:
+            options.append(joinedload(Organization.building).defer(Building.location))
+        else:
+            options.append(raiseload(Organization.building))
+        for relation in (Organization.phones, Organization.activities):
+            options.append(collection_loader(relation) if relation.key in projection.relations else raiseload(relation))
+        return options
+
+    def _select_building_counts(self):
+        """Сумма счетчиков организаций по зданиям запроса; 0, если зданий нет"""
+        counts = building_organization_counts
+        return (
+            select(func.coalesce(func.sum(counts.c.organizations), 0))
+            .select_from(Building)
+            .join(counts, counts.c.building_id == Building.id)
+        )
+
+    def _center_point(self):
+        """Центр поиска из параметров latitude/longitude как geography"""
+        return func.geography(func.ST_SetSRID(func.ST_MakePoint(
+            bindparam("longitude", type_=Float), bindparam("latitude", type_=Float)
+        ), 4326))
+
+    def _envelope_clause(self):
+        """Прямоугольник в SRID 4326 из параметров _envelope"""
+        return func.ST_MakeEnvelope(*(bindparam(name, type_=Float) for name in ENVELOPE_PARAMETERS), 4326)
+
+    def _envelope(self, *args, **kwargs) -> dict:
+        """Параметры _envelope_clause для прямоугольника degree_bounds"""
+        return dict(zip(ENVELOPE_PARAMETERS, degree_bounds(*args, **kwargs)))
+
+    def _building_in(self):
+        """Фильтр по списку зданий одним параметром-массивом (без ограничения на число параметров)"""
+        return Building.id == any_(bindparam("building_ids", type_=ARRAY(Building.id.type)))
+
+    def _id_page(self, limit: int, after_id: Optional[UUID]) -> dict:
+        """Параметры keyset-пагинации по id: на одну запись больше, чтобы узнать о следующей странице"""
+        parameters = {"limit": limit + 1}
+        if after_id:
+            parameters["after_id"] = after_id
+        return parameters
+
+    def _distance_page(self, limit: int, after: Optional[Tuple[float, UUID]]) -> dict:
+        """Параметры keyset-пагинации по (расстояние, id)"""
+        parameters = {"limit": limit + 1}
+        if after:
+            parameters["after_distance"], parameters["after_id"] = after
+        return parameters
+
+    def _paginate_by_id(self, query, paged: bool):
+        """Keyset-пагинация по id; paged - запрос следующей страницы после after_id"""
+        if paged:
+            query = query.where(Organization.id > bindparam("after_id"))
+        return query.order_by(Organization.id).limit(bindparam("limit", type_=Integer))
+
+    def _paginate_by_distance(self, query, distance, paged: bool):
+        """Keyset-пагинация по (расстояние, id)"""
+        if paged:
+            after_key = tuple_(bindparam("after_distance", type_=Float), bindparam("after_id", type_=Organization.id.type))
+            query = query.where(tuple_(distance, Organization.id) > after_key)
+        return query.order_by(distance, Organization.id).limit(bindparam("limit", type_=Integer))
+
+    def _fetch_rows(self, result):
+        """Строки результата; joinedload коллекций размножает строки, поэтому дедуплицируем"""
+        return result.unique().all()
+
+    async def _fetch_page(self, session, statement, parameters: dict, limit: int) -> Page:
+        """Выполнить запрос страницы; строки имеют вид (организация, *ключ сортировки)"""
+        rows = self._fetch_rows(await session.execute(statement, parameters))
+        
+        next_key = tuple(rows[limit - 1][1:]) if len(rows) > limit else None
+        return Page(items=[row[0] for row in rows[:limit]], next_key=next_key)
+
+    async def _fetch_one(self, session, statement, parameters: dict):
+        """Выполнить запрос одной организации"""
+        rows = self._fetch_rows(await session.execute(statement, parameters))
+        return rows[0][0] if rows else None
@@ -0,0 +1,87 @@
+from sqlalchemy import select, func, case, literal_column
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import aliased
+
+from app.database.models import Organization, Building, Activity, OrganizationPhone, organization_activities
+from app.database.repositories.organisations import OrganizationsRepository, Projection
+
+
+def _json_object(**fields):
+    """jsonb_build_object с ключами-литералами (asyncpg не выводит тип параметров у VARIADIC "any")"""
+    arguments = []
+    for key, value in fields.items():
+        arguments.extend([literal_column(f"'{key}'"), value])
+    return func.jsonb_build_object(*arguments, type_=JSONB)
+
+
+class OrganizationsJsonRepository(OrganizationsRepository):
+    """Репозиторий, собирающий документ организации на стороне Postgres.
+
+    Вместо joinedload телефонов и деятельностей (декартово произведение строк
+    с дедупликацией в Python) каждая организация возвращается одной строкой
+    jsonb, которую сервис отдает без гидрации ORM-объектов.
+    """
+
+    def _select_organizations(self, projection: Projection, *key_columns):
+        """Документ организации вместо ORM-сущности, те же колонки ключа сортировки"""
+        return select(self._organization_document(projection), *key_columns).select_from(Organization)
+
+    def _select_export_organizations(self, projection: Projection):
+        """Документы собираются в Postgres, строки не размножаются"""
+        return self._select_organizations(projection)
+
+    def _fetch_rows(self, result):
+        """Одна строка на организацию, дедупликация не нужна"""
+        return result.all()
+
+    def _organization_document(self, projection: Projection):
+        """Документ с запрошенными полями. Связи - коррелированные подзапросы, в запрос
+        попадают только запрошенные; алиасы нужны, чтобы подзапросы не коррелировали
+        с таблицами, уже присоединенными во внешнем запросе"""
+        building = aliased(Building)
+        phone = aliased(OrganizationPhone)
+        activity = aliased(Activity)
+        links = organization_activities.alias()
+
+        location = case(
+            (building.location.is_(None), None),
+            else_=_json_object(latitude=func.ST_Y(building.location), longitude=func.ST_X(building.location))
+        )
+        building_document = (
+            select(_json_object(id=building.id, address=building.address, location=location))
+            .where(building.id == Organization.building_id)
+            .scalar_subquery()
+        )
+        phones_document = (
+            select(func.coalesce(
+                func.jsonb_agg(_json_object(id=phone.id, phone=phone.phone)),
+                literal_column("'[]'::jsonb")
+            ))
+            .where(phone.organization_id == Organization.id)
+            .scalar_subquery()
+        )
+        activities_document = (
+            select(func.coalesce(
+                func.jsonb_agg(_json_object(
+                    id=activity.id,
+                    name=activity.name,
+                    parent_id=activity.parent_id,
+                    level=activity.level
+                )),
+                literal_column("'[]'::jsonb")
+            ))
+            .select_from(links)
+            .join(activity, activity.id == links.c.activity_id)
+            .where(links.c.organization_id == Organization.id)
+            .scalar_subquery()
+        )
+
+        fields = {
+            "id": Organization.id,
+            "name": Organization.name,
+            "building_id": Organization.building_id,
+            "building": building_document,
+            "phones": phones_document,
+            "activities": activities_document,
+        }
+        return _json_object(**{field: fields[field] for field in projection.fields()})
@@ -0,0 +1,22 @@
+from typing import Any, Dict
+
+
+class StatementCache:
+    """Примесь репозитория: запросы, построенные один раз на экземпляр.
+
+    _statement(name, *variant) строит запрос методом _build_<name>(*variant) при
+    первом обращении и дальше отдает тот же объект: готовый объект запроса хранит
+    свой ключ кэша, поэтому SQL берется из кэша компиляции движка без построения
+    конструкции и обхода ее дерева на каждый вызов.
+    """
+
+    _statements: Dict[tuple, Any]
+
+    def _statement(self, name: str, *variant):
+        """Запрос _build_<name>(*variant), построенный при первом обращении и переиспользуемый"""
+        statements = self.__dict__.setdefault("_statements", {})
+        key = (name, *variant)
+        statement = statements.get(key)
+        if statement is None:
+            statement = statements[key] = getattr(self, f"_build_{name}")(*variant)
+        return statement
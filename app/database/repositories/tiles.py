@@ -0,0 +1,167 @@
+import math
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Float, String, any_, bindparam, cast, func, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from uuid import UUID
+
+from app.database.db_helper import AsyncDatabaseHelper
+from app.database.models import (
+    Building,
+    Organization,
+    activity_closure,
+    building_organization_counts,
+    organization_activities
+)
+from app.database.repositories.organisations import ENVELOPE_PARAMETERS
+from app.database.repositories.statements import StatementCache
+from app.metrics import instrumented_repository
+
+# Полуширина мира в Web Mercator (EPSG:3857), метров
+MERCATOR_HALF_WORLD = math.pi * 6378137.0
+
+# Размер тайла в единицах MVT и запас вокруг него, чтобы значки на краях не обрезались
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+
+# Параметры границ тайла в метрах Web Mercator
+TILE_PARAMETERS = ("tile_min_x", "tile_min_y", "tile_max_x", "tile_max_y")
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Границы (min_x, min_y, max_x, max_y) тайла z/x/y в метрах Web Mercator, y считается сверху"""
+    size = 2 * MERCATOR_HALF_WORLD / (1 << z)
+    min_x = -MERCATOR_HALF_WORLD + x * size
+    max_y = MERCATOR_HALF_WORLD - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+
+def mercator_to_degrees(x: float, y: float) -> Tuple[float, float]:
+    """(долгота, широта) точки Web Mercator"""
+    return (
+        math.degrees(x / 6378137.0),
+        math.degrees(math.atan(math.sinh(y / 6378137.0)))
+    )
+
+
+@instrumented_repository
+class TilesRepository(StatementCache):
+    """Векторные тайлы зданий (Mapbox Vector Tile) через ST_AsMVT.
+
+    На крупных масштабах тайл содержит слой buildings со зданиями и числом
+    организаций в них, на мелких - слой clusters: здания тайла сгруппированы
+    по сетке grid x grid ячеек, у кластера число зданий и организаций.
+    Здания отбираются индексом idx_buildings_location по прямоугольнику тайла
+    в градусах, число организаций без фильтра берется из счетчиков зданий.
+    """
+
+    def __init__(self, db_helper: AsyncDatabaseHelper):
+        self.db_helper = db_helper
+
+    async def tile(
+        self,
+        z: int,
+        x: int,
+        y: int,
+        clustered: bool,
+        grid: int,
+        activity_ids: Optional[List[UUID]] = None
+    ) -> bytes:
+        """Тайл z/x/y; activity_ids - только организации с деятельностью из их поддеревьев"""
+        bounds = tile_bounds(z, x, y)
+        # Кластеры строятся только из зданий внутри тайла, чтобы соседние тайлы
+        # не считали одно здание дважды; отдельные здания берутся и из запаса
+        margin = 0.0 if clustered else (bounds[2] - bounds[0]) * MVT_BUFFER / MVT_EXTENT
+        parameters = {
+            **dict(zip(TILE_PARAMETERS, bounds)),
+            **self._envelope(bounds, margin)
+        }
+        if clustered:
+            parameters["cell_size"] = (bounds[2] - bounds[0]) / grid
+        if activity_ids:
+            parameters["activity_ids"] = activity_ids
+
+        async with self.db_helper.read_session() as session:
+            result = await session.execute(self._statement("tile", clustered, bool(activity_ids)), parameters)
+            return result.scalar() or b""
+
+    # Приватные методы
+    def _build_tile(self, clustered: bool, filtered: bool):
+        buildings = self._select_tile_buildings(filtered).subquery("tile_buildings")
+        tile = func.ST_MakeEnvelope(*(bindparam(name, type_=Float) for name in TILE_PARAMETERS), 3857)
+
+        if clustered:
+            # Ячейки сетки выровнены по краям тайла: floor, а не округление ST_SnapToGrid,
+            # иначе ячейка на границе делилась бы между соседними тайлами
+            point_x, point_y = func.ST_X(buildings.c.geom), func.ST_Y(buildings.c.geom)
+            cell_size = bindparam("cell_size", type_=Float)
+            features = (
+                select(
+                    func.count().label("buildings"),
+                    func.sum(buildings.c.organizations).label("organizations"),
+                    func.ST_AsMVTGeom(
+                        func.ST_Centroid(func.ST_Collect(buildings.c.geom)), tile, MVT_EXTENT, MVT_BUFFER
+                    ).label("geom")
+                )
+                .where(
+                    point_x >= bindparam("tile_min_x", type_=Float),
+                    point_x < bindparam("tile_max_x", type_=Float),
+                    point_y >= bindparam("tile_min_y", type_=Float),
+                    point_y < bindparam("tile_max_y", type_=Float)
+                )
+                .group_by(
+                    func.floor((point_x - bindparam("tile_min_x", type_=Float)) / cell_size),
+                    func.floor((point_y - bindparam("tile_min_y", type_=Float)) / cell_size)
+                )
+            )
+            layer = "clusters"
+        else:
+            features = select(
+                cast(buildings.c.id, String).label("id"),
+                buildings.c.address,
+                buildings.c.organizations,
+                func.ST_AsMVTGeom(buildings.c.geom, tile, MVT_EXTENT, MVT_BUFFER).label("geom")
+            )
+            layer = "buildings"
+
+        features = features.subquery("features")
+        return select(func.ST_AsMVT(features.table_valued(), layer, MVT_EXTENT, "geom"))
+
+    def _select_tile_buildings(self, filtered: bool):
+        """Здания в прямоугольнике тайла: (id, address, organizations, geom в EPSG:3857)"""
+        geom = func.ST_Transform(Building.location, 3857).label("geom")
+        in_envelope = Building.location.op("&&")(
+            func.ST_MakeEnvelope(*(bindparam(name, type_=Float) for name in ENVELOPE_PARAMETERS), 4326)
+        )
+        if not filtered:
+            counts = building_organization_counts
+            return (
+                select(Building.id, Building.address, func.coalesce(counts.c.organizations, 0).label("organizations"), geom)
+                .select_from(Building)
+                .outerjoin(counts, counts.c.building_id == Building.id)
+                .where(in_envelope)
+            )
+
+        # С фильтром остаются здания с подходящими организациями, каждая считается один раз
+        subtree = (
+            select(activity_closure.c.descendant_id)
+            .where(activity_closure.c.ancestor_id == any_(
+                bindparam("activity_ids", type_=ARRAY(activity_closure.c.ancestor_id.type))
+            ))
+        )
+        return (
+            select(Building.id, Building.address, func.count(Organization.id.distinct()).label("organizations"), geom)
+            .select_from(Building)
+            .join(Organization, Organization.building_id == Building.id)
+            .join(organization_activities, organization_activities.c.organization_id == Organization.id)
+            .where(in_envelope, organization_activities.c.activity_id.in_(subtree))
+            .group_by(Building.id)
+        )
+
+    def _envelope(self, bounds: Tuple[float, float, float, float], margin: float) -> dict:
+        """Параметры прямоугольника тайла с запасом margin метров в градусах для индекса по location"""
+        min_x, min_y, max_x, max_y = bounds
+        limit = MERCATOR_HALF_WORLD
+        min_longitude, min_latitude = mercator_to_degrees(max(min_x - margin, -limit), max(min_y - margin, -limit))
+        max_longitude, max_latitude = mercator_to_degrees(min(max_x + margin, limit), min(max_y + margin, limit))
+        return dict(zip(ENVELOPE_PARAMETERS, (min_longitude, min_latitude, max_longitude, max_latitude)))
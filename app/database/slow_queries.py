@@ -0,0 +1,158 @@
+"""Журнал медленных запросов с выборочным EXPLAIN (ANALYZE, BUFFERS)"""
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.metrics import current_repository_method
+
+logger = logging.getLogger(__name__)
+
+# Длина строкового представления одного параметра в журнале
+MAX_PARAMETER_LENGTH = 200
+
+
+def _format_parameters(parameters, with_values: bool) -> list:
+    """Параметры запроса для журнала: значения или, без with_values, только имена типов"""
+    if isinstance(parameters, dict):
+        parameters = list(parameters.values())
+    formatted = []
+    for value in parameters or ():
+        if not with_values:
+            formatted.append(f"<{type(value).__name__}>")
+            continue
+        text = repr(value)
+        formatted.append(text if len(text) <= MAX_PARAMETER_LENGTH else text[:MAX_PARAMETER_LENGTH] + "...")
+    return formatted
+
+
+def _is_read_only(statement: str) -> bool:
+    """EXPLAIN ANALYZE выполняет запрос, поэтому повторяем только чтение"""
+    head = statement.lstrip().upper()
+    return head.startswith("SELECT") and not any(
+        keyword in head for keyword in ("INSERT ", "UPDATE ", "DELETE ", "SET_CONFIG(")
+    )
+
+
+class SlowQueryRecorder:
+    """Записывает запросы дольше порога: текст, параметры, метод репозитория, время.
+
+    Для доли explain_sample_rate из них план снимается EXPLAIN (ANALYZE, BUFFERS)
+    в фоне на отдельном соединении, чтобы не удлинять и без того медленный
+    запрос и не затронуть его транзакцию. Одновременно снимается не больше
+    одного плана: при массовом замедлении EXPLAIN не добавляет нагрузки.
+    Записи хранятся в кольцевом буфере и, если задан log_path, в ротируемом
+    файле JSON Lines. Значения параметров (поисковые строки, id) записываются
+    только с log_parameters, иначе - имена их типов; EXPLAIN все равно
+    выполняется с настоящими параметрами.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float,
+        explain_sample_rate: float = 0.1,
+        explain_timeout_ms: int = 10000,
+        buffer_size: int = 200,
+        log_path: Optional[str] = None,
+        log_parameters: bool = False
+    ):
+        self.threshold = threshold_ms / 1000
+        self.log_parameters = log_parameters
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_timeout_ms = explain_timeout_ms
+        self.entries: deque = deque(maxlen=buffer_size)
+        self.recorded = 0
+        self.explained = 0
+        # Синхронный движок -> AsyncEngine: план снимается на той базе, где выполнялся запрос
+        self._engines: Dict[Engine, AsyncEngine] = {}
+        self._explain_task: Optional[asyncio.Task] = None
+        self._file_logger = None
+        if log_path:
+            self._file_logger = logging.getLogger(f"{__name__}.file")
+            self._file_logger.propagate = False
+            self._file_logger.setLevel(logging.INFO)
+            self._file_logger.addHandler(RotatingFileHandler(log_path, maxBytes=10 * 2**20, backupCount=5))
+
+    def attach(self, engine: AsyncEngine) -> None:
+        """Подключить к движку AsyncDatabaseHelper (основной базы или реплики)"""
+        self._engines[engine.sync_engine] = engine
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def recent(self, limit: int) -> List[dict]:
+        """Последние записи, новые первыми"""
+        return list(self.entries)[::-1][:limit]
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "explain_sample_rate": self.explain_sample_rate,
+            "entries": len(self.entries),
+            "recorded": self.recorded,
+            "explained": self.explained,
+        }
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._slow_query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_slow_query_started", None)
+        if started is None or not context.execution_options.get("slow_query_log", True):
+            return
+        duration = time.perf_counter() - started
+        if duration < self.threshold:
+            return
+
+        entry = {
+            "time": time.time(),
+            "duration_ms": round(duration * 1000, 2),
+            "method": current_repository_method.get(),
+            "statement": statement,
+            "parameters": _format_parameters(parameters, self.log_parameters),
+            "plan": None,
+        }
+        self.entries.append(entry)
+        self.recorded += 1
+        logger.warning("Slow query %.1f ms in %s", entry["duration_ms"], entry["method"])
+
+        if (
+            (self._explain_task is None or self._explain_task.done())
+            and not executemany
+            and _is_read_only(statement)
+            and random.random() < self.explain_sample_rate
+        ):
+            # Событие вызывается в greenlet внутри цикла событий, задачу можно создать отсюда
+            self._explain_task = asyncio.get_running_loop().create_task(
+                self._explain(self._engines[conn.engine], entry, statement, parameters)
+            )
+        else:
+            self._write(entry)
+
+    async def _explain(self, engine: AsyncEngine, entry: dict, statement: str, parameters) -> None:
+        try:
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(slow_query_log=False)
+                await conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.explain_timeout_ms)}")
+                result = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+                entry["plan"] = "\n".join(row[0] for row in result)
+                await conn.rollback()
+            self.explained += 1
+        except Exception as e:
+            entry["plan"] = f"EXPLAIN failed: {e}"
+        finally:
+            self._write(entry)
+
+    def _write(self, entry: dict) -> None:
+        if self._file_logger:
+            self._file_logger.info(json.dumps(entry, ensure_ascii=False))
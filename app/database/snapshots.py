@@ -0,0 +1,185 @@
+"""Снимки базы данных через шаблонные базы Postgres.
+
+Снимок - копия рабочей базы, созданная CREATE DATABASE ... TEMPLATE и
+помеченная как шаблон без права подключения. Восстановление и клонирование
+копируют файлы базы целиком, без повторной генерации и загрузки данных.
+"""
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+from sqlalchemy.pool import NullPool
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_NAME = re.compile(r"^[a-z0-9_]{1,40}$")
+# Имя базы снимка: <рабочая база>__<снимок>
+SNAPSHOT_SEPARATOR = "__"
+# Комментарий базы, созданной clone: только такие базы clone перезаписывает, а drop_clone удаляет
+CLONE_COMMENT = "snapshot clone of {}"
+
+
+class SnapshotError(Exception):
+    """Снимок не найден или имя недопустимо"""
+
+
+class DatabaseSnapshots:
+    """Создание, восстановление и клонирование снимков рабочей базы db_name.
+
+    Работает через admin_db_url: CREATE/DROP DATABASE нельзя выполнить
+    ни в транзакции, ни из подключения к копируемой базе.
+    """
+
+    def __init__(self, admin_db_url: str, db_name: str):
+        self.admin_db_url = admin_db_url.replace("postgresql://", "postgresql+asyncpg://")
+        self.db_name = db_name
+
+    async def create(self, name: str, revision: Optional[str] = None) -> str:
+        """Снять снимок рабочей базы; подключения к ней при этом разрываются.
+
+        revision (ревизия alembic) сохраняется в комментарии базы снимка, чтобы
+        не восстановить снимок со старой схемой.
+        """
+        snapshot = self._snapshot_database(name)
+        async with self._admin_connection() as conn:
+            await self._drop_database(conn, snapshot)
+            await self._copy_database(conn, self.db_name, snapshot)
+            await conn.execute(text(
+                f"ALTER DATABASE {self._quote(conn, snapshot)} WITH IS_TEMPLATE true ALLOW_CONNECTIONS false"
+            ))
+            if revision:
+                comment = revision.replace("'", "''")
+                await conn.execute(text(f"COMMENT ON DATABASE {self._quote(conn, snapshot)} IS '{comment}'"))
+        return snapshot
+
+    async def restore(self, name: str) -> None:
+        """Заменить рабочую базу копией снимка"""
+        async with self._admin_connection() as conn:
+            snapshot = await self._existing_snapshot(conn, name)
+            await self._drop_database(conn, self.db_name)
+            await self._copy_database(conn, snapshot, self.db_name)
+
+    async def clone(self, name: str, target: str) -> None:
+        """Создать базу target из снимка (например, отдельную базу на прогон тестов).
+
+        Существующая база target заменяется, только если она тоже создана clone
+        от этой рабочей базы; любую другую базу clone не трогает.
+        """
+        async with self._admin_connection() as conn:
+            snapshot = await self._existing_snapshot(conn, name)
+            if await self._database_exists(conn, target):
+                await self._check_clone(conn, target)
+                await self._drop_database(conn, target)
+            await self._copy_database(conn, snapshot, target)
+            comment = CLONE_COMMENT.format(self.db_name).replace("'", "''")
+            await conn.execute(text(f"COMMENT ON DATABASE {self._quote(conn, target)} IS '{comment}'"))
+
+    async def drop_clone(self, target: str) -> None:
+        """Удалить базу, созданную clone; другие базы, включая рабочую, так удалить нельзя"""
+        async with self._admin_connection() as conn:
+            if await self._database_exists(conn, target):
+                await self._check_clone(conn, target)
+                await self._drop_database(conn, target)
+
+    async def drop(self, name: str) -> None:
+        """Удалить снимок"""
+        snapshot = self._snapshot_database(name)
+        async with self._admin_connection() as conn:
+            if await self._database_exists(conn, snapshot):
+                await conn.execute(text(f"ALTER DATABASE {self._quote(conn, snapshot)} WITH IS_TEMPLATE false"))
+                await self._drop_database(conn, snapshot)
+
+    async def list_snapshots(self) -> List[dict]:
+        """Снимки рабочей базы с размером и ревизией схемы"""
+        prefix = self.db_name + SNAPSHOT_SEPARATOR
+        async with self._admin_connection() as conn:
+            rows = (await conn.execute(text("""
+                SELECT datname, pg_database_size(oid) AS size, shobj_description(oid, 'pg_database') AS revision
+                FROM pg_database
+                WHERE datistemplate AND left(datname, length(:prefix)) = :prefix
+                ORDER BY datname
+            """), {"prefix": prefix})).all()
+        return [
+            {"name": row.datname[len(prefix):], "database": row.datname, "size": row.size, "revision": row.revision}
+            for row in rows
+        ]
+
+    async def revision(self, name: str) -> Optional[str]:
+        """Ревизия alembic, сохраненная при создании снимка; None если снимка нет"""
+        for snapshot in await self.list_snapshots():
+            if snapshot["name"] == name:
+                return snapshot["revision"] or ""
+        return None
+
+    @asynccontextmanager
+    async def _admin_connection(self) -> AsyncGenerator[AsyncConnection, None]:
+        # AUTOCOMMIT: CREATE/DROP DATABASE не выполняются внутри транзакции
+        engine = create_async_engine(self.admin_db_url, isolation_level="AUTOCOMMIT", poolclass=NullPool)
+        try:
+            async with engine.connect() as conn:
+                yield conn
+        finally:
+            await engine.dispose()
+
+    def _snapshot_database(self, name: str) -> str:
+        if not SNAPSHOT_NAME.match(name):
+            raise SnapshotError(f"Invalid snapshot name {name!r}: use [a-z0-9_], up to 40 characters")
+        return f"{self.db_name}{SNAPSHOT_SEPARATOR}{name}"
+
+    async def _existing_snapshot(self, conn, name: str) -> str:
+        snapshot = self._snapshot_database(name)
+        if not await self._database_exists(conn, snapshot):
+            raise SnapshotError(f"Snapshot {name} not found")
+        return snapshot
+
+    async def _check_clone(self, conn, database: str) -> None:
+        """Отказ, если database - рабочая база или не помечена как клон снимка этой базы"""
+        comment = (await conn.execute(
+            text("SELECT shobj_description(oid, 'pg_database') FROM pg_database WHERE datname = :name"),
+            {"name": database}
+        )).scalar()
+        if database == self.db_name or comment != CLONE_COMMENT.format(self.db_name):
+            raise SnapshotError(f"Database {database} was not created by clone from {self.db_name} snapshots, refusing to replace or drop it")
+
+    async def _copy_database(self, conn, source: str, target: str) -> None:
+        """CREATE DATABASE target TEMPLATE source с тем же владельцем; к шаблону не должно быть подключений"""
+        started = time.perf_counter()
+        await self._terminate_connections(conn, source)
+        owner = (await conn.execute(
+            text("SELECT pg_get_userbyid(datdba) FROM pg_database WHERE datname = :name"),
+            {"name": source}
+        )).scalar()
+        # С 15-й версии по умолчанию база копируется через WAL; FILE_COPY быстрее для больших баз
+        server_version = (await conn.execute(text("SHOW server_version_num"))).scalar()
+        strategy = " STRATEGY FILE_COPY" if int(server_version) >= 150000 else ""
+        await conn.execute(text(
+            f"CREATE DATABASE {self._quote(conn, target)} TEMPLATE {self._quote(conn, source)}"
+            f" OWNER {self._quote(conn, owner)}{strategy}"
+        ))
+        logger.info("Database %s created from %s in %.1f s", target, source, time.perf_counter() - started)
+
+    async def _drop_database(self, conn, database: str) -> None:
+        if await self._database_exists(conn, database):
+            await self._terminate_connections(conn, database)
+            await conn.execute(text(f"DROP DATABASE {self._quote(conn, database)}"))
+
+    async def _terminate_connections(self, conn, database: str) -> None:
+        await conn.execute(text("""
+            SELECT pg_terminate_backend(pid)
+            FROM pg_stat_activity
+            WHERE datname = :name AND pid <> pg_backend_pid()
+        """), {"name": database})
+
+    async def _database_exists(self, conn, database: str) -> bool:
+        return bool((await conn.execute(
+            text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": database}
+        )).scalar())
+
+    @staticmethod
+    def _quote(conn, identifier: str) -> str:
+        return conn.dialect.identifier_preparer.quote(identifier)
+
@@ -1,18 +1,41 @@
+import argparse
 import asyncio
+from typing import Optional
+from sqlalchemy import text
 from app.config import Settings
 from app.database.db_helper import AsyncDatabaseHelper
+from app.database.snapshots import DatabaseSnapshots
 from app.services.fake_filler import FakeFiller
 
-async def main():
+async def main(
+    organizations: int,
+    buildings: int,
+    batch_size: int,
+    seed: Optional[int],
+    workers: Optional[int],
+    snapshot: Optional[str]
+):
     settings = Settings()
     db_helper = AsyncDatabaseHelper(settings.db_url)
+    snapshots = DatabaseSnapshots(settings.admin_db_url, settings.db_name)
+    revision = None
     
     try:
         await db_helper.connect()
         print("Подключение к базе данных установлено")
+
+        async with db_helper.session_only() as session:
+            revision = (await session.execute(text("SELECT version_num FROM alembic_version"))).scalar()
+
+        # Снимок с той же схемой восстанавливается вместо повторной генерации
+        if snapshot and await snapshots.revision(snapshot) == revision:
+            await db_helper.close()
+            await snapshots.restore(snapshot)
+            print(f"База восстановлена из снимка {snapshot}")
+            return
         
-        filler = FakeFiller(db_helper)
-        await filler.fill_database(10000)
+        filler = FakeFiller(db_helper, seed=seed, workers=workers)
+        await filler.fill_database(organizations, buildings, batch_size)
         
     except Exception as e:
         print(f"❌ Ошибка: {e}")
@@ -21,5 +44,28 @@ async def main():
         await db_helper.close()
         print("Соединение с базой данных закрыто")
 
+    if snapshot:
+        await snapshots.create(snapshot, revision)
+        print(f"Сохранен снимок {snapshot}")
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Заполнение базы тестовыми данными")
+    parser.add_argument("--organizations", type=int, default=10000)
+    parser.add_argument("--buildings", type=int, default=2000)
+    parser.add_argument("--scale", type=float, default=1.0, help="Множитель числа организаций и зданий")
+    parser.add_argument("--seed", type=int, default=None, help="Одно и то же зерно дает один и тот же набор данных")
+    parser.add_argument("--workers", type=int, default=None, help="Процессов генерации, по умолчанию по числу CPU")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Строк в одном COPY")
+    parser.add_argument(
+        "--snapshot",
+        help="Восстановить базу из снимка, если он снят при той же ревизии схемы, иначе заполнить и сохранить снимок"
+    )
+    args = parser.parse_args()
+    asyncio.run(main(
+        int(args.organizations * args.scale),
+        max(int(args.buildings * args.scale), 1),
+        args.batch_size,
+        args.seed,
+        args.workers,
+        args.snapshot
+    ))
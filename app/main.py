@@ -1,14 +1,34 @@
 """ Точка входа в основное приложение """
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 from app.config import Settings
 
-from app.presentation.api import router as organizations_router
-from app.presentation.middleware import AuthMiddleware
+from app.presentation.api import (
+    router as organizations_router,
+    activities_router,
+    tiles_router,
+    invalid_cursor_handler,
+    invalid_tile_handler,
+    search_timeout_handler
+)
+from app.presentation.admin import router as admin_router
+from app.presentation.metrics import router as metrics_router
+from app.presentation.middleware import AuthMiddleware, MetricsMiddleware, ServerTimingMiddleware
 from app.services.organizations import OrganizationsService
-from app.database.repositories.organisations import OrganizationsRepository
+from app.services.pagination import InvalidCursorError
+from app.services.activity_tree import ActivityTreeCache
+from app.services.response_cache import LRUResponseCache
+from app.services.single_flight import SingleFlight
+from app.services.tiles import InvalidTileError, TilesService
+from app.database.repositories.activities import ActivitiesRepository
+from app.database.repositories.buildings import BuildingsRepository
+from app.database.repositories.organisations import OrganizationsRepository, SearchTimeoutError
+from app.database.repositories.organisations_json import OrganizationsJsonRepository
+from app.database.repositories.tiles import TilesRepository
 from app.database.db_helper import AsyncDatabaseHelper
+from app.database.slow_queries import SlowQueryRecorder
 
 settings = Settings()
 
@@ -16,22 +36,123 @@ settings = Settings()
 async def lifespan(app: FastAPI):
     """Обработчик событий жизненного цикла FastAPI"""
 
-    db_helper = AsyncDatabaseHelper(settings.db_url)
+    app.state.slow_queries = None
+    if settings.slow_query_threshold_ms is not None:
+        app.state.slow_queries = SlowQueryRecorder(
+            threshold_ms=settings.slow_query_threshold_ms,
+            explain_sample_rate=settings.slow_query_explain_sample_rate,
+            explain_timeout_ms=settings.slow_query_explain_timeout_ms,
+            buffer_size=settings.slow_query_buffer_size,
+            log_path=settings.slow_query_log_path,
+            log_parameters=settings.slow_query_log_parameters
+        )
+
+    db_helper = AsyncDatabaseHelper(
+        settings.db_url,
+        replica_urls=settings.db_replica_urls,
+        replica_strategy=settings.db_replica_strategy,
+        replica_retry_seconds=settings.db_replica_check_seconds,
+        replica_ping_timeout=settings.db_replica_ping_timeout,
+        query_cache_size=settings.db_query_cache_size,
+        prepared_statement_cache_size=settings.db_prepared_statement_cache_size,
+        slow_query_recorder=app.state.slow_queries
+    )
     
     await db_helper.connect()
+    app.state.db_helper = db_helper
     
-    app.state.repository = OrganizationsRepository(db_helper)
-    app.state.service = OrganizationsService(repository=app.state.repository)
+    repository_class = OrganizationsJsonRepository if settings.repository_engine == "json" else OrganizationsRepository
+    app.state.repository = repository_class(db_helper)
+    await app.state.repository.warm_up()
+
+    background_tasks = []
+    if db_helper.replicas and settings.db_replica_check_seconds > 0:
+        background_tasks.append(asyncio.create_task(
+            db_helper.check_replicas_periodically(settings.db_replica_check_seconds)
+        ))
+
+    app.state.response_cache = None
+    if settings.response_cache_enabled:
+        app.state.response_cache = LRUResponseCache(
+            max_bytes=settings.response_cache_max_bytes,
+            ttl=settings.response_cache_ttl_seconds,
+            max_entries=settings.response_cache_max_entries
+        )
+
+    # Отдельный кэш, чтобы тайлы при панорамировании карты не вытесняли ответы API
+    app.state.tile_cache = None
+    if settings.tile_cache_enabled:
+        app.state.tile_cache = LRUResponseCache(
+            max_bytes=settings.tile_cache_max_bytes,
+            ttl=settings.tile_cache_ttl_seconds
+        )
+    app.state.tiles_service = TilesService(
+        TilesRepository(db_helper),
+        cluster_max_zoom=settings.tile_cluster_max_zoom,
+        cluster_grid=settings.tile_cluster_grid
+    )
+
+    app.state.activity_tree = ActivityTreeCache(ActivitiesRepository(db_helper))
+    await app.state.activity_tree.reload()
+    if settings.activity_tree_check_seconds > 0:
+        background_tasks.append(asyncio.create_task(
+            app.state.activity_tree.reload_periodically(settings.activity_tree_check_seconds)
+        ))
+
+    app.state.spatial_index = None
+    if settings.spatial_index_enabled:
+        from app.services.spatial_index import BuildingSpatialIndex  # numpy нужен только индексу
+
+        app.state.spatial_index = BuildingSpatialIndex(
+            BuildingsRepository(db_helper),
+            cell_degrees=settings.spatial_index_cell_degrees
+        )
+        await app.state.spatial_index.refresh()
+        if settings.spatial_index_refresh_seconds > 0:
+            background_tasks.append(asyncio.create_task(
+                app.state.spatial_index.refresh_periodically(settings.spatial_index_refresh_seconds)
+            ))
+
+    app.state.service = OrganizationsService(
+        repository=app.state.repository,
+        spatial_index=app.state.spatial_index,
+        activity_tree=app.state.activity_tree,
+        single_flight=SingleFlight(settings.single_flight_max_waiters) if settings.single_flight_enabled else None,
+        search_similarity_threshold=settings.search_similarity_threshold,
+        search_timeout_ms=settings.search_timeout_ms,
+        export_chunk_size=settings.export_chunk_size
+    )
     
     yield
 
+    for task in background_tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
     await db_helper.close()
 
     
 app = FastAPI(title="QR-Blockchain Server", version="1.0.0", lifespan=lifespan)
 
 # Middleware для аутентификации
-app.add_middleware(AuthMiddleware)
+app.add_middleware(AuthMiddleware, api_keys=settings.auth_api_keys)
+
+if settings.server_timing_enabled:
+    app.add_middleware(ServerTimingMiddleware)
+
+# Снаружи остальных middleware, чтобы учитывать и отказы аутентификации
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
 
 # Подключаем предварительно собранные роуты
 app.include_router(organizations_router)
+app.include_router(activities_router)
+app.include_router(tiles_router)
+app.include_router(admin_router)
+if settings.metrics_enabled:
+    app.include_router(metrics_router)
+
+app.add_exception_handler(InvalidCursorError, invalid_cursor_handler)
+app.add_exception_handler(SearchTimeoutError, search_timeout_handler)
+app.add_exception_handler(InvalidTileError, invalid_tile_handler)
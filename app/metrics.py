@@ -0,0 +1,245 @@
+"""Метрики приложения в текстовом формате Prometheus.
+
+Свой минимальный реестр вместо prometheus_client: нужны только счетчики,
+гистограммы и вычисляемые gauge, а приложение однопоточное (asyncio), так что
+наблюдение - это поиск корзины и пара сложений без блокировок.
+"""
+import bisect
+import functools
+import inspect
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Корзины задержки в секундах: от 1 мс до 10 с
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Корзины размера ответа в байтах: от 256 Б до 16 МБ
+SIZE_BUCKETS = tuple(256 * 4 ** power for power in range(9))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Для каждого набора меток: счетчики корзин (последняя - +Inf), сумма
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class GaugeFunction:
+    """Gauge, значения которого вычисляются при сборе метрик: по функции на набор меток"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._functions: Dict[Tuple[str, ...], Callable[[], Optional[float]]] = {}
+
+    def track(self, function: Callable[[], Optional[float]], *labels: str) -> None:
+        self._functions[labels] = function
+
+    def collect(self) -> List[str]:
+        lines = []
+        for labels, function in self._functions.items():
+            value = function()
+            if value is not None:
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        if not lines:
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", *lines]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status")
+))
+HTTP_RESPONSE_SIZE = REGISTRY.register(Histogram(
+    "http_response_size_bytes", "HTTP response body size by route template",
+    ("method", "route"), buckets=SIZE_BUCKETS
+))
+DB_QUERY_DURATION = REGISTRY.register(Histogram(
+    "db_query_duration_seconds", "Database statement execution time by repository method",
+    ("method",)
+))
+DB_POOL_WAIT = REGISTRY.register(Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled database connection"
+))
+DB_POOL_TIMEOUTS = REGISTRY.register(Counter(
+    "db_pool_timeouts_total", "Connection checkouts that failed with pool timeout"
+))
+DB_READ_SESSIONS = REGISTRY.register(Counter(
+    "db_read_sessions_total", "Read sessions by the database that served them",
+    ("database",)
+))
+DB_REPLICA_FAILURES = REGISTRY.register(Counter(
+    "db_replica_failures_total", "Replica connection failures that excluded it from reads",
+    ("database",)
+))
+SINGLE_FLIGHT_CALLS = REGISTRY.register(Counter(
+    "single_flight_calls_total",
+    "Service calls by outcome: leader ran the query, coalesced shared an in-flight one, "
+    "overflow started a new one because the in-flight call had max waiters",
+    ("method", "outcome")
+))
+SINGLE_FLIGHT_IN_FLIGHT = REGISTRY.register(GaugeFunction(
+    "single_flight_in_flight", "Distinct service calls currently executing"
+))
+DB_POOL_GAUGES = [
+    REGISTRY.register(GaugeFunction(name, documentation, ("database",)))
+    for name, documentation in (
+        ("db_pool_size", "Configured pool size"),
+        ("db_pool_checked_out", "Connections currently checked out"),
+        ("db_pool_checked_in", "Idle connections in the pool"),
+        ("db_pool_overflow", "Connections open beyond pool_size (negative while the pool is not full)"),
+    )
+]
+
+# Метод репозитория, выполняющийся в текущей задаче: метка для времени запросов к базе
+current_repository_method: ContextVar[str] = ContextVar("current_repository_method", default="other")
+
+
+def instrumented_repository(cls):
+    """Декоратор класса: публичные async-методы и async-генераторы помечают свои запросы к базе.
+
+    Метка - имя класса экземпляра и метода, так что ORM- и JSON-движок,
+    унаследовавший методы, различаются.
+    """
+    for name, method in list(vars(cls).items()):
+        if name.startswith("_"):
+            continue
+        if inspect.isasyncgenfunction(method):
+            setattr(cls, name, _label_async_generator(method))
+        elif inspect.iscoroutinefunction(method):
+            setattr(cls, name, _label_coroutine(method))
+    return cls
+
+
+def _label_coroutine(method):
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        token = current_repository_method.set(f"{type(self).__name__}.{method.__name__}")
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            current_repository_method.reset(token)
+    return wrapper
+
+
+def _label_async_generator(method):
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        # Генератор продолжается в задаче потребителя, поэтому метка ставится на каждом шаге
+        label = f"{type(self).__name__}.{method.__name__}"
+        generator = method(self, *args, **kwargs)
+        try:
+            while True:
+                token = current_repository_method.set(label)
+                try:
+                    item = await generator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    current_repository_method.reset(token)
+                yield item
+        finally:
+            await generator.aclose()
+    return wrapper
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is not None:
+        DB_QUERY_DURATION.observe(time.perf_counter() - started, current_repository_method.get())
+
+
+def instrument_engine_metrics(engine: Engine, database: str = "primary") -> None:
+    """Время выполнения запросов движка (синхронного движка AsyncEngine) и состояние его пула.
+
+    database - метка пула: у основной базы и каждой реплики свой пул.
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    pool = engine.pool
+    for gauge, function in zip(DB_POOL_GAUGES, (pool.size, pool.checkedout, pool.checkedin, pool.overflow)):
+        gauge.track(function, database)
+
+
+def route_template(scope: dict) -> str:
+    """Шаблон пути сработавшего роута; для несовпавших путей одна метка, чтобы не раздувать число рядов"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
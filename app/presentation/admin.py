@@ -0,0 +1,100 @@
+from typing import TYPE_CHECKING
+
+from fastapi import APIRouter, HTTPException, Query, Request
+
+from app.database.slow_queries import SlowQueryRecorder
+
+if TYPE_CHECKING:
+    from app.services.spatial_index import BuildingSpatialIndex
+
+router = APIRouter(prefix="/admin")
+
+def get_spatial_index(request: Request) -> "BuildingSpatialIndex":
+    spatial_index = request.app.state.spatial_index
+    if spatial_index is None:
+        raise HTTPException(status_code=404, detail="Spatial index is disabled")
+    return spatial_index
+
+def get_slow_queries(request: Request) -> SlowQueryRecorder:
+    slow_queries = request.app.state.slow_queries
+    if slow_queries is None:
+        raise HTTPException(status_code=404, detail="Slow query log is disabled")
+    return slow_queries
+
+@router.get("/spatial-index")
+async def get_spatial_index_stats(request: Request):
+    """Состояние in-memory индекса зданий: размер, память, время загрузки"""
+    return get_spatial_index(request).stats()
+
+@router.post("/spatial-index/refresh")
+async def refresh_spatial_index(request: Request):
+    """Перечитать здания и заменить снимок индекса"""
+    spatial_index = get_spatial_index(request)
+    await spatial_index.refresh()
+    return spatial_index.stats()
+
+@router.post("/activity-tree/reload")
+async def reload_activity_tree(request: Request):
+    """Перечитать дерево деятельностей, например после его изменения в базе"""
+    activity_tree = request.app.state.activity_tree
+    changed = await activity_tree.reload()
+    return {"version": activity_tree.version, "changed": changed}
+
+@router.get("/response-cache")
+async def get_response_cache_stats(request: Request):
+    """Счетчики кэша ответов: попадания, промахи, вытеснения, занятая память"""
+    cache = request.app.state.response_cache
+    if cache is None:
+        raise HTTPException(status_code=404, detail="Response cache is disabled")
+    return cache.stats()
+
+@router.post("/response-cache/clear")
+async def clear_response_cache(request: Request):
+    """Сбросить кэш ответов, например после перезаливки данных"""
+    cache = request.app.state.response_cache
+    if cache is None:
+        raise HTTPException(status_code=404, detail="Response cache is disabled")
+    cache.clear()
+    return cache.stats()
+
+@router.get("/tile-cache")
+async def get_tile_cache_stats(request: Request):
+    """Счетчики кэша векторных тайлов"""
+    cache = request.app.state.tile_cache
+    if cache is None:
+        raise HTTPException(status_code=404, detail="Tile cache is disabled")
+    return cache.stats()
+
+@router.post("/tile-cache/clear")
+async def clear_tile_cache(request: Request):
+    """Сбросить кэш тайлов, например после изменения зданий"""
+    cache = request.app.state.tile_cache
+    if cache is None:
+        raise HTTPException(status_code=404, detail="Tile cache is disabled")
+    cache.clear()
+    return cache.stats()
+
+@router.get("/replicas")
+async def get_replicas(request: Request):
+    """Реплики для чтения: доступность, занятые соединения, последняя ошибка"""
+    db_helper = request.app.state.db_helper
+    return {"strategy": db_helper.replica_strategy, "replicas": [replica.stats() for replica in db_helper.replicas]}
+
+@router.post("/replicas/check")
+async def check_replicas(request: Request):
+    """Проверить реплики сейчас, не дожидаясь фоновой проверки"""
+    return {"replicas": await request.app.state.db_helper.check_replicas()}
+
+@router.get("/slow-queries")
+async def get_slow_queries_log(request: Request, limit: int = Query(50, ge=1, le=1000)):
+    """Последние медленные запросы, новые первыми: текст, параметры (без SLOW_QUERY_LOG_PARAMETERS -
+    только их типы), метод репозитория и план, если снят"""
+    slow_queries = get_slow_queries(request)
+    return {**slow_queries.stats(), "queries": slow_queries.recent(limit)}
+
+@router.post("/slow-queries/clear")
+async def clear_slow_queries_log(request: Request):
+    """Очистить буфер медленных запросов"""
+    slow_queries = get_slow_queries(request)
+    slow_queries.clear()
+    return slow_queries.stats()
@@ -1,79 +1,390 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from app.services.organizations import OrganizationsService
-from app.schemas import OrganizationResponse
+from app.services.activity_tree import ActivityTreeCache
+from app.services.tiles import MAX_ZOOM, InvalidTileError, TilesService
+from app.services.response_cache import ResponseCache
+from app.services.pagination import InvalidCursorError
+from app.database.repositories.organisations import (
+    FULL_PROJECTION,
+    ORGANIZATION_COLUMNS,
+    ORGANIZATION_RELATIONS,
+    Projection,
+    SearchTimeoutError
+)
+from app.schemas import (
+    OrganizationResponse,
+    OrganizationsPageResponse,
+    OrganizationsCountResponse,
+    OrganizationsBatchRequest,
+    OrganizationsBatchResponse,
+    ActivityTreeNodeResponse
+)
 from fastapi import Request
+from pydantic_core import to_json
 from uuid import UUID
-from typing import List
+import json
+from typing import Annotated, Any, List, Optional
 
 router = APIRouter(prefix="/organizations")
+activities_router = APIRouter(prefix="/activities")
+tiles_router = APIRouter(prefix="/tiles")
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+# Параметры keyset-пагинации, общие для всех списочных роутов
+Limit = Annotated[int, Query(ge=1, le=MAX_PAGE_LIMIT, description="Размер страницы")]
+Cursor = Annotated[Optional[str], Query(description="Курсор из next_cursor предыдущей страницы")]
+
+class DocumentResponse(JSONResponse):
+    """JSON-ответ из документа сервиса: pydantic_core кодирует его сразу в байты.
+
+    Документы строятся из строк базы и уже соответствуют схеме, поэтому роут
+    возвращает ответ сам, минуя повторную валидацию по response_model;
+    response_model остается для схемы OpenAPI.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return to_json(content)
+
+def parse_field_list(value: Optional[str], allowed: tuple, parameter: str) -> frozenset:
+    """Список имен через запятую; пустая строка - пустой список"""
+    names = frozenset(name.strip() for name in value.split(",") if name.strip())
+    unknown = names - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown {parameter}: {', '.join(sorted(unknown))}; allowed: {', '.join(allowed)}"
+        )
+    return names
+
+def get_projection(
+    fields: Optional[str] = Query(
+        None,
+        description="Колонки организации через запятую: id, name, building_id. id возвращается всегда, по умолчанию все"
+    ),
+    expand: Optional[str] = Query(
+        None,
+        description="Связи через запятую: building, phones, activities. Пустое значение - без связей, по умолчанию все"
+    )
+) -> Projection:
+    """Поля организации в ответе; незапрошенные связи не загружаются из базы"""
+    if fields is None and expand is None:
+        return FULL_PROJECTION
+    return Projection(
+        columns=FULL_PROJECTION.columns if fields is None else parse_field_list(fields, ORGANIZATION_COLUMNS, "fields") | {"id"},
+        relations=FULL_PROJECTION.relations if expand is None else parse_field_list(expand, ORGANIZATION_RELATIONS, "expand")
+    )
 
 def get_service(request: Request) -> OrganizationsService:
     return request.app.state.service
 
-@router.get("/by-building/{building_id}", response_model=List[OrganizationResponse])
+def get_activity_tree(request: Request) -> ActivityTreeCache:
+    return request.app.state.activity_tree
+
+def get_response_cache(request: Request) -> Optional[ResponseCache]:
+    return request.app.state.response_cache
+
+def get_tiles_service(request: Request) -> TilesService:
+    return request.app.state.tiles_service
+
+def get_tile_cache(request: Request) -> Optional[ResponseCache]:
+    return request.app.state.tile_cache
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Проверка If-None-Match (список тегов через запятую или *).
+
+    If-None-Match сравнивается слабо (RFC 9110, 13.1.2): W/"x" совпадает с "x",
+    поэтому префикс W/ отбрасывается.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+async def invalid_cursor_handler(request: Request, exc: InvalidCursorError) -> JSONResponse:
+    """Некорректный курсор пагинации - ошибка клиента"""
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+async def search_timeout_handler(request: Request, exc: SearchTimeoutError) -> JSONResponse:
+    """Поиск не уложился в бюджет времени - просим уточнить запрос"""
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+async def invalid_tile_handler(request: Request, exc: InvalidTileError) -> JSONResponse:
+    """Тайл вне сетки масштаба - ошибка клиента"""
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+async def cached_json_response(request: Request, cache: Optional[ResponseCache], key: tuple, produce) -> Response:
+    """Отдать сериализованный ответ из кэша или получить документ через produce и закэшировать.
+
+    Ответ несет сильный ETag, по If-None-Match возвращается 304 без тела.
+    """
+    entry = cache.get(key) if cache else None
+    status = "HIT"
+    if entry is None:
+        document = await produce()
+        if document is None:
+            raise HTTPException(status_code=404, detail="Organization not found")
+        body = to_json(document)
+        if cache is None:
+            return Response(content=body, media_type="application/json")
+        entry = cache.put(key, body)
+        status = "MISS"
+
+    headers = {"ETag": entry.etag, "X-Cache": status}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+@router.get("/by-building/{building_id}", response_model=OrganizationsPageResponse)
 async def get_organizations_by_building(
+    request: Request,
     building_id: UUID,
-    service: OrganizationsService = Depends(get_service)
+    limit: Limit = DEFAULT_PAGE_LIMIT,
+    cursor: Cursor = None,
+    projection: Projection = Depends(get_projection),
+    service: OrganizationsService = Depends(get_service),
+    cache: Optional[ResponseCache] = Depends(get_response_cache)
 ):
     """Получить организации по зданию"""
-    return await service.get_organizations_by_building(building_id)
+    return await cached_json_response(
+        request, cache, ("by-building", building_id, limit, cursor, projection),
+        lambda: service.get_organizations_by_building(building_id, limit, cursor, projection)
+    )
 
-@router.get("/by-activity/{activity_id}", response_model=List[OrganizationResponse])
+@router.get("/by-activity/{activity_id}", response_model=OrganizationsPageResponse)
 async def get_organizations_by_activity(
     activity_id: UUID,
+    limit: Limit = DEFAULT_PAGE_LIMIT,
+    cursor: Cursor = None,
+    projection: Projection = Depends(get_projection),
     service: OrganizationsService = Depends(get_service)
 ):
     """Получить организации по активности"""
-    return await service.get_organizations_by_activity(activity_id)
+    return DocumentResponse(await service.get_organizations_by_activity(activity_id, limit, cursor, projection))
 
-@router.get("/in-circle", response_model=List[OrganizationResponse])
+@router.get("/in-circle", response_model=OrganizationsPageResponse)
 async def get_organizations_in_circle(
     latitude: float = Query(..., description="Широта"),
     longitude: float = Query(..., description="Долгота"),
     radius: float = Query(..., description="Радиус поиска в метрах"),
+    limit: Limit = DEFAULT_PAGE_LIMIT,
+    cursor: Cursor = None,
+    projection: Projection = Depends(get_projection),
     service: OrganizationsService = Depends(get_service)
 ):
-    """Получить организации в радиусе от указанной точки"""
-    return await service.get_organizations_in_circle(latitude, longitude, radius)
+    """Получить организации в радиусе от указанной точки, ближайшие первыми"""
+    return DocumentResponse(await service.get_organizations_in_circle(latitude, longitude, radius, limit, cursor, projection))
 
-@router.get("/in-rectangle", response_model=List[OrganizationResponse])
+@router.get("/in-rectangle", response_model=OrganizationsPageResponse)
 async def get_organizations_in_rectangle(
     center_latitude: float = Query(..., description="Широта центра, например: 55.7558"),
     center_longitude: float = Query(..., description="Долгота центра, например: 37.6176"),
     width: float = Query(..., description="Ширина в метрах"),
     height: float = Query(..., description="Высота в метрах"),
+    limit: Limit = DEFAULT_PAGE_LIMIT,
+    cursor: Cursor = None,
+    projection: Projection = Depends(get_projection),
     service: OrganizationsService = Depends(get_service)
 ):
-    """Получить организации в прямоугольной области от указанной точки"""
-    return await service.get_organizations_in_rectangle(center_latitude, center_longitude, width, height)
+    """Получить организации в прямоугольной области от указанной точки, ближайшие к центру первыми"""
+    return DocumentResponse(await service.get_organizations_in_rectangle(center_latitude, center_longitude, width, height, limit, cursor, projection))
 
 @router.get("/by-id/{organization_id}", response_model=OrganizationResponse)
 async def get_organization_by_id(
+    request: Request,
     organization_id: UUID,
-    service: OrganizationsService = Depends(get_service)
+    projection: Projection = Depends(get_projection),
+    service: OrganizationsService = Depends(get_service),
+    cache: Optional[ResponseCache] = Depends(get_response_cache)
 ):
     """Получить организацию по ID"""
-    organization = await service.get_organization_by_id(organization_id)
-    if not organization:
-        raise HTTPException(status_code=404, detail="Organization not found")
-    return organization
+    return await cached_json_response(
+        request, cache, ("by-id", organization_id, projection),
+        lambda: service.get_organization_by_id(organization_id, projection)
+    )
+
+@router.post("/batch", response_model=OrganizationsBatchResponse)
+async def get_organizations_batch(
+    batch: OrganizationsBatchRequest,
+    projection: Projection = Depends(get_projection),
+    service: OrganizationsService = Depends(get_service),
+    cache: Optional[ResponseCache] = Depends(get_response_cache)
+):
+    """Получить организации по списку ID одним запросом.
 
-@router.get("/by-activity-type/{activity_id}", response_model=List[OrganizationResponse])
+    Порядок ответа совпадает с порядком запроса (повторы схлопываются),
+    ненайденные ID перечислены в missing. Организации, уже лежащие в кэше
+    by-id, берутся из него, остальные загружаются одним запросом и кэшируются.
+    """
+    organization_ids = list(dict.fromkeys(batch.ids))
+
+    bodies = {}
+    if cache:
+        for organization_id in organization_ids:
+            entry = cache.get(("by-id", organization_id, projection))
+            if entry:
+                bodies[organization_id] = entry.body
+
+    to_load = [organization_id for organization_id in organization_ids if organization_id not in bodies]
+    if to_load:
+        loaded = await service.get_organizations_by_ids(to_load, projection)
+        for organization_id, organization in loaded.items():
+            body = to_json(organization)
+            bodies[organization_id] = cache.put(("by-id", organization_id, projection), body).body if cache else body
+
+    # Тело собирается из готовых фрагментов без повторной сериализации
+    items = b",".join(bodies[organization_id] for organization_id in organization_ids if organization_id in bodies)
+    missing = json.dumps([str(organization_id) for organization_id in organization_ids if organization_id not in bodies])
+    return Response(
+        content=b'{"items":[' + items + b'],"missing":' + missing.encode() + b"}",
+        media_type="application/json"
+    )
+
+@router.get("/by-activity-type/{activity_id}", response_model=OrganizationsPageResponse)
 async def get_organizations_by_activity_type(
     activity_id: UUID,
+    limit: Limit = DEFAULT_PAGE_LIMIT,
+    cursor: Cursor = None,
+    projection: Projection = Depends(get_projection),
     service: OrganizationsService = Depends(get_service)
 ):
     """Получить организации по типу активности"""
-    return await service.get_organizations_by_activity_type(activity_id)
+    return DocumentResponse(await service.get_organizations_by_activity_type(activity_id, limit, cursor, projection))
+
+@router.get("/search", response_model=OrganizationsPageResponse)
+async def search_organizations(
+    q: str = Query(..., min_length=3, max_length=200, description="Начало или часть названия организации"),
+    limit: Limit = DEFAULT_PAGE_LIMIT,
+    cursor: Cursor = None,
+    projection: Projection = Depends(get_projection),
+    service: OrganizationsService = Depends(get_service)
+):
+    """Поиск организаций по префиксу и схожести названия, самые похожие первыми"""
+    return DocumentResponse(await service.search_organizations(q, limit, cursor, projection))
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_organizations(
+    building_id: Optional[UUID] = Query(None, description="Только организации в здании"),
+    activity_id: Optional[UUID] = Query(None, description="Только организации с деятельностью из поддерева"),
+    latitude: Optional[float] = Query(None, description="Широта центра круга"),
+    longitude: Optional[float] = Query(None, description="Долгота центра круга"),
+    radius: Optional[float] = Query(None, description="Радиус круга в метрах"),
+    projection: Projection = Depends(get_projection),
+    service: OrganizationsService = Depends(get_service)
+):
+    """Выгрузить организации в формате NDJSON (по одной на строку, по возрастанию id).
+
+    Ответ передается потоком: следующая часть читается из базы только после
+    отправки предыдущей, поэтому память не зависит от объема выгрузки.
+    """
+    circle_parameters = (latitude, longitude, radius)
+    if any(value is None for value in circle_parameters) and any(value is not None for value in circle_parameters):
+        raise HTTPException(status_code=400, detail="latitude, longitude and radius must be set together")
+    circle = circle_parameters if radius is not None else None
+
+    return StreamingResponse(
+        service.export_organizations(building_id, activity_id, circle, projection),
+        media_type="application/x-ndjson"
+    )
+
+@router.get("/count/by-activity-type/{activity_id}", response_model=OrganizationsCountResponse)
+async def count_organizations_by_activity_type(
+    activity_id: UUID,
+    service: OrganizationsService = Depends(get_service)
+):
+    """Число организаций с деятельностью из поддерева, включая саму деятельность"""
+    return DocumentResponse(await service.count_organizations_by_activity_type(activity_id))
+
+@router.get("/count/by-building/{building_id}", response_model=OrganizationsCountResponse)
+async def count_organizations_by_building(
+    building_id: UUID,
+    service: OrganizationsService = Depends(get_service)
+):
+    """Число организаций в здании"""
+    return DocumentResponse(await service.count_organizations_by_building(building_id))
+
+@router.get("/count/in-circle", response_model=OrganizationsCountResponse)
+async def count_organizations_in_circle(
+    latitude: float = Query(..., description="Широта"),
+    longitude: float = Query(..., description="Долгота"),
+    radius: float = Query(..., description="Радиус поиска в метрах"),
+    service: OrganizationsService = Depends(get_service)
+):
+    """Число организаций в радиусе от указанной точки"""
+    return DocumentResponse(await service.count_organizations_in_circle(latitude, longitude, radius))
+
+@router.get("/count/in-rectangle", response_model=OrganizationsCountResponse)
+async def count_organizations_in_rectangle(
+    center_latitude: float = Query(..., description="Широта центра, например: 55.7558"),
+    center_longitude: float = Query(..., description="Долгота центра, например: 37.6176"),
+    width: float = Query(..., description="Ширина в метрах"),
+    height: float = Query(..., description="Высота в метрах"),
+    service: OrganizationsService = Depends(get_service)
+):
+    """Число организаций в прямоугольной области от указанной точки"""
+    return DocumentResponse(await service.count_organizations_in_rectangle(center_latitude, center_longitude, width, height))
 
 @router.get("/by-name/{name}", response_model=OrganizationResponse)
 async def get_organization_by_name(
     name: str,
+    projection: Projection = Depends(get_projection),
     service: OrganizationsService = Depends(get_service)
 ):
     """Получить организацию по имени"""
-    organization = await service.get_organization_by_name(name)
+    organization = await service.get_organization_by_name(name, projection)
     if not organization:
         raise HTTPException(status_code=404, detail="Organization not found")
-    return organization
+    return DocumentResponse(organization)
+
+
+@activities_router.get("/tree", response_model=List[ActivityTreeNodeResponse])
+async def get_activities_tree(
+    request: Request,
+    activity_tree: ActivityTreeCache = Depends(get_activity_tree)
+):
+    """Получить дерево видов деятельности целиком"""
+    tree = activity_tree.tree
+    etag = f'"{tree.version}"'
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=tree.json, media_type="application/json", headers={"ETag": etag})
+
+
+@tiles_router.get(
+    "/{z}/{x}/{y}.mvt",
+    response_class=Response,
+    responses={200: {"content": {"application/vnd.mapbox-vector-tile": {}}}}
+)
+async def get_tile(
+    request: Request,
+    z: int = Path(..., ge=0, le=MAX_ZOOM, description="Масштаб"),
+    x: int = Path(..., ge=0, description="Номер тайла по горизонтали"),
+    y: int = Path(..., ge=0, description="Номер тайла по вертикали, сверху вниз"),
+    activity_id: List[UUID] = Query([], description="Только организации с деятельностью из поддеревьев, можно несколько"),
+    service: TilesService = Depends(get_tiles_service),
+    cache: Optional[ResponseCache] = Depends(get_tile_cache)
+):
+    """Векторный тайл зданий (Mapbox Vector Tile).
+
+    На мелких масштабах - слой clusters (число зданий и организаций в ячейке сетки),
+    на крупных - слой buildings (здание, адрес, число организаций). Тайлы кэшируются
+    по (z, x, y, фильтр) и отдаются с ETag.
+    """
+    activity_ids = sorted(set(activity_id))
+    key = ("tile", z, x, y, tuple(activity_ids))
+    entry = cache.get(key) if cache else None
+    status = "HIT"
+    if entry is None:
+        body = await service.get_tile(z, x, y, activity_ids)
+        if cache is None:
+            return Response(content=body, media_type="application/vnd.mapbox-vector-tile")
+        entry = cache.put(key, body)
+        status = "MISS"
 
+    headers = {"ETag": entry.etag, "X-Cache": status}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/vnd.mapbox-vector-tile", headers=headers)
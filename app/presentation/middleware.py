@@ -1,24 +1,114 @@
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+import hmac
+import time
+from typing import Iterable
+
 from fastapi.responses import JSONResponse
-import os
-
-class AuthMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app):
-        super().__init__(app)
-        self.api_key = os.getenv("API_KEY")
-    
-    async def dispatch(self, request: Request, call_next):
-        # Пропускаем документацию и health checks
-        if request.url.path in ["/docs", "/redoc", "/openapi.json", "/health"]:
-            return await call_next(request)
-        
-        # Проверяем API ключ
-        api_key = request.headers.get("X-API-Key")
-        if not api_key or api_key != self.api_key:
-            return JSONResponse(
-                status_code=401,
-                content={"detail": "Invalid API key"}
-            )
-        
-        return await call_next(request)
\ No newline at end of file
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.database.query_timing import QueryTimer, current_query_timer
+from app.metrics import HTTP_REQUEST_DURATION, HTTP_RESPONSE_SIZE, route_template
+
+class AuthMiddleware:
+    """Проверка статического API ключа из заголовка X-API-Key.
+
+    Чистый ASGI: без BaseHTTPMiddleware нет лишней задачи и обертки потока
+    ответа на каждый запрос, стриминговые ответы проходят как есть.
+    """
+
+    # Документация и health checks доступны без ключа
+    EXCLUDED_PATHS = frozenset({"/docs", "/redoc", "/openapi.json", "/health", "/metrics"})
+
+    def __init__(self, app: ASGIApp, api_keys: Iterable[str]):
+        self.app = app
+        self.api_keys = [key.encode() for key in api_keys if key]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.EXCLUDED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        api_key = next((value for name, value in scope["headers"] if name == b"x-api-key"), None)
+        if api_key is None or not self._is_valid(api_key):
+            response = JSONResponse(status_code=401, content={"detail": "Invalid API key"})
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
+
+    def _is_valid(self, api_key: bytes) -> bool:
+        """Сравнение за постоянное время со всеми ключами, без раннего выхода"""
+        valid = False
+        for expected in self.api_keys:
+            valid |= hmac.compare_digest(api_key, expected)
+        return valid
+
+
+class ServerTimingMiddleware:
+    """Заголовок Server-Timing: время в базе (db), число запросов и общее время до начала ответа (app).
+
+    Нужен нагрузочным тестам, чтобы отделять время базы от времени приложения.
+    Для потоковых ответов учитывается только работа до отправки заголовков.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = QueryTimer()
+        started = time.perf_counter()
+
+        async def send_with_timing(message: Message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    f'db;dur={timer.seconds * 1000:.2f};desc="{timer.queries} queries", app;dur={elapsed * 1000:.2f}'
+                )
+            await send(message)
+
+        token = current_query_timer.set(timer)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_query_timer.reset(token)
+
+
+class MetricsMiddleware:
+    """Гистограммы задержки и размера ответа по шаблону роута.
+
+    Шаблон (например, /organizations/by-id/{organization_id}) известен только
+    после маршрутизации, поэтому метрики пишутся по завершении ответа.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_with_metrics(message: Message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            route = route_template(scope)
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, scope["method"], route, str(status))
+            HTTP_RESPONSE_SIZE.observe(size, scope["method"], route)
@@ -2,6 +2,9 @@ from pydantic import BaseModel, Field
 from uuid import UUID
 from typing import List, Optional
 
+# Максимум идентификаторов в одном пакетном запросе
+MAX_BATCH_IDS = 5000
+
 class LocationResponse(BaseModel):
     """Схема для геолокации"""
     latitude: float = Field(description="Широта")
@@ -23,19 +26,46 @@ class ActivityResponse(BaseModel):
     parent_id: Optional[UUID] = None
     level: int
 
+class ActivityTreeNodeResponse(ActivityResponse):
+    """Узел дерева видов деятельности"""
+    children: List["ActivityTreeNodeResponse"] = []
+
 class OrganizationPhoneResponse(BaseModel):
     """Схема для телефона организации"""
     id: UUID
     phone: str
 
 class OrganizationResponse(BaseModel):
-    """Схема для организации"""
+    """Схема для организации.
+
+    Документ разреженный: с параметрами fields и expand в нем только id и
+    запрошенные поля, поэтому все поля, кроме id, необязательны. Без
+    параметров возвращаются все поля.
+    """
     id: UUID
-    name: str
-    building_id: UUID
-    building: Optional[BuildingResponse] = None
-    phones: List[OrganizationPhoneResponse] = []
-    activities: List[ActivityResponse] = []
+    name: Optional[str] = Field(default=None, description="Нет в ответе, если name не указан в fields")
+    building_id: Optional[UUID] = Field(default=None, description="Нет в ответе, если building_id не указан в fields")
+    building: Optional[BuildingResponse] = Field(default=None, description="Нет в ответе, если building не указан в expand")
+    phones: List[OrganizationPhoneResponse] = Field(default=[], description="Нет в ответе, если phones не указан в expand")
+    activities: List[ActivityResponse] = Field(default=[], description="Нет в ответе, если activities не указан в expand")
 
     class Config:
         from_attributes = True
+
+class OrganizationsPageResponse(BaseModel):
+    """Страница списка организаций"""
+    items: List[OrganizationResponse] = []
+    next_cursor: Optional[str] = Field(default=None, description="Курсор следующей страницы, null если страница последняя")
+
+class OrganizationsCountResponse(BaseModel):
+    """Число организаций, посчитанное по счетчикам без загрузки организаций"""
+    count: int
+
+class OrganizationsBatchRequest(BaseModel):
+    """Пакетный запрос организаций по ID"""
+    ids: List[UUID] = Field(min_length=1, max_length=MAX_BATCH_IDS, description="ID организаций, порядок сохраняется в ответе")
+
+class OrganizationsBatchResponse(BaseModel):
+    """Найденные организации в порядке запроса и ID, которых нет в базе"""
+    items: List[OrganizationResponse] = []
+    missing: List[UUID] = []
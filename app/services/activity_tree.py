@@ -0,0 +1,125 @@
+"""Кэш дерева видов деятельности в памяти приложения"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from uuid import UUID
+
+from app.database.repositories.activities import ActivitiesRepository
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ActivityTree:
+    """Неизменяемый снимок дерева деятельностей"""
+    nodes: Dict[UUID, dict]
+    parents: Dict[UUID, Optional[UUID]]
+    children: Dict[UUID, Tuple[UUID, ...]]
+    # Поддерево каждого узла, включая сам узел
+    descendants: Dict[UUID, FrozenSet[UUID]]
+    # Дерево целиком, заранее сериализованное для GET /activities/tree
+    json: bytes
+    # Хэш содержимого: меняется при любом изменении дерева
+    version: str
+    loaded_at: float
+
+    @classmethod
+    def build(cls, rows: List[tuple]) -> "ActivityTree":
+        nodes = {
+            row[0]: {"id": str(row[0]), "name": row[1], "parent_id": str(row[2]) if row[2] else None, "level": row[3]}
+            for row in rows
+        }
+        parents = {row[0]: row[2] for row in rows}
+        children: Dict[UUID, List[UUID]] = {activity_id: [] for activity_id in nodes}
+        roots = []
+        for row in rows:
+            activity_id, parent_id = row[0], row[2]
+            if parent_id in children:
+                children[parent_id].append(activity_id)
+            else:
+                roots.append(activity_id)
+
+        descendants: Dict[UUID, FrozenSet[UUID]] = {}
+
+        def collect(activity_id: UUID) -> FrozenSet[UUID]:
+            subtree = {activity_id}
+            for child_id in children[activity_id]:
+                subtree |= collect(child_id)
+            descendants[activity_id] = frozenset(subtree)
+            return descendants[activity_id]
+
+        def serialize(activity_id: UUID) -> dict:
+            return {**nodes[activity_id], "children": [serialize(child_id) for child_id in children[activity_id]]}
+
+        for root_id in roots:
+            collect(root_id)
+
+        canonical = json.dumps(sorted(nodes.values(), key=lambda node: node["id"]), ensure_ascii=False)
+        return cls(
+            nodes=nodes,
+            parents=parents,
+            children={activity_id: tuple(ids) for activity_id, ids in children.items()},
+            descendants=descendants,
+            json=json.dumps([serialize(root_id) for root_id in roots], ensure_ascii=False).encode(),
+            version=hashlib.sha1(canonical.encode()).hexdigest()[:16],
+            loaded_at=time.time()
+        )
+
+
+class ActivityTreeCache:
+    """Владелец снимка дерева: загрузка при старте, перезагрузка и проверка устаревания.
+
+    Вместе со снимком хранится штамп таблицы activities (число строк и
+    наибольший xmin). Периодическая проверка читает только штамп и перечитывает
+    дерево, когда он изменился, так что снимок отстает от базы не дольше
+    интервала проверки. Узла, появившегося после загрузки, в снимке нет -
+    для него сервис идет в таблицу замыкания.
+    """
+
+    def __init__(self, repository: ActivitiesRepository):
+        self.repository = repository
+        self.tree: Optional[ActivityTree] = None
+        self.stamp: Optional[Tuple[int, int]] = None
+        self._reload_lock = asyncio.Lock()
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.tree.version if self.tree else None
+
+    async def reload(self) -> bool:
+        """Перечитать дерево; возвращает True, если версия изменилась"""
+        async with self._reload_lock:
+            # Штамп читается до строк: изменение между ними заметит следующая проверка
+            stamp = await self.repository.tree_stamp()
+            tree = ActivityTree.build(await self.repository.all_activities())
+            changed = self.tree is None or tree.version != self.tree.version
+            if changed:
+                self.tree = tree
+                logger.info("Activity tree loaded: %d activities, version %s", len(tree.nodes), tree.version)
+            self.stamp = stamp
+            return changed
+
+    async def check(self) -> bool:
+        """Перечитать дерево, если штамп таблицы изменился; возвращает True, если изменилась версия"""
+        if self.stamp is not None and await self.repository.tree_stamp() == self.stamp:
+            return False
+        return await self.reload()
+
+    async def reload_periodically(self, interval: float):
+        """Фоновая проверка устаревания; ошибки не останавливают цикл"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Activity tree reload failed, keeping version %s", self.version)
+
+    def subtree(self, activity_id: UUID) -> Optional[FrozenSet[UUID]]:
+        """Идентификаторы поддерева или None, если узла нет в снимке"""
+        if self.tree is None:
+            return None
+        return self.tree.descendants.get(activity_id)
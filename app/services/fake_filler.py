@@ -1,179 +1,279 @@
+import asyncio
+import hashlib
+import os
 import random
-from uuid import uuid4
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
+from uuid import UUID
 from faker import Faker
-from geoalchemy2 import WKTElement
 
 from app.database.db_helper import AsyncDatabaseHelper
-from app.database.models import (
-    Building, 
-    Activity, 
-    Organization, 
-    OrganizationPhone
-)
-from app.database.repositories.fake_filler import FakeFillerRepository
+from app.database.models import Activity
+from app.database.repositories.fake_filler import BulkLoader, FakeFillerRepository
+
+# Строк в одном шарде генерации. Не зависит от числа процессов и размера пакета COPY,
+# поэтому набор данных определяется только зерном и объемом
+SHARD_SIZE = 10000
+
+# Координаты для Москвы (примерно)
+MOSCOW_LAT_RANGE = (55.5, 55.9)
+MOSCOW_LON_RANGE = (37.3, 37.9)
+
+_faker: Optional[Faker] = None
+
+
+def derived_seed(seed: int, kind: str, index: int) -> int:
+    """Зерно шарда: одно и то же для (seed, kind, index) в любом процессе"""
+    digest = hashlib.blake2b(f"{seed}:{kind}:{index}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def derived_uuid(seed: int, kind: str, index: int) -> UUID:
+    """UUID записи, вычисляемый по номеру: организациям не нужен список зданий"""
+    digest = hashlib.blake2b(f"{seed}:{kind}:{index}".encode(), digest_size=16).digest()
+    return UUID(bytes=digest, version=4)
+
+
+def random_uuid(rng: random.Random) -> UUID:
+    return UUID(int=rng.getrandbits(128), version=4)
+
+
+def seeded_faker(seed: int) -> Faker:
+    """Faker процесса (создается один раз), переинициализированный зерном шарда"""
+    global _faker
+    if _faker is None:
+        _faker = Faker(['ru_RU'])  # Русская локализация
+    _faker.seed_instance(seed)
+    return _faker
+
+
+def generate_buildings_shard(seed: int, shard: int, start: int, count: int) -> List[tuple]:
+    """Здания start..start+count: (id, address, longitude, latitude)"""
+    shard_seed = derived_seed(seed, "buildings", shard)
+    rng = random.Random(shard_seed)
+    fake = seeded_faker(shard_seed)
+    return [
+        (
+            derived_uuid(seed, "building", index),
+            fake.address(),
+            # Генерируем случайные координаты в пределах Москвы
+            rng.uniform(*MOSCOW_LON_RANGE),
+            rng.uniform(*MOSCOW_LAT_RANGE)
+        )
+        for index in range(start, start + count)
+    ]
+
+
+def generate_organizations_shard(
+    seed: int,
+    shard: int,
+    count: int,
+    buildings_count: int,
+    activity_ids: List[UUID]
+) -> Tuple[List[tuple], List[tuple], List[tuple]]:
+    """Организации шарда с телефонами и связями с видами деятельности"""
+    shard_seed = derived_seed(seed, "organizations", shard)
+    rng = random.Random(shard_seed)
+    fake = seeded_faker(shard_seed)
+
+    organizations = []
+    organization_phones = []
+    org_activity_relations = []
+    for _ in range(count):
+        organization_id = random_uuid(rng)
+        # Выбираем случайное здание
+        building_id = derived_uuid(seed, "building", rng.randrange(buildings_count))
+        organizations.append((organization_id, fake.company(), building_id))
+
+        # Добавляем 1-3 телефона для каждой организации
+        for _ in range(rng.randint(1, 3)):
+            organization_phones.append((random_uuid(rng), organization_id, fake.phone_number()))
+
+        # Связываем организацию с 1-5 видами деятельности
+        for activity_id in rng.sample(activity_ids, rng.randint(1, 5)):
+            org_activity_relations.append((organization_id, activity_id))
+
+    return organizations, organization_phones, org_activity_relations
+
+
+def shards(count: int) -> Iterable[Tuple[int, int, int]]:
+    """(номер шарда, первая строка, число строк)"""
+    for shard, start in enumerate(range(0, count, SHARD_SIZE)):
+        yield shard, start, min(SHARD_SIZE, count - start)
 
 
 class FakeFiller():
-    def __init__(self, db_helper: AsyncDatabaseHelper):
-        self.fake = Faker(['ru_RU'])  # Русская локализация
+    def __init__(self, db_helper: AsyncDatabaseHelper, seed: Optional[int] = None, workers: Optional[int] = None):
+        # Без зерна выбираем случайное и печатаем его, чтобы набор можно было повторить
+        self.seed = seed if seed is not None else random.randrange(2**31)
+        self.workers = workers or os.cpu_count() or 1
         self.db_helper = db_helper
         self.repository = FakeFillerRepository(db_helper)
 
     async def create_activities(self, count: int = 50):
         """Создает виды деятельности с иерархической структурой"""
         activities = []
-        
+        fake = seeded_faker(derived_seed(self.seed, "activities", 0))
+
         # Создаем основные категории (родительские)
         main_categories = [
             "Образование", "Медицина", "Торговля", "Общепит", "Услуги",
             "Производство", "Строительство", "Транспорт", "Финансы", "IT"
         ]
-        
+
         parent_activities = []
         for category in main_categories:
             activity = Activity(
-                id=uuid4(),
+                id=derived_uuid(self.seed, "activity", len(activities)),
                 name=category,
                 parent_id=None,
                 level=1
             )
             activities.append(activity)
             parent_activities.append(activity)
-        
+
         # Создаем подкатегории для каждой основной категории
         subcategories_per_category = count // len(main_categories)
         for parent in parent_activities:
             for _ in range(subcategories_per_category):
                 subcategory = Activity(
-                    id=uuid4(),
-                    name=self.fake.catch_phrase(),
+                    id=derived_uuid(self.seed, "activity", len(activities)),
+                    name=fake.catch_phrase(),
                     parent_id=parent.id,
                     level=2
                 )
                 activities.append(subcategory)
-        
+
         created_activities = await self.repository.create_activities(activities)
         print(f"Создано {len(created_activities)} видов деятельности")
-        
+
         # Выводим первые 5 UUID видов деятельности
         print("📋 Примеры UUID видов деятельности:")
         for i, activity in enumerate(created_activities[:5]):
             print(f"   {i+1}. {activity.id}")
-        
+
         return created_activities
 
-    async def create_buildings(self, count: int = 2000):
+    async def create_buildings(self, executor: ProcessPoolExecutor, loader: BulkLoader, count: int = 2000):
         """Создает здания с адресами и геолокацией"""
-        buildings = []
-        
-        # Координаты для Москвы (примерно)
-        moscow_lat_range = (55.5, 55.9)
-        moscow_lon_range = (37.3, 37.9)
-        
-        for _ in range(count):
-            # Генерируем случайные координаты в пределах Москвы
-            latitude = random.uniform(*moscow_lat_range)
-            longitude = random.uniform(*moscow_lon_range)
-            
-            # Создаем геометрию точки
-            location = WKTElement(f'POINT({longitude} {latitude})', srid=4326)
-            
-            building = Building(
-                id=uuid4(),
-                address=self.fake.address(),
-                location=location
-            )
-            buildings.append(building)
-        
-        created_buildings = await self.repository.create_buildings(buildings)
-        print(f"Создано {len(created_buildings)} зданий")
-        
+        examples = []
+
+        async def load(records: List[tuple]):
+            await loader.copy_buildings(records)
+            examples.extend(record[0] for record in records[:5 - len(examples)])
+
+        await self._generate(
+            executor,
+            generate_buildings_shard,
+            [(self.seed, shard, start, size) for shard, start, size in shards(count)],
+            load
+        )
+
+        print(f"Создано {count} зданий")
+
         # Выводим первые 5 UUID зданий
         print("🏢 Примеры UUID зданий:")
-        for i, building in enumerate(created_buildings[:5]):
-            print(f"   {i+1}. {building.id}")
-        
-        return created_buildings
+        for i, building_id in enumerate(examples):
+            print(f"   {i+1}. {building_id}")
 
-    async def create_organizations(self, buildings: list, activities: list, count: int = 10000):
+    async def create_organizations(
+        self,
+        executor: ProcessPoolExecutor,
+        loader: BulkLoader,
+        buildings_count: int,
+        activity_ids: List[UUID],
+        count: int = 10000
+    ):
         """Создает организации с телефонами и связями с видами деятельности"""
-        organizations = []
-        organization_phones = []
-        org_activity_relations = []
-        
-        # Получаем все активности из БД
-        all_activities = await self.repository.get_all_activities()
-        
-        for i in range(count):
-            # Выбираем случайное здание
-            building = random.choice(buildings)
-            
-            # Создаем организацию
-            organization = Organization(
-                id=uuid4(),
-                name=self.fake.company(),
-                building_id=building.id
-            )
-            organizations.append(organization)
-            
-            # Добавляем 1-3 телефона для каждой организации
-            phone_count = random.randint(1, 3)
-            for _ in range(phone_count):
-                phone = OrganizationPhone(
-                    id=uuid4(),
-                    organization_id=organization.id,
-                    phone=self.fake.phone_number()
-                )
-                organization_phones.append(phone)
-            
-            # Связываем организацию с 1-5 видами деятельности
-            activity_count = random.randint(1, 5)
-            selected_activities = random.sample(all_activities, activity_count)
-            
-            for activity in selected_activities:
-                relation = {
-                    'organization_id': organization.id,
-                    'activity_id': activity.id
-                }
-                org_activity_relations.append(relation)
-        
-        # Создаем все данные через репозиторий
-        created_organizations = await self.repository.create_organizations(organizations)
-        await self.repository.create_organization_phones(organization_phones)
-        await self.repository.create_organization_activity_relations(org_activity_relations)
-        
-        print(f"Создано {len(created_organizations)} организаций с телефонами и связями")
-        
+        examples = []
+
+        async def load(shard: Tuple[List[tuple], List[tuple], List[tuple]]):
+            organizations, organization_phones, org_activity_relations = shard
+            await loader.copy("organizations", ("id", "name", "building_id"), organizations)
+            await loader.copy("organization_phones", ("id", "organization_id", "phone"), organization_phones)
+            await loader.copy("organization_activities", ("organization_id", "activity_id"), org_activity_relations)
+            examples.extend(row[0] for row in organizations[:5 - len(examples)])
+
+        await self._generate(
+            executor,
+            generate_organizations_shard,
+            [(self.seed, shard, size, buildings_count, activity_ids) for shard, _, size in shards(count)],
+            load
+        )
+
+        print(f"Создано {count} организаций с телефонами и связями")
+
         # Выводим первые 5 UUID организаций
         print("🏢 Примеры UUID организаций:")
-        for i, organization in enumerate(created_organizations[:5]):
-            print(f"   {i+1}. {organization.id}")
-        
-        return created_organizations
+        for i, organization_id in enumerate(examples):
+            print(f"   {i+1}. {organization_id}")
 
     async def clear_database(self):
         """Очищает базу данных от существующих данных"""
         await self.repository.clear_all_tables()
         print("База данных очищена")
 
-    async def fill_database(self, organizations_count: int = 10000):
-        """Основной метод для заполнения базы данных"""
+    async def fill_database(self, organizations_count: int = 10000, buildings_count: int = 2000, batch_size: int = 10000):
+        """Основной метод для заполнения базы данных.
+
+        Шарды генерируются параллельно в пуле процессов и по мере готовности
+        загружаются через COPY пакетами по batch_size строк; индексы и внешние
+        ключи пересоздаются после загрузки.
+        """
         try:
+            print(f"Зерно генерации: {self.seed}, процессов: {self.workers}")
+
             # Очищаем базу данных
             await self.clear_database()
-            
+
             # Создаем данные
             print("Создание видов деятельности...")
             activities = await self.create_activities(50)
-            
-            print("Создание зданий...")
-            buildings = await self.create_buildings(2000)
-            
-            print("Создание организаций...")
-            organizations = await self.create_organizations(buildings, activities, organizations_count)
-            
+            activity_ids = [activity.id for activity in activities]
+
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                async with self.repository.bulk_loader(batch_size) as loader:
+                    print("Создание зданий...")
+                    await self.create_buildings(executor, loader, buildings_count)
+
+                    print("Создание организаций...")
+                    await self.create_organizations(executor, loader, buildings_count, activity_ids, organizations_count)
+
             print(f"\n✅ Заполнение базы данных завершено!")
-            
+
         except Exception as e:
             print(f"❌ Ошибка при заполнении базы данных: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    async def _generate(self, executor: ProcessPoolExecutor, generate: Callable, shard_args: List[tuple], load: Callable):
+        """Генерация шардов в пуле процессов с загрузкой по мере готовности.
+
+        Одновременно генерируется не больше workers шардов, и готовые ждут
+        загрузки в очереди того же размера: если загрузка отстает, генерация
+        приостанавливается, и память ограничена 2 * workers шардами.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers)
+
+        async def produce():
+            try:
+                pending = deque()
+                for args in shard_args:
+                    pending.append(loop.run_in_executor(executor, generate, *args))
+                    if len(pending) >= self.workers:
+                        await queue.put(await pending.popleft())
+                while pending:
+                    await queue.put(await pending.popleft())
+                await queue.put(None)
+            except Exception as e:
+                await queue.put(e)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while (shard := await queue.get()) is not None:
+                if isinstance(shard, Exception):
+                    raise shard
+                await load(shard)
+        finally:
+            producer.cancel()
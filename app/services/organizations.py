@@ -1,113 +1,215 @@
-from app.database.repositories.organisations import OrganizationsRepository
-from app.schemas import OrganizationResponse
+from app.database.repositories.organisations import FULL_PROJECTION, OrganizationsRepository, Page, Projection
+from app.services.pagination import encode_cursor, decode_id_cursor, decode_distance_cursor, decode_similarity_cursor
+from app.services.activity_tree import ActivityTreeCache
+from app.services.single_flight import SingleFlight, coalesced
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Tuple
 from uuid import UUID
-from geoalchemy2.elements import WKBElement
+
+from pydantic_core import to_json
+
+if TYPE_CHECKING:
+    # Индекс (numpy) импортируется только при включенном spatial_index_enabled
+    from app.services.spatial_index import BuildingSpatialIndex
 
 class OrganizationsService: 
-    def __init__(self, repository: OrganizationsRepository):
+    """Чтение организаций для API.
+
+    Методы, помеченные coalesced, при заданном single_flight выполняют
+    одинаковые одновременные вызовы один раз: всплеск запросов к популярному
+    зданию или деятельности занимает одно соединение пула, а не по одному на запрос.
+    """
+
+    def __init__(
+        self,
+        repository: OrganizationsRepository,
+        spatial_index: Optional["BuildingSpatialIndex"] = None,
+        activity_tree: Optional[ActivityTreeCache] = None,
+        single_flight: Optional[SingleFlight] = None,
+        search_similarity_threshold: float = 0.3,
+        search_timeout_ms: int = 1000,
+        export_chunk_size: int = 1000
+    ):
         self.repository = repository
+        self.spatial_index = spatial_index
+        self.activity_tree = activity_tree
+        self.single_flight = single_flight
+        self.search_similarity_threshold = search_similarity_threshold
+        self.search_timeout_ms = search_timeout_ms
+        self.export_chunk_size = export_chunk_size
     
-    async def get_organizations_by_building(self, building_id: UUID):
+    @coalesced
+    async def get_organizations_by_building(self, building_id: UUID, limit: int, cursor: Optional[str] = None, projection: Projection = FULL_PROJECTION):
         """Получить организации по зданию"""
-        organizations = await self.repository.organizations_by_building(building_id)
-        return self._convert_organizations_to_response(organizations)
+        page = await self.repository.organizations_by_building(building_id, limit, decode_id_cursor(cursor), projection)
+        return self._convert_page_to_response(page, projection)
         
-    async def get_organizations_by_activity(self, activity_id: UUID):
+    @coalesced
+    async def get_organizations_by_activity(self, activity_id: UUID, limit: int, cursor: Optional[str] = None, projection: Projection = FULL_PROJECTION):
         """Получить организации по активности"""
-        organizations = await self.repository.organizations_by_activity(activity_id)
-        return self._convert_organizations_to_response(organizations)
+        page = await self.repository.organizations_by_activity(activity_id, limit, decode_id_cursor(cursor), projection)
+        return self._convert_page_to_response(page, projection)
         
-    async def get_organizations_in_circle(self, latitude: float, longitude: float, radius: float):
+    @coalesced
+    async def get_organizations_in_circle(self, latitude: float, longitude: float, radius: float, limit: int, cursor: Optional[str] = None, projection: Projection = FULL_PROJECTION):
         """Получить организации в радиусе от указанной точки"""
-        organizations = await self.repository.organizations_in_circle(latitude, longitude, radius)
-        return self._convert_organizations_to_response(organizations)
+        after = decode_distance_cursor(cursor)
+        if self.spatial_index and self.spatial_index.ready:
+            building_ids = self.spatial_index.circle(latitude, longitude, radius)
+            page = await self.repository.organizations_in_circle(latitude, longitude, radius, limit, after, building_ids, projection)
+        else:
+            page = await self.repository.organizations_in_circle(latitude, longitude, radius, limit, after, projection=projection)
+        return self._convert_page_to_response(page, projection)
         
-    async def get_organizations_in_rectangle(self, center_latitude: float, center_longitude: float, width: float, height: float):
+    @coalesced
+    async def get_organizations_in_rectangle(self, center_latitude: float, center_longitude: float, width: float, height: float, limit: int, cursor: Optional[str] = None, projection: Projection = FULL_PROJECTION):
         """Получить организации в прямоугольной области от указанной точки"""
-        organizations = await self.repository.organizations_in_rectangle(center_latitude, center_longitude, width, height)
-        return self._convert_organizations_to_response(organizations)
+        after = decode_distance_cursor(cursor)
+        if self.spatial_index and self.spatial_index.ready:
+            building_ids = self.spatial_index.rectangle(center_latitude, center_longitude, width, height)
+            page = await self.repository.organizations_in_rectangle(center_latitude, center_longitude, width, height, limit, after, building_ids, projection)
+        else:
+            page = await self.repository.organizations_in_rectangle(center_latitude, center_longitude, width, height, limit, after, projection=projection)
+        return self._convert_page_to_response(page, projection)
         
-    async def get_organization_by_id(self, organization_id: UUID):
+    @coalesced
+    async def get_organization_by_id(self, organization_id: UUID, projection: Projection = FULL_PROJECTION):
         """Получить организацию по ID"""
-        organization = await self.repository.organization_by_id(organization_id)
+        organization = await self.repository.organization_by_id(organization_id, projection)
         if organization:
-            return self._convert_organizations_to_response([organization])[0]
+            return self._convert_organizations_to_response([organization], projection)[0]
         return None
         
-    async def get_organizations_by_activity_type(self, activity_id: UUID):
+    async def get_organizations_by_ids(self, organization_ids: List[UUID], projection: Projection = FULL_PROJECTION) -> Dict[UUID, dict]:
+        """Получить организации по списку ID; отсутствующих в базе нет в результате"""
+        organizations = await self.repository.organizations_by_ids(organization_ids, projection)
+        return {
+            # У документов JSON-движка id - строка
+            organization["id"] if isinstance(organization["id"], UUID) else UUID(organization["id"]): organization
+            for organization in self._convert_organizations_to_response(organizations, projection)
+        }
+        
+    @coalesced
+    async def get_organizations_by_activity_type(self, activity_id: UUID, limit: int, cursor: Optional[str] = None, projection: Projection = FULL_PROJECTION):
         """Получить организации по типу активности"""
-        organizations = await self.repository.organizations_by_activity_type(activity_id)
-        return self._convert_organizations_to_response(organizations)
+        after_id = decode_id_cursor(cursor)
+        subtree = self.activity_tree.subtree(activity_id) if self.activity_tree else None
+        if subtree is not None:
+            page = await self.repository.organizations_by_activities(sorted(subtree), limit, after_id, projection)
+        else:
+            # Кэша нет или деятельность появилась после загрузки снимка
+            page = await self.repository.organizations_by_activity_type(activity_id, limit, after_id, projection)
+        return self._convert_page_to_response(page, projection)
+        
+    @coalesced
+    async def search_organizations(self, search_query: str, limit: int, cursor: Optional[str] = None, projection: Projection = FULL_PROJECTION):
+        """Поиск организаций по названию с ранжированием по схожести"""
+        page = await self.repository.search_organizations(
+            search_query,
+            limit,
+            decode_similarity_cursor(cursor),
+            similarity_threshold=self.search_similarity_threshold,
+            timeout_ms=self.search_timeout_ms,
+            projection=projection
+        )
+        return self._convert_page_to_response(page, projection)
+        
+    async def export_organizations(
+        self,
+        building_id: Optional[UUID] = None,
+        activity_id: Optional[UUID] = None,
+        circle: Optional[Tuple[float, float, float]] = None,
+        projection: Projection = FULL_PROJECTION
+    ) -> AsyncIterator[bytes]:
+        """Выгрузка организаций в NDJSON: одна организация на строку, по части за раз"""
+        chunks = self.repository.stream_organizations(self.export_chunk_size, building_id, activity_id, circle, projection)
+        async for organizations in chunks:
+            yield b"".join(
+                to_json(organization) + b"\n"
+                for organization in self._convert_organizations_to_response(organizations, projection)
+            )
         
-    async def get_organization_by_name(self, name: str):
+    @coalesced
+    async def get_organization_by_name(self, name: str, projection: Projection = FULL_PROJECTION):
         """Получить организацию по имени"""
-        organization = await self.repository.organization_by_name(name)
+        organization = await self.repository.organization_by_name(name, projection)
         if organization:
-            return self._convert_organizations_to_response([organization])[0]
+            return self._convert_organizations_to_response([organization], projection)[0]
         return None
+
+    @coalesced
+    async def count_organizations_by_activity_type(self, activity_id: UUID) -> dict:
+        """Число организаций с деятельностью из поддерева (каждая организация один раз)"""
+        return {"count": await self.repository.organizations_count_by_activity_type(activity_id)}
+
+    @coalesced
+    async def count_organizations_by_building(self, building_id: UUID) -> dict:
+        """Число организаций в здании"""
+        return {"count": await self.repository.organizations_count_by_building(building_id)}
+
+    @coalesced
+    async def count_organizations_in_circle(self, latitude: float, longitude: float, radius: float) -> dict:
+        """Число организаций в радиусе от указанной точки"""
+        if self.spatial_index and self.spatial_index.ready:
+            building_ids = self.spatial_index.circle(latitude, longitude, radius)
+            count = await self.repository.organizations_count_in_circle(latitude, longitude, radius, building_ids)
+        else:
+            count = await self.repository.organizations_count_in_circle(latitude, longitude, radius)
+        return {"count": count}
+
+    @coalesced
+    async def count_organizations_in_rectangle(self, center_latitude: float, center_longitude: float, width: float, height: float) -> dict:
+        """Число организаций в прямоугольной области"""
+        if self.spatial_index and self.spatial_index.ready:
+            building_ids = self.spatial_index.rectangle(center_latitude, center_longitude, width, height)
+            count = await self.repository.organizations_count_in_rectangle(center_latitude, center_longitude, width, height, building_ids)
+        else:
+            count = await self.repository.organizations_count_in_rectangle(center_latitude, center_longitude, width, height)
+        return {"count": count}
+
+    def _convert_page_to_response(self, page: Page, projection: Projection = FULL_PROJECTION) -> dict:
+        """Преобразуем страницу репозитория в документ OrganizationsPageResponse с курсором следующей страницы"""
+        return {
+            "items": self._convert_organizations_to_response(page.items, projection),
+            "next_cursor": encode_cursor(*page.next_key) if page.next_key else None
+        }
     
-    def _convert_organizations_to_response(self, organizations):
-        """Преобразуем SQLAlchemy объекты в Pydantic модели"""
+    def _convert_organizations_to_response(self, organizations, projection: Projection = FULL_PROJECTION) -> List[dict]:
+        """Преобразуем SQLAlchemy объекты в документы схемы OrganizationResponse с запрошенными полями.
+
+        Строки из базы уже соответствуют схеме, поэтому документы не проходят
+        валидацию моделью и сериализуются в JSON напрямую (pydantic_core.to_json).
+        Обращаться можно только к загруженным полям: остальные связи закрыты raiseload.
+        """
+        columns, relations = projection.columns, projection.relations
         result = []
         for org in organizations:
-            org_data = {
-                'id': org.id,
-                'name': org.name,
-                'building_id': org.building_id,
-                'phones': [{'id': phone.id, 'phone': phone.phone} for phone in org.phones],
-                'activities': [{'id': activity.id, 'name': activity.name, 'parent_id': activity.parent_id, 'level': activity.level} for activity in org.activities],
-                'building': None
-            }
-            
-            if org.building:
-                building_data = {
-                    'id': org.building.id,
-                    'address': org.building.address,
-                    'location': None
+            # JSON-движок репозитория уже вернул готовый документ
+            if isinstance(org, dict):
+                result.append(org)
+                continue
+
+            document = {'id': org.id}
+            if 'name' in columns:
+                document['name'] = org.name
+            if 'building_id' in columns:
+                document['building_id'] = org.building_id
+            if 'building' in relations:
+                building = org.building
+                document['building'] = None if building is None else {
+                    'id': building.id,
+                    'address': building.address,
+                    'location': None if building.latitude is None else {
+                        'latitude': building.latitude,
+                        'longitude': building.longitude
+                    }
                 }
-                
-                # Обрабатываем WKBElement
-                if isinstance(org.building.location, WKBElement):
-                    try:
-                        # Используем правильный метод для извлечения координат
-                        # WKBElement содержит бинарные данные, нужно их правильно обработать
-                        wkb_data = org.building.location.data
-                        
-                        # Преобразуем WKB в координаты используя PostGIS функции
-                        # Или используем встроенные методы geoalchemy2
-                        if hasattr(org.building.location, 'desc'):
-                            # Попробуем получить WKT из WKB
-                            wkt = str(org.building.location.desc)
-                            
-                            # Если это все еще бинарные данные, попробуем другой подход
-                            if wkt.startswith('0101000020'):
-                                # Это WKB в hex формате, нужно декодировать
-                                import struct
-                                # Убираем префикс и декодируем hex
-                                hex_data = wkt[18:]  # Убираем '0101000020e6100000'
-                                # Декодируем координаты (little-endian double)
-                                lon_bytes = bytes.fromhex(hex_data[:16])
-                                lat_bytes = bytes.fromhex(hex_data[16:32])
-                                longitude = struct.unpack('<d', lon_bytes)[0]
-                                latitude = struct.unpack('<d', lat_bytes)[0]
-                                
-                                building_data['location'] = {
-                                    'latitude': latitude,
-                                    'longitude': longitude
-                                }
-                            elif wkt.startswith('POINT('):
-                                # Это уже WKT строка
-                                coords = wkt[6:-1].split()
-                                longitude, latitude = float(coords[0]), float(coords[1])
-                                building_data['location'] = {
-                                    'latitude': latitude,
-                                    'longitude': longitude
-                                }
-                    except (ValueError, IndexError, AttributeError, struct.error) as e:
-                        building_data['location'] = None
-                
-                org_data['building'] = building_data
-            
-            result.append(OrganizationResponse(**org_data))
+            if 'phones' in relations:
+                document['phones'] = [{'id': phone.id, 'phone': phone.phone} for phone in org.phones]
+            if 'activities' in relations:
+                document['activities'] = [
+                    {'id': activity.id, 'name': activity.name, 'parent_id': activity.parent_id, 'level': activity.level}
+                    for activity in org.activities
+                ]
+            result.append(document)
         
-        return result
\ No newline at end of file
+        return result
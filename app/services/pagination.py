@@ -0,0 +1,63 @@
+"""Непрозрачные курсоры для keyset-пагинации"""
+import base64
+import json
+import math
+from typing import Optional, Tuple
+from uuid import UUID
+
+
+class InvalidCursorError(ValueError):
+    """Курсор поврежден или не соответствует типу запроса"""
+
+
+def encode_cursor(*key) -> str:
+    """Кодирует ключ последней записи страницы в непрозрачную строку"""
+    payload = json.dumps([str(part) if isinstance(part, UUID) else part for part in key], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str, length: int) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+
+    if not isinstance(key, list) or len(key) != length:
+        raise InvalidCursorError("Invalid cursor")
+    return key
+
+
+def decode_id_cursor(cursor: Optional[str]) -> Optional[UUID]:
+    """Курсор для выборок, упорядоченных по id организации"""
+    if cursor is None:
+        return None
+    (organization_id,) = _decode(cursor, 1)
+    try:
+        return UUID(organization_id)
+    except (ValueError, TypeError, AttributeError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+
+
+def _decode_score_cursor(cursor: Optional[str]) -> Optional[Tuple[float, UUID]]:
+    if cursor is None:
+        return None
+    score, organization_id = _decode(cursor, 2)
+    try:
+        score, organization_id = float(score), UUID(organization_id)
+    except (ValueError, TypeError, AttributeError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+    # NaN и бесконечность ломают сравнение ключей в запросе страницы
+    if not math.isfinite(score):
+        raise InvalidCursorError("Invalid cursor")
+    return score, organization_id
+
+
+def decode_distance_cursor(cursor: Optional[str]) -> Optional[Tuple[float, UUID]]:
+    """Курсор для геопоиска, упорядоченного по (расстояние, id организации)"""
+    return _decode_score_cursor(cursor)
+
+
+def decode_similarity_cursor(cursor: Optional[str]) -> Optional[Tuple[float, UUID]]:
+    """Курсор для поиска по названию, упорядоченного по (схожесть по убыванию, id организации)"""
+    return _decode_score_cursor(cursor)
@@ -0,0 +1,112 @@
+"""Кэш сериализованных ответов с вытеснением LRU, TTL и ограничением по памяти"""
+import hashlib
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional
+
+# Оценка накладных расходов на запись помимо тела: ключ, объект записи, узел OrderedDict
+ENTRY_OVERHEAD_BYTES = 256
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    # Сильный ETag: хэш тела в кавычках
+    etag: str
+    expires_at: float
+
+
+class ResponseCache(ABC):
+    """Интерфейс кэша ответов; приложение работает с любой реализацией или без кэша"""
+
+    @abstractmethod
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        """Запись по ключу или None, если ее нет или она устарела"""
+
+    @abstractmethod
+    def put(self, key: Hashable, body: bytes) -> CachedResponse:
+        """Сохранить тело ответа; возвращает запись с ETag, даже если она не поместилась"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Удалить все записи"""
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """Счетчики кэша для /admin"""
+
+
+class LRUResponseCache(ResponseCache):
+    """In-process LRU с TTL, ограниченный суммарным размером записей в байтах"""
+
+    def __init__(self, max_bytes: int, ttl: float, max_entries: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Hashable, body: bytes) -> CachedResponse:
+        entry = CachedResponse(
+            body=body,
+            etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+            expires_at=time.monotonic() + self.ttl
+        )
+        size = self._size(entry)
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            # Слишком большой ответ не кэшируем, чтобы не вытеснить весь кэш
+            return entry
+
+        self._entries[key] = entry
+        self._bytes += size
+
+        while self._bytes > self.max_bytes or (self.max_entries and len(self._entries) > self.max_entries):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+        return entry
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= self._size(entry)
+
+    @staticmethod
+    def _size(entry: CachedResponse) -> int:
+        return len(entry.body) + ENTRY_OVERHEAD_BYTES
@@ -0,0 +1,73 @@
+"""Объединение одинаковых одновременных вызовов в один (single flight)"""
+import asyncio
+import functools
+import inspect
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from app.metrics import SINGLE_FLIGHT_CALLS, SINGLE_FLIGHT_IN_FLIGHT
+
+T = TypeVar("T")
+
+
+class _Flight:
+    """Выполняющийся вызов и число присоединившихся к нему"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Одновременные вызовы с одинаковым ключом получают результат одного выполнения.
+
+    Первый вызов запускает produce отдельной задачей, остальные ждут ее результат
+    или исключение. Задача не отменяется, когда отменяется кто-то из ожидающих
+    (например, клиент закрыл соединение), - остальные получают результат. К одному
+    выполнению присоединяются не больше max_waiters вызовов; следующий вызов
+    запускает новое выполнение, к которому присоединяются последующие. Результат
+    общий для всех ожидающих, изменять его нельзя.
+    """
+
+    def __init__(self, max_waiters: int = 1000):
+        self.max_waiters = max_waiters
+        self._flights: Dict[Hashable, _Flight] = {}
+        SINGLE_FLIGHT_IN_FLIGHT.track(lambda: len(self._flights))
+
+    async def do(self, key: Hashable, produce: Callable[[], Awaitable[T]], label: str = "other") -> T:
+        flight = self._flights.get(key)
+        if flight is not None and flight.waiters < self.max_waiters:
+            flight.waiters += 1
+            SINGLE_FLIGHT_CALLS.inc(label, "coalesced")
+        else:
+            SINGLE_FLIGHT_CALLS.inc(label, "leader" if flight is None else "overflow")
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(produce()))
+            flight.task.add_done_callback(functools.partial(self._finish, key, flight))
+        return await asyncio.shield(flight.task)
+
+    def _finish(self, key: Hashable, flight: _Flight, task: asyncio.Task) -> None:
+        # Ключ мог уже перейти к новому выполнению после переполнения
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Исключение считается полученным, даже если все ожидающие были отменены
+        if not task.cancelled():
+            task.exception()
+
+
+def coalesced(method):
+    """Декоратор async-метода сервиса: одинаковые одновременные вызовы (имя метода и аргументы)
+    выполняются один раз через self.single_flight; без него метод вызывается как есть.
+
+    Аргументы приводятся к сигнатуре метода со значениями по умолчанию, поэтому
+    f(x, 10), f(x, limit=10) и f(x) при limit=10 по умолчанию - один ключ.
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if self.single_flight is None:
+            return await method(self, *args, **kwargs)
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = (method.__name__, bound.args[1:], tuple(sorted(bound.kwargs.items())))
+        return await self.single_flight.do(key, lambda: method(self, *args, **kwargs), method.__name__)
+    return wrapper
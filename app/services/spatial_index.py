@@ -0,0 +1,190 @@
+"""In-memory пространственный индекс зданий для геопоиска без обращения к buildings"""
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from app.database.repositories.buildings import BuildingsRepository
+from app.database.repositories.organisations import EARTH_RADIUS, SPHEROID_MARGIN, degree_bounds
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class GridSnapshot:
+    """Равномерная сетка по координатам зданий.
+
+    Точки отсортированы по ключу ячейки row * columns + column, поэтому ячейки
+    одной строки сетки лежат в массивах непрерывным диапазоном и находятся
+    двумя бинарными поисками.
+    """
+    cell_degrees: float
+    origin_latitude: float
+    origin_longitude: float
+    rows: int
+    columns: int
+    keys: np.ndarray        # int64, отсортированные ключи ячеек
+    latitudes: np.ndarray   # float64, градусы
+    longitudes: np.ndarray  # float64, градусы
+    ids: np.ndarray         # V16, байты UUID здания
+    loaded_at: float
+
+    @classmethod
+    def build(cls, rows: List[tuple], cell_degrees: float) -> "GridSnapshot":
+        ids = np.array([row[0].bytes for row in rows], dtype="V16")
+        latitudes = np.array([row[1] for row in rows], dtype=np.float64)
+        longitudes = np.array([row[2] for row in rows], dtype=np.float64)
+
+        if len(rows):
+            origin_latitude, origin_longitude = float(latitudes.min()), float(longitudes.min())
+        else:
+            origin_latitude = origin_longitude = 0.0
+        row_numbers = ((latitudes - origin_latitude) // cell_degrees).astype(np.int64)
+        column_numbers = ((longitudes - origin_longitude) // cell_degrees).astype(np.int64)
+        grid_rows = int(row_numbers.max()) + 1 if len(rows) else 0
+        grid_columns = int(column_numbers.max()) + 1 if len(rows) else 0
+
+        keys = row_numbers * grid_columns + column_numbers
+        order = np.argsort(keys, kind="stable")
+        return cls(
+            cell_degrees=cell_degrees,
+            origin_latitude=origin_latitude,
+            origin_longitude=origin_longitude,
+            rows=grid_rows,
+            columns=grid_columns,
+            keys=keys[order],
+            latitudes=latitudes[order],
+            longitudes=longitudes[order],
+            ids=ids[order],
+            loaded_at=time.time()
+        )
+
+    @property
+    def size(self) -> int:
+        return len(self.keys)
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.keys.nbytes + self.latitudes.nbytes + self.longitudes.nbytes + self.ids.nbytes
+
+    def within_bounds(self, min_longitude: float, min_latitude: float, max_longitude: float, max_latitude: float) -> np.ndarray:
+        """Индексы точек внутри прямоугольника (границы включительно, как ST_Intersects)"""
+        if not self.size:
+            return np.empty(0, dtype=np.int64)
+
+        row_from = max(math.floor((min_latitude - self.origin_latitude) / self.cell_degrees), 0)
+        row_to = min(math.floor((max_latitude - self.origin_latitude) / self.cell_degrees), self.rows - 1)
+        column_from = max(math.floor((min_longitude - self.origin_longitude) / self.cell_degrees), 0)
+        column_to = min(math.floor((max_longitude - self.origin_longitude) / self.cell_degrees), self.columns - 1)
+        if row_from > row_to or column_from > column_to:
+            return np.empty(0, dtype=np.int64)
+
+        row_keys = np.arange(row_from, row_to + 1, dtype=np.int64) * self.columns
+        starts = np.searchsorted(self.keys, row_keys + column_from, side="left")
+        ends = np.searchsorted(self.keys, row_keys + column_to, side="right")
+        candidates = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+
+        latitudes, longitudes = self.latitudes[candidates], self.longitudes[candidates]
+        inside = (
+            (latitudes >= min_latitude) & (latitudes <= max_latitude)
+            & (longitudes >= min_longitude) & (longitudes <= max_longitude)
+        )
+        return candidates[inside]
+
+    def building_ids(self, indices: np.ndarray) -> List[UUID]:
+        return [UUID(bytes=bytes(value)) for value in self.ids[indices]]
+
+
+class BuildingSpatialIndex:
+    """Снимок координат зданий в памяти процесса.
+
+    Отдает id зданий-кандидатов для геопоиска; точный предикат PostGIS
+    проверяется в запросе гидрации только по этим зданиям, поэтому
+    результаты совпадают с поиском по индексам buildings на момент снимка.
+    Вместе со снимком хранится штамп таблицы buildings (число строк и
+    наибольший xmin): периодическая проверка перечитывает здания, только
+    когда он изменился, так что снимок отстает не дольше интервала проверки.
+    """
+
+    def __init__(self, repository: BuildingsRepository, cell_degrees: float = 0.01):
+        self.repository = repository
+        self.cell_degrees = cell_degrees
+        self.snapshot: Optional[GridSnapshot] = None
+        self.stamp: Optional[Tuple[int, int]] = None
+        self._refresh_lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot is not None
+
+    async def refresh(self) -> GridSnapshot:
+        """Перечитать здания и атомарно заменить снимок"""
+        async with self._refresh_lock:
+            started = time.perf_counter()
+            # Штамп читается до зданий: изменение между ними заметит следующая проверка
+            stamp = await self.repository.locations_stamp()
+            rows = await self.repository.building_locations()
+            snapshot = await asyncio.to_thread(GridSnapshot.build, rows, self.cell_degrees)
+            self.snapshot = snapshot
+            self.stamp = stamp
+            logger.info(
+                "Spatial index loaded: %d buildings, %.1f KiB, %.0f ms",
+                snapshot.size, snapshot.memory_bytes / 1024, (time.perf_counter() - started) * 1000
+            )
+            return snapshot
+
+    async def check(self) -> bool:
+        """Обновить снимок, если штамп таблицы изменился; возвращает True, если снимок перечитан"""
+        if self.stamp is not None and await self.repository.locations_stamp() == self.stamp:
+            return False
+        await self.refresh()
+        return True
+
+    async def refresh_periodically(self, interval: float):
+        """Фоновая проверка устаревания снимка; ошибки не останавливают цикл"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Spatial index refresh failed, keeping previous snapshot")
+
+    def circle(self, latitude: float, longitude: float, radius: float) -> List[UUID]:
+        """Здания в радиусе radius метров (haversine с запасом на эллипсоид)"""
+        snapshot = self.snapshot
+        search_radius = radius * SPHEROID_MARGIN
+        indices = snapshot.within_bounds(*degree_bounds(latitude, longitude, search_radius, search_radius))
+
+        latitudes = np.radians(snapshot.latitudes[indices])
+        longitudes = np.radians(snapshot.longitudes[indices])
+        center_latitude, center_longitude = math.radians(latitude), math.radians(longitude)
+        haversine = (
+            np.sin((latitudes - center_latitude) / 2) ** 2
+            + math.cos(center_latitude) * np.cos(latitudes) * np.sin((longitudes - center_longitude) / 2) ** 2
+        )
+        distances = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(haversine, 1.0)))
+        return snapshot.building_ids(indices[distances <= search_radius])
+
+    def rectangle(self, center_latitude: float, center_longitude: float, width: float, height: float) -> List[UUID]:
+        """Здания в прямоугольнике width x height метров, те же границы, что и в репозитории"""
+        snapshot = self.snapshot
+        bounds = degree_bounds(center_latitude, center_longitude, width / 2, height / 2, width_latitude=center_latitude)
+        return snapshot.building_ids(snapshot.within_bounds(*bounds))
+
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"ready": False}
+        return {
+            "ready": True,
+            "buildings": snapshot.size,
+            "memory_bytes": snapshot.memory_bytes,
+            "grid": [snapshot.rows, snapshot.columns],
+            "cell_degrees": snapshot.cell_degrees,
+            "loaded_at": snapshot.loaded_at,
+        }
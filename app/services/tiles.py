@@ -0,0 +1,30 @@
+from typing import List, Optional
+from uuid import UUID
+
+from app.database.repositories.tiles import TilesRepository
+
+# Наибольший масштаб, для которого отдаются тайлы
+MAX_ZOOM = 22
+
+
+class InvalidTileError(Exception):
+    """Координаты тайла вне сетки масштаба"""
+
+
+class TilesService:
+    def __init__(self, repository: TilesRepository, cluster_max_zoom: int = 14, cluster_grid: int = 64):
+        self.repository = repository
+        self.cluster_max_zoom = cluster_max_zoom
+        self.cluster_grid = cluster_grid
+
+    async def get_tile(self, z: int, x: int, y: int, activity_ids: Optional[List[UUID]] = None) -> bytes:
+        """Тайл MVT: кластеры по сетке до cluster_max_zoom включительно, дальше отдельные здания"""
+        tiles_per_side = 1 << z
+        if not 0 <= x < tiles_per_side or not 0 <= y < tiles_per_side:
+            raise InvalidTileError(f"Tile {z}/{x}/{y} is outside the zoom {z} grid")
+        return await self.repository.tile(
+            z, x, y,
+            clustered=z <= self.cluster_max_zoom,
+            grid=self.cluster_grid,
+            activity_ids=activity_ids
+        )
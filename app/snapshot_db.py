@@ -0,0 +1,43 @@
+import argparse
+import asyncio
+import logging
+import sys
+from app.config import Settings
+from app.database.snapshots import DatabaseSnapshots, SnapshotError
+
+async def main(command: str, name: str, target: str):
+    settings = Settings()
+    snapshots = DatabaseSnapshots(settings.admin_db_url, settings.db_name)
+
+    if command == "create":
+        database = await snapshots.create(name)
+        print(f"Снимок {name} сохранен в базе {database}")
+    elif command == "restore":
+        await snapshots.restore(name)
+        print(f"База {settings.db_name} восстановлена из снимка {name}")
+    elif command == "clone":
+        await snapshots.clone(name, target)
+        print(f"База {target} создана из снимка {name}")
+    elif command == "drop" and target:
+        await snapshots.drop_clone(target)
+        print(f"База {target} удалена")
+    elif command == "drop":
+        await snapshots.drop(name)
+        print(f"Снимок {name} удален")
+    else:
+        for snapshot in await snapshots.list_snapshots():
+            print(f"{snapshot['name']:<20}{snapshot['size'] / 2**20:>10.1f} MB   {snapshot['revision'] or '-'}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Снимки базы данных через шаблонные базы Postgres")
+    parser.add_argument("command", choices=["create", "restore", "clone", "drop", "list"])
+    parser.add_argument("name", nargs="?", default="base", help="Имя снимка")
+    parser.add_argument("--target", help="Имя новой базы для clone; для drop - удалить эту базу-клон вместо снимка")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.command == "clone" and not args.target:
+        parser.error("clone requires --target")
+    try:
+        asyncio.run(main(args.command, args.name, args.target))
+    except SnapshotError as e:
+        sys.exit(str(e))
@@ -0,0 +1,115 @@
+"""Пропускная способность middleware аутентификации на тривиальном эндпоинте.
+
+    python -m benchmarks.auth_middleware --requests 20000 --concurrency 50
+
+Запросы подаются прямо в ASGI-приложение, без сети и сервера, поэтому
+разница отражает только накладные расходы middleware. Для сравнения
+измеряется прежняя реализация на BaseHTTPMiddleware.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.presentation.middleware import AuthMiddleware
+
+API_KEY = "benchmark-key"
+
+
+class LegacyAuthMiddleware(BaseHTTPMiddleware):
+    """Прежняя реализация, для сравнения"""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.api_key = os.getenv("API_KEY", API_KEY)
+
+    async def dispatch(self, request: Request, call_next):
+        if request.url.path in ["/docs", "/redoc", "/openapi.json", "/health"]:
+            return await call_next(request)
+        api_key = request.headers.get("X-API-Key")
+        if not api_key or api_key != self.api_key:
+            return JSONResponse(status_code=401, content={"detail": "Invalid API key"})
+        return await call_next(request)
+
+
+def build_app(middleware) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    if middleware is LegacyAuthMiddleware:
+        app.add_middleware(LegacyAuthMiddleware)
+    elif middleware is AuthMiddleware:
+        app.add_middleware(AuthMiddleware, api_keys=[API_KEY])
+    return app
+
+
+async def call(app, scope: dict) -> int:
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(dict(scope), receive, send)
+    return status
+
+
+async def measure(app, requests: int, concurrency: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/ping",
+        "raw_path": b"/ping",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"x-api-key", API_KEY.encode())],
+        "client": ("127.0.0.1", 1),
+        "server": ("bench", 80),
+        "app": app,
+    }
+    assert await call(app, scope) == 200
+
+    async def worker(count: int):
+        for _ in range(count):
+            await call(app, scope)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+    return (requests // concurrency) * concurrency / (time.perf_counter() - started)
+
+
+async def run(requests: int, concurrency: int):
+    cases = {
+        "no auth": None,
+        "BaseHTTPMiddleware (before)": LegacyAuthMiddleware,
+        "pure ASGI (after)": AuthMiddleware,
+    }
+    for name, middleware in cases.items():
+        rps = await measure(build_app(middleware), requests, concurrency)
+        print(f"{name:<30}{rps:>12.0f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
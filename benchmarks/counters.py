@@ -0,0 +1,94 @@
+"""Задержка счетчиков организаций против точного подсчета.
+
+    python -m benchmarks.counters --iterations 50
+
+На заполненной базе (см. app/fill_db.py) выводится медиана задержки счетчика
+и точного подсчета COUNT(DISTINCT). Совпадение счетчиков с точным подсчетом
+и их обновление триггерами проверяет tests/test_counters.py.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app.config import Settings
+from app.database.db_helper import AsyncDatabaseHelper
+from app.database.repositories.organisations import OrganizationsRepository
+from benchmarks.read_engines import LATITUDE, LONGITUDE
+
+EXACT_BY_ACTIVITY_TYPE = text("""
+    SELECT count(DISTINCT l.organization_id)
+    FROM organization_activities l
+    INNER JOIN activity_closure c ON c.descendant_id = l.activity_id
+    WHERE c.ancestor_id = :activity_id
+""")
+EXACT_BY_BUILDING = text("SELECT count(*) FROM organizations WHERE building_id = :building_id")
+EXACT_IN_CIRCLE = text("""
+    SELECT count(*)
+    FROM organizations o INNER JOIN buildings b ON b.id = o.building_id
+    WHERE ST_DWithin(geography(b.location), geography(ST_SetSRID(ST_MakePoint(:longitude, :latitude), 4326)), :radius)
+""")
+
+
+async def median_ms(call, iterations: int) -> float:
+    await call()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await call()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def exact(db_helper: AsyncDatabaseHelper, statement, **parameters) -> int:
+    async with db_helper.session_only() as session:
+        return (await session.execute(statement, parameters)).scalar()
+
+
+async def compare_latency(db_helper: AsyncDatabaseHelper, repository: OrganizationsRepository, iterations: int) -> None:
+    async with db_helper.session_only() as session:
+        root_id = (await session.execute(text("SELECT id FROM activities WHERE parent_id IS NULL LIMIT 1"))).scalar()
+        building_id = (await session.execute(text(
+            "SELECT building_id FROM organizations GROUP BY building_id ORDER BY count(*) DESC LIMIT 1"
+        ))).scalar()
+
+    cases = {
+        "by_activity_type (root)": (
+            lambda: repository.organizations_count_by_activity_type(root_id),
+            lambda: exact(db_helper, EXACT_BY_ACTIVITY_TYPE, activity_id=root_id)
+        ),
+        "by_building": (
+            lambda: repository.organizations_count_by_building(building_id),
+            lambda: exact(db_helper, EXACT_BY_BUILDING, building_id=building_id)
+        ),
+        "in_circle (2 km)": (
+            lambda: repository.organizations_count_in_circle(LATITUDE, LONGITUDE, 2000),
+            lambda: exact(db_helper, EXACT_IN_CIRCLE, latitude=LATITUDE, longitude=LONGITUDE, radius=2000)
+        ),
+    }
+    print(f"{'count':<28}{'counter, ms':>14}{'exact, ms':>14}")
+    for name, (counter, exact_count) in cases.items():
+        print(f"{name:<28}{await median_ms(counter, iterations):>14.2f}{await median_ms(exact_count, iterations):>14.2f}")
+
+
+async def run(iterations: int):
+    settings = Settings()
+    db_helper = AsyncDatabaseHelper(settings.db_url)
+    await db_helper.connect()
+    try:
+        await compare_latency(db_helper, OrganizationsRepository(db_helper), iterations)
+    finally:
+        await db_helper.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
+
+
+if __name__ == "__main__":
+    main()
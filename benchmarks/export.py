@@ -0,0 +1,70 @@
+"""Пиковая память выгрузки всего каталога: поток NDJSON против списка целиком.
+
+    python -m benchmarks.export --chunk-size 1000
+
+Память считается через tracemalloc (только Python-объекты). При потоковой
+выгрузке пик должен зависеть от размера части, а не от числа организаций.
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from pydantic_core import to_json
+
+from app.config import Settings
+from app.database.db_helper import AsyncDatabaseHelper
+from app.database.repositories.organisations import FULL_PROJECTION, OrganizationsRepository
+from app.database.repositories.organisations_json import OrganizationsJsonRepository
+from app.services.organizations import OrganizationsService
+
+
+async def stream(service: OrganizationsService) -> int:
+    size = 0
+    async for chunk in service.export_organizations():
+        size += len(chunk)
+    return size
+
+
+async def materialize(service: OrganizationsService) -> int:
+    """Прежний способ: все организации в памяти, затем один ответ"""
+    repository = service.repository
+    async with repository.db_helper.session_only() as session:
+        rows = repository._fetch_rows(await session.execute(repository._select_organizations(FULL_PROJECTION)))
+    organizations = service._convert_organizations_to_response([row[0] for row in rows])
+    return len(b"\n".join(to_json(organization) for organization in organizations))
+
+
+async def measure(name: str, produce) -> None:
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = await produce()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<24}{size / 2**20:>10.1f} MB body{elapsed:>10.2f} s{peak / 2**20:>10.1f} MB peak")
+
+
+async def run(chunk_size: int, engine: str):
+    settings = Settings()
+    db_helper = AsyncDatabaseHelper(settings.db_url)
+    await db_helper.connect()
+    repository_class = OrganizationsJsonRepository if engine == "json" else OrganizationsRepository
+    service = OrganizationsService(repository_class(db_helper), export_chunk_size=chunk_size)
+    try:
+        await measure("stream (export)", lambda: stream(service))
+        await measure("materialize (before)", lambda: materialize(service))
+    finally:
+        await db_helper.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--engine", choices=["orm", "json"], default="orm")
+    args = parser.parse_args()
+    asyncio.run(run(args.chunk_size, args.engine))
+
+
+if __name__ == "__main__":
+    main()
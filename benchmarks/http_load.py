@@ -0,0 +1,376 @@
+"""Нагрузочный прогон всех роутов API с отчетом в JSON и сравнением с базовым прогоном.
+
+Сервер запускается отдельно, с заголовком Server-Timing для времени базы:
+
+    SERVER_TIMING_ENABLED=true uvicorn app.main:app --workers 1
+
+    python -m benchmarks.http_load --scale 100k --seed 42 --output runs/after.json \\
+        --baseline runs/before.json --threshold 0.10
+
+Набор данных заданного объема заполняется один раз и сохраняется в снимок
+bench_<scale>_<seed> (см. app/fill_db.py --snapshot), повторные прогоны
+восстанавливают его. --no-seed использует текущее содержимое базы.
+
+Каждый эндпоинт нагружается отдельно --concurrency параллельными
+keep-alive соединениями в течение --duration секунд. Идентификаторы для
+by-id и batch выбираются по закону Ципфа: несколько горячих организаций
+получают большую часть запросов, как в реальном трафике. Отчет: пропускная
+способность, p50/p95/p99, среднее время в базе и число запросов к базе.
+С --baseline прогон завершается с кодом 1, если p95 какого-либо эндпоинта
+вырос или пропускная способность упала больше чем на --threshold.
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode, urlsplit
+
+from sqlalchemy import text
+
+from app.config import Settings
+from app.database.db_helper import AsyncDatabaseHelper
+from benchmarks.tiles import tile_of
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+# Зданий на организацию, как в наборе по умолчанию (2000 на 10000)
+BUILDINGS_PER_ORGANIZATION = 0.2
+
+# Центр Москвы, в пределах которой генерируются здания
+LATITUDE, LONGITUDE = 55.7558, 37.6176
+
+
+class ZipfSampler:
+    """Выбор элемента с вероятностью, пропорциональной 1 / rank^exponent"""
+
+    def __init__(self, items: list, exponent: float, rng: random.Random):
+        self.items = items
+        self.rng = rng
+        self.cumulative = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, len(items) + 1)))
+
+    def sample(self):
+        point = self.rng.random() * self.cumulative[-1]
+        return self.items[bisect.bisect_left(self.cumulative, point)]
+
+
+class HttpConnection:
+    """Минимальный клиент HTTP/1.1 с keep-alive поверх asyncio-потоков.
+
+    Без внешних зависимостей и пула: одно соединение на воркер, поэтому
+    задержка клиента не смешивается с ожиданием в пуле.
+    """
+
+    def __init__(self, host: str, port: int, headers: Dict[str, str]):
+        self.host = host
+        self.port = port
+        self.headers = "".join(f"{name}: {value}\r\n" for name, value in {"Host": host, **headers}.items())
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, body: Optional[bytes] = None) -> Tuple[int, Dict[str, str], bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = f"{method} {path} HTTP/1.1\r\n{self.headers}"
+        if body is not None:
+            head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        self.writer.write((head + "\r\n").encode() + (body or b""))
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            await self.close()
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while size := int((await self.reader.readline()).split(b";")[0], 16):
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            await self.reader.readline()
+            content = b"".join(chunks)
+        else:
+            content = await self.reader.readexactly(int(headers.get("content-length", 0)))
+
+        if headers.get("connection") == "close":
+            await self.close()
+        return status, headers, content
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def server_db_time(headers: Dict[str, str]) -> Optional[Tuple[float, int]]:
+    """(миллисекунды в базе, число запросов) из Server-Timing: db;dur=...;desc="N queries" """
+    for metric in headers.get("server-timing", "").split(","):
+        name, *params = [part.strip() for part in metric.split(";")]
+        if name != "db":
+            continue
+        values = dict(param.split("=", 1) for param in params)
+        return float(values["dur"]), int(values.get("desc", '"0').strip('"').split()[0])
+    return None
+
+
+async def seed_dataset(scale: str, seed: int, workers: Optional[int]) -> None:
+    from app.fill_db import main as fill_database
+
+    organizations = SCALES[scale]
+    await fill_database(
+        organizations=organizations,
+        buildings=max(int(organizations * BUILDINGS_PER_ORGANIZATION), 1),
+        batch_size=20000,
+        seed=seed,
+        workers=workers,
+        snapshot=f"bench_{scale}_{seed}"
+    )
+
+
+async def sample_dataset(limit: int) -> dict:
+    """Идентификаторы и названия из базы, которыми параметризуются запросы"""
+    settings = Settings()
+    db_helper = AsyncDatabaseHelper(settings.db_url)
+    await db_helper.connect()
+    try:
+        async with db_helper.session_only() as session:
+            async def column(query: str) -> list:
+                return (await session.execute(text(query), {"limit": limit})).scalars().all()
+
+            # Стабильный порядок, чтобы ранги Ципфа совпадали между прогонами
+            return {
+                "organization_ids": [str(value) for value in await column(
+                    "SELECT id FROM organizations ORDER BY id LIMIT :limit")],
+                "organization_names": await column(
+                    "SELECT name FROM organizations ORDER BY id LIMIT :limit"),
+                "building_ids": [str(value) for value in await column(
+                    "SELECT building_id FROM organizations GROUP BY building_id ORDER BY building_id LIMIT :limit")],
+                "activity_ids": [str(value) for value in await column(
+                    "SELECT id FROM activities ORDER BY level, id LIMIT :limit")],
+                "root_activity_ids": [str(value) for value in await column(
+                    "SELECT id FROM activities WHERE parent_id IS NULL ORDER BY id LIMIT :limit")],
+            }
+    finally:
+        await db_helper.close()
+
+
+def workloads(dataset: dict, rng: random.Random, zipf_exponent: float) -> Dict[str, Callable[[], Tuple[str, str, Optional[bytes]]]]:
+    """Генераторы запросов (метод, путь, тело) для каждого роута"""
+    hot_ids = ZipfSampler(dataset["organization_ids"], zipf_exponent, rng)
+    hot_names = ZipfSampler(dataset["organization_names"], zipf_exponent, rng)
+
+    def get(path: str, **params) -> Tuple[str, str, None]:
+        return "GET", f"{path}?{urlencode(params)}" if params else path, None
+
+    def point() -> Tuple[float, float]:
+        return LATITUDE + rng.uniform(-0.15, 0.15), LONGITUDE + rng.uniform(-0.2, 0.2)
+
+    def in_circle():
+        latitude, longitude = point()
+        return get("/organizations/in-circle", latitude=latitude, longitude=longitude, radius=500, limit=100)
+
+    def in_rectangle():
+        latitude, longitude = point()
+        return get("/organizations/in-rectangle", center_latitude=latitude, center_longitude=longitude,
+                   width=1000, height=1000, limit=100)
+
+    def count_in_circle():
+        latitude, longitude = point()
+        return get("/organizations/count/in-circle", latitude=latitude, longitude=longitude, radius=500)
+
+    def count_in_rectangle():
+        latitude, longitude = point()
+        return get("/organizations/count/in-rectangle", center_latitude=latitude, center_longitude=longitude,
+                   width=1000, height=1000)
+
+    def tile():
+        # Масштабы и кластеров, и отдельных зданий: как при перемещении по карте
+        z = rng.randint(10, 17)
+        x, y = tile_of(*point(), z)
+        return get(f"/tiles/{z}/{x}/{y}.mvt")
+
+    def batch():
+        ids = list({hot_ids.sample() for _ in range(50)})
+        return "POST", "/organizations/batch", json.dumps({"ids": ids}).encode()
+
+    return {
+        "by-building": lambda: get(f"/organizations/by-building/{rng.choice(dataset['building_ids'])}"),
+        "by-activity": lambda: get(f"/organizations/by-activity/{rng.choice(dataset['activity_ids'])}", limit=100),
+        "in-circle": in_circle,
+        "in-rectangle": in_rectangle,
+        "by-id": lambda: get(f"/organizations/by-id/{hot_ids.sample()}"),
+        "batch": batch,
+        "by-activity-type": lambda: get(
+            f"/organizations/by-activity-type/{rng.choice(dataset['root_activity_ids'])}", limit=100),
+        "search": lambda: get("/organizations/search", q=hot_names.sample()[:rng.randint(3, 8)], limit=20),
+        "by-name": lambda: get(f"/organizations/by-name/{quote(hot_names.sample(), safe='')}"),
+        "export": lambda: get("/organizations/export", building_id=rng.choice(dataset["building_ids"])),
+        "activities-tree": lambda: get("/activities/tree"),
+        "count-by-activity-type": lambda: get(
+            f"/organizations/count/by-activity-type/{rng.choice(dataset['root_activity_ids'])}"),
+        "count-by-building": lambda: get(f"/organizations/count/by-building/{rng.choice(dataset['building_ids'])}"),
+        "count-in-circle": count_in_circle,
+        "count-in-rectangle": count_in_rectangle,
+        "tiles": tile,
+    }
+
+
+async def run_endpoint(url: str, headers: Dict[str, str], make_request, concurrency: int, duration: float, warmup: float) -> dict:
+    target = urlsplit(url)
+    latencies: List[float] = []
+    db_times: List[float] = []
+    db_queries: List[int] = []
+    statuses: Dict[int, int] = {}
+    errors = 0
+    measuring = False
+
+    async def worker():
+        nonlocal errors
+        connection = HttpConnection(target.hostname, target.port or 80, headers)
+        try:
+            while not stop.is_set():
+                method, path, body = make_request()
+                started = time.perf_counter()
+                try:
+                    status, response_headers, _ = await connection.request(method, path, body)
+                except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+                    if measuring:
+                        errors += 1
+                    await connection.close()
+                    continue
+                if not measuring:
+                    continue
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+                timing = server_db_time(response_headers)
+                if timing:
+                    db_times.append(timing[0])
+                    db_queries.append(timing[1])
+        finally:
+            await connection.close()
+
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    await asyncio.sleep(warmup)
+    measuring = True
+    started = time.perf_counter()
+    await asyncio.sleep(duration)
+    measuring = False
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    if len(latencies) < 2:
+        return {"requests": len(latencies), "errors": errors, "statuses": statuses}
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentiles[49], 2),
+            "p95": round(percentiles[94], 2),
+            "p99": round(percentiles[98], 2),
+            "mean": round(statistics.fmean(latencies), 2),
+        },
+        "db_ms_mean": round(statistics.fmean(db_times), 2) if db_times else None,
+        "db_queries_mean": round(statistics.fmean(db_queries), 2) if db_queries else None,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """Регрессии относительно базового прогона: рост p95 или падение пропускной способности"""
+    regressions = []
+    for name, result in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before or "latency_ms" not in before or "latency_ms" not in result:
+            continue
+        p95_change = result["latency_ms"]["p95"] / before["latency_ms"]["p95"] - 1
+        throughput_change = result["throughput_rps"] / before["throughput_rps"] - 1
+        print(f"{name:<20}p95 {p95_change:+8.1%}   throughput {throughput_change:+8.1%}")
+        if p95_change > threshold:
+            regressions.append(f"{name}: p95 {before['latency_ms']['p95']} -> {result['latency_ms']['p95']} ms")
+        if throughput_change < -threshold:
+            regressions.append(f"{name}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+    return regressions
+
+
+async def run(args) -> int:
+    if not args.no_seed:
+        await seed_dataset(args.scale, args.seed, args.workers)
+    dataset = await sample_dataset(args.sample)
+
+    headers = {"X-API-Key": args.api_key} if args.api_key else {}
+    selected = workloads(dataset, random.Random(args.seed), args.zipf)
+    if args.endpoints:
+        selected = {name: selected[name] for name in args.endpoints}
+
+    report = {
+        "config": {
+            "scale": args.scale,
+            "seed": args.seed,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "zipf": args.zipf,
+            "url": args.url,
+        },
+        "endpoints": {},
+    }
+    for name, make_request in selected.items():
+        result = await run_endpoint(args.url, headers, make_request, args.concurrency, args.duration, args.warmup)
+        report["endpoints"][name] = result
+        latency = result.get("latency_ms", {})
+        print(
+            f"{name:<20}{result.get('throughput_rps', 0):>10.0f} req/s"
+            f"{latency.get('p50', 0):>10.2f}{latency.get('p95', 0):>10.2f}{latency.get('p99', 0):>10.2f} ms"
+            f"   db {result.get('db_ms_mean') or 0:.2f} ms   errors {result['errors']}"
+        )
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY"))
+    parser.add_argument("--scale", choices=SCALES, default="10k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=None, help="Процессов генерации данных")
+    parser.add_argument("--no-seed", action="store_true", help="Не заполнять базу, использовать текущие данные")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20, help="Секунд измерения на эндпоинт")
+    parser.add_argument("--warmup", type=float, default=3, help="Секунд прогрева на эндпоинт")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Показатель распределения горячих ID")
+    parser.add_argument("--sample", type=int, default=10000, help="Сколько ID брать из базы для запросов")
+    parser.add_argument("--endpoints", nargs="*", help="Только эти эндпоинты")
+    parser.add_argument("--output", help="Файл отчета JSON")
+    parser.add_argument("--baseline", help="Отчет базового прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Допустимое ухудшение, доля")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
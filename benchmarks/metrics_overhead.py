@@ -0,0 +1,110 @@
+"""Накладные расходы метрик на запрос: middleware и учет запросов к базе.
+
+    python -m benchmarks.metrics_overhead --requests 50000 --concurrency 50
+
+Запросы подаются прямо в ASGI-приложение (как в benchmarks.auth_middleware),
+поэтому разница отражает только стоимость MetricsMiddleware. Отдельно
+измеряется стоимость метки метода репозитория и наблюдения в гистограмме,
+которые добавляются к каждому запросу в базу.
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+
+from app.metrics import DB_QUERY_DURATION, REGISTRY, instrumented_repository
+from app.presentation.middleware import MetricsMiddleware
+from benchmarks.auth_middleware import measure
+
+
+class PassThroughMiddleware:
+    """Пустой ASGI-слой: отделяет стоимость самих метрик от стоимости лишнего слоя"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+
+
+def build_app(middleware) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    if middleware:
+        app.add_middleware(middleware)
+    return app
+
+
+@instrumented_repository
+class Repository:
+    async def method(self):
+        DB_QUERY_DURATION.observe(0.001, "Repository.method")
+
+
+async def middleware_cost(middleware, iterations: int) -> float:
+    """Микросекунд на запрос к голому ASGI-приложению, обернутому middleware"""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    wrapped = middleware(app)
+    scope = {"type": "http", "method": "GET", "path": "/ping"}
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await wrapped(scope, receive, send)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def per_query_overhead(iterations: int) -> float:
+    """Микросекунд на вызов метода репозитория с меткой и одно наблюдение"""
+    repository = Repository()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await repository.method()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def run(requests: int, concurrency: int, rounds: int):
+    cases = {"no middleware": None, "pass-through": PassThroughMiddleware, "MetricsMiddleware": MetricsMiddleware}
+    apps = {name: build_app(middleware) for name, middleware in cases.items()}
+    # Раунды чередуются, берется лучший результат: так меньше влияет шум машины
+    results = {name: 0.0 for name in cases}
+    for _ in range(rounds):
+        for name, app in apps.items():
+            results[name] = max(results[name], await measure(app, requests, concurrency))
+    for name, rps in results.items():
+        print(f"{name:<24}{rps:>12.0f} req/s{1e6 / rps:>10.1f} us/request")
+
+    overhead = 1e6 / results["MetricsMiddleware"] - 1e6 / results["pass-through"]
+    print(f"\nmetrics overhead over an empty middleware: {overhead:.1f} us/request (end to end, noisy)")
+    isolated = await middleware_cost(MetricsMiddleware, requests) - await middleware_cost(PassThroughMiddleware, requests)
+    print(f"metrics overhead, isolated: {isolated:.2f} us/request")
+    print(f"repository label + histogram: {await per_query_overhead(requests):.2f} us/query")
+
+    started = time.perf_counter()
+    body = REGISTRY.render()
+    print(f"/metrics render: {(time.perf_counter() - started) * 1000:.2f} ms, {len(body)} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
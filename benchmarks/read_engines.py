@@ -0,0 +1,119 @@
+"""Сравнение движков чтения организаций: ORM joinedload против JSON-агрегации в Postgres.
+
+Запуск на заполненной базе (см. app/fill_db.py):
+
+    python -m benchmarks.read_engines --iterations 50
+    python -m benchmarks.read_engines --fields id,name --expand building
+
+Для каждого метода репозитория выводится медиана и p95 задержки и число строк,
+переданных драйвером из Postgres за один вызов. --fields и --expand
+ограничивают поля организации так же, как одноименные параметры API.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import event, text
+
+from app.config import Settings
+from app.database.db_helper import AsyncDatabaseHelper
+from app.database.repositories.organisations import FULL_PROJECTION, OrganizationsRepository, Projection
+from app.database.repositories.organisations_json import OrganizationsJsonRepository
+
+# Центр Москвы, в пределах которой генерируются здания
+LATITUDE, LONGITUDE = 55.7558, 37.6176
+
+
+class RowCounter:
+    """Считает строки, полученные курсором, через события движка"""
+
+    def __init__(self, engine):
+        self.rows = 0
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.rows += max(cursor.rowcount, 0)
+
+
+async def sample_ids(db_helper: AsyncDatabaseHelper) -> dict:
+    async with db_helper.session_only() as session:
+        building_id = (await session.execute(text(
+            "SELECT building_id FROM organizations GROUP BY building_id ORDER BY count(*) DESC LIMIT 1"
+        ))).scalar()
+        activity_id = (await session.execute(text(
+            "SELECT activity_id FROM organization_activities GROUP BY activity_id ORDER BY count(*) DESC LIMIT 1"
+        ))).scalar()
+        root_activity_id = (await session.execute(text(
+            "SELECT id FROM activities WHERE parent_id IS NULL LIMIT 1"
+        ))).scalar()
+        organization_id = (await session.execute(text("SELECT id FROM organizations LIMIT 1"))).scalar()
+    return {
+        "building_id": building_id,
+        "activity_id": activity_id,
+        "root_activity_id": root_activity_id,
+        "organization_id": organization_id,
+    }
+
+
+def workloads(ids: dict, limit: int, projection: Projection = FULL_PROJECTION) -> dict:
+    return {
+        "organizations_by_building": lambda r: r.organizations_by_building(ids["building_id"], limit, projection=projection),
+        "organizations_by_activity": lambda r: r.organizations_by_activity(ids["activity_id"], limit, projection=projection),
+        "organizations_by_activity_type": lambda r: r.organizations_by_activity_type(ids["root_activity_id"], limit, projection=projection),
+        "organizations_in_circle": lambda r: r.organizations_in_circle(LATITUDE, LONGITUDE, 2000, limit, projection=projection),
+        "organizations_in_rectangle": lambda r: r.organizations_in_rectangle(LATITUDE, LONGITUDE, 4000, 4000, limit, projection=projection),
+        "organization_by_id": lambda r: r.organization_by_id(ids["organization_id"], projection),
+    }
+
+
+async def run(iterations: int, limit: int, projection: Projection):
+    settings = Settings()
+    db_helper = AsyncDatabaseHelper(settings.db_url)
+    await db_helper.connect()
+    counter = RowCounter(db_helper.engine)
+
+    try:
+        ids = await sample_ids(db_helper)
+        engines = {
+            "orm": OrganizationsRepository(db_helper),
+            "json": OrganizationsJsonRepository(db_helper),
+        }
+
+        print(f"{'method':<32}{'engine':<8}{'p50, ms':>10}{'p95, ms':>10}{'rows':>10}")
+        for name, call in workloads(ids, limit, projection).items():
+            for engine_name, repository in engines.items():
+                await call(repository)  # прогрев пула и кэша компиляции
+
+                timings = []
+                counter.rows = 0
+                for _ in range(iterations):
+                    started = time.perf_counter()
+                    await call(repository)
+                    timings.append((time.perf_counter() - started) * 1000)
+
+                p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+                print(
+                    f"{name:<32}{engine_name:<8}{statistics.median(timings):>10.2f}"
+                    f"{p95:>10.2f}{counter.rows / iterations:>10.0f}"
+                )
+    finally:
+        await db_helper.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=1000, help="Размер страницы списочных методов")
+    parser.add_argument("--fields", help="Колонки организации через запятую, по умолчанию все")
+    parser.add_argument("--expand", help="Связи через запятую, пустое значение - без связей, по умолчанию все")
+    args = parser.parse_args()
+    projection = Projection(
+        columns=FULL_PROJECTION.columns if args.fields is None else frozenset(args.fields.split(",")) | {"id"},
+        relations=FULL_PROJECTION.relations if args.expand is None else frozenset(filter(None, args.expand.split(",")))
+    )
+    asyncio.run(run(args.iterations, args.limit, projection))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Проверка маршрутизации чтения по репликам на живой базе.
+
+    python -m benchmarks.replicas --reads 200
+    python -m benchmarks.replicas --replica-url postgresql://.../replica_1 --replica-url ...
+
+Без --replica-url рабочая база клонируется через снимок (ADMIN_DB_URL) в две
+базы-заменителя реплик, которые удаляются после проверки. К репликам
+добавляется недоступный адрес, чтобы проверить исключение упавшей реплики.
+Проверяется, что чтения OrganizationsRepository идут только на реплики и
+распределяются между ними, запись остается на основной базе, а без доступных
+реплик чтение переключается на основную. Код возврата 1 при нарушении.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from collections import Counter
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+from app.config import Settings
+from app.database.db_helper import AsyncDatabaseHelper
+from app.database.repositories.fake_filler import FakeFillerRepository
+from app.database.repositories.organisations import OrganizationsRepository
+from app.database.snapshots import DatabaseSnapshots
+
+SNAPSHOT = "replica_check"
+UNREACHABLE_URL = "postgresql://nobody@127.0.0.1:1/replica_down"
+
+
+class StatementCounter:
+    """Число выполненных запросов по базам, через события движков"""
+
+    def __init__(self, db_helper: AsyncDatabaseHelper):
+        self.statements = Counter()
+        self._names = {db_helper.engine.sync_engine: "primary"}
+        self._names.update({replica.engine.sync_engine: replica.name for replica in db_helper.replicas})
+        for engine in self._names:
+            event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements[self._names[conn.engine]] += 1
+
+    def take(self) -> Counter:
+        statements, self.statements = self.statements, Counter()
+        return statements
+
+
+def check(condition: bool, message: str) -> bool:
+    print(("ok    " if condition else "FAIL  ") + message)
+    return condition
+
+
+async def clone_stand_ins(settings: Settings, count: int) -> list:
+    """Базы-заменители реплик: копии рабочей базы через снимок"""
+    snapshots = DatabaseSnapshots(settings.admin_db_url, settings.db_name)
+    await snapshots.create(SNAPSHOT)
+    names = [f"{settings.db_name}_replica_{number}" for number in range(1, count + 1)]
+    for name in names:
+        await snapshots.clone(SNAPSHOT, name)
+    return names
+
+
+async def drop_stand_ins(settings: Settings, names: list) -> None:
+    snapshots = DatabaseSnapshots(settings.admin_db_url, settings.db_name)
+    for name in names:
+        await snapshots.drop_clone(name)
+    await snapshots.drop(SNAPSHOT)
+
+
+async def read(repository: OrganizationsRepository, organization_ids: list, building_id) -> None:
+    """Смесь чтений репозитория, включая потоковую выгрузку"""
+    await repository.organizations_by_ids(organization_ids)
+    await repository.organizations_by_building(building_id, limit=20)
+    await repository.organization_by_name("-")
+    async for _ in repository.stream_organizations(chunk_size=10, building_id=building_id):
+        pass
+
+
+async def verify(settings: Settings, replica_urls: list, strategy: str, reads: int) -> bool:
+    db_helper = AsyncDatabaseHelper(
+        settings.db_url,
+        replica_urls=[*replica_urls, UNREACHABLE_URL],
+        replica_strategy=strategy,
+        replica_retry_seconds=60
+    )
+    await db_helper.connect()
+    counter = StatementCounter(db_helper)
+    repository = OrganizationsRepository(db_helper)
+    results = []
+    try:
+        async with db_helper.session_only() as session:
+            organization_ids = list((await session.execute(text("SELECT id FROM organizations LIMIT 10"))).scalars())
+            building_id = (await session.execute(text("SELECT building_id FROM organizations LIMIT 1"))).scalar()
+        counter.take()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(read(repository, organization_ids, building_id) for _ in range(reads)))
+        elapsed = time.perf_counter() - started
+        statements = counter.take()
+        print(f"{reads} concurrent reads in {elapsed:.2f} s, statements by database: {dict(statements)}")
+
+        live = [replica.name for replica in db_helper.replicas[:len(replica_urls)]]
+        down = db_helper.replicas[-1]
+        results.append(check(statements["primary"] == 0, "reads never reach the primary while replicas are up"))
+        results.append(check(all(statements[name] > 0 for name in live), f"every live replica served reads ({strategy})"))
+        results.append(check(not down.available, f"unreachable replica excluded: {down.last_error}"))
+
+        await FakeFillerRepository(db_helper).get_organizations_count()
+        statements = counter.take()
+        results.append(check(
+            statements["primary"] > 0 and sum(statements.values()) == statements["primary"],
+            "filler session stays on the primary"
+        ))
+
+        for replica in db_helper.replicas:
+            replica.down_until = float("inf")
+        await read(repository, organization_ids, building_id)
+        statements = counter.take()
+        results.append(check(
+            statements["primary"] > 0 and sum(statements.values()) == statements["primary"],
+            "reads fail over to the primary without available replicas"
+        ))
+
+        status = await db_helper.check_replicas()
+        results.append(check(
+            [replica["available"] for replica in status] == [True] * len(live) + [False],
+            "health check returns live replicas and keeps the unreachable one out"
+        ))
+    finally:
+        await db_helper.close()
+    return all(results)
+
+
+async def run(replica_urls: list, strategy: str, reads: int) -> bool:
+    settings = Settings()
+    stand_ins = []
+    if not replica_urls:
+        stand_ins = await clone_stand_ins(settings, 2)
+        replica_urls = [
+            make_url(settings.db_url).set(database=name).render_as_string(hide_password=False)
+            for name in stand_ins
+        ]
+    try:
+        return await verify(settings, replica_urls, strategy, reads)
+    finally:
+        if stand_ins:
+            await drop_stand_ins(settings, stand_ins)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replica-url", action="append", default=[], help="Готовая реплика вместо клонов")
+    parser.add_argument("--strategy", choices=["round_robin", "least_loaded"], default="round_robin")
+    parser.add_argument("--reads", type=int, default=200)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args.replica_url, args.strategy, args.reads)) else 1)
+
+
+if __name__ == "__main__":
+    main()
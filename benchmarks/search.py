@@ -0,0 +1,97 @@
+"""Задержка поиска по названию и проверка использования триграммного индекса.
+
+    python -m benchmarks.search --queries 500
+
+Поисковые строки берутся из названий существующих организаций: префиксы
+и фрагменты с опечаткой. Печатается план первого запроса и p50/p95/p99.
+Код возврата 1, если план не использует idx_organizations_name_trgm.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+from sqlalchemy import event, text
+
+from app.config import Settings
+from app.database.db_helper import AsyncDatabaseHelper
+from app.database.repositories.organisations import OrganizationsRepository
+
+
+def make_queries(names: list, count: int, rng: random.Random) -> list:
+    queries = []
+    for _ in range(count):
+        name = rng.choice(names)
+        if rng.random() < 0.5:
+            queries.append(name[:rng.randint(3, max(3, len(name)))])
+        else:
+            # Фрагмент названия с одной заменой символа
+            fragment = list(name[:rng.randint(5, max(5, len(name)))])
+            position = rng.randrange(len(fragment))
+            fragment[position] = rng.choice("абвгдеклмнопрст")
+            queries.append("".join(fragment))
+    return queries
+
+
+async def run(count: int, limit: int, seed: int) -> bool:
+    settings = Settings()
+    db_helper = AsyncDatabaseHelper(settings.db_url)
+    await db_helper.connect()
+    repository = OrganizationsRepository(db_helper)
+    rng = random.Random(seed)
+
+    statements = []
+    event.listen(
+        db_helper.engine.sync_engine, "before_cursor_execute",
+        lambda conn, cursor, statement, parameters, context, executemany: statements.append((statement, parameters))
+    )
+
+    try:
+        async with db_helper.session_only() as session:
+            names = (await session.execute(text(
+                "SELECT name FROM organizations TABLESAMPLE SYSTEM (1) LIMIT 1000"
+            ))).scalars().all()
+        queries = make_queries(names, count, rng)
+
+        statements.clear()
+        await repository.search_organizations(queries[0], limit, similarity_threshold=settings.search_similarity_threshold)
+        statement, parameters = statements[-1]
+        async with db_helper.engine.connect() as conn:
+            await conn.exec_driver_sql(f"SET pg_trgm.similarity_threshold = {settings.search_similarity_threshold}")
+            plan = "\n".join(row[0] for row in await conn.exec_driver_sql(
+                f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters
+            ))
+        print(plan)
+        uses_index = "idx_organizations_name_trgm" in plan
+
+        timings = []
+        for search_query in queries:
+            started = time.perf_counter()
+            await repository.search_organizations(
+                search_query, limit,
+                similarity_threshold=settings.search_similarity_threshold,
+                timeout_ms=settings.search_timeout_ms
+            )
+            timings.append((time.perf_counter() - started) * 1000)
+    finally:
+        await db_helper.close()
+
+    percentiles = statistics.quantiles(timings, n=100)
+    print(f"\nindex used: {uses_index}")
+    print(f"{count} queries: p50 {percentiles[49]:.2f} ms, p95 {percentiles[94]:.2f} ms, p99 {percentiles[98]:.2f} ms")
+    return uses_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args.queries, args.limit, args.seed)) else 1)
+
+
+if __name__ == "__main__":
+    main()
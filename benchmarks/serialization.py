@@ -0,0 +1,136 @@
+"""Микробенчмарк преобразования организаций в ответ API, без базы данных.
+
+    python -m benchmarks.serialization --sizes 1000 10000 100000
+
+Строки имитируют ORM-объекты репозитория с координатами, спроецированными
+через ST_X/ST_Y. Для сравнения измеряется прежний разбор hex WKB на строку.
+
+Полный ответ страницы сравнивается в двух вариантах:
+- "models + response_model": прежний путь. Сервис строит OrganizationResponse,
+  FastAPI валидирует страницу по response_model, сериализует ее в dict и
+  кодирует стандартным json.
+- "documents + to_json": документы без валидации кодируются pydantic_core.
+Тела обоих вариантов сверяются.
+"""
+import argparse
+import json
+import random
+import struct
+import time
+from types import SimpleNamespace
+from uuid import uuid4
+
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+
+from app.presentation.api import DocumentResponse
+from app.schemas import OrganizationResponse, OrganizationsPageResponse
+from app.services.organizations import OrganizationsService
+
+PAGE_ADAPTER = TypeAdapter(OrganizationsPageResponse)
+
+
+def make_organizations(count: int) -> list:
+    random.seed(count)
+    activities = [
+        SimpleNamespace(id=uuid4(), name=f"Деятельность {i}", parent_id=None, level=1)
+        for i in range(50)
+    ]
+    organizations = []
+    for i in range(count):
+        building_id = uuid4()
+        latitude, longitude = random.uniform(55.5, 55.9), random.uniform(37.3, 37.9)
+        building = SimpleNamespace(
+            id=building_id,
+            address=f"г. Москва, ул. Ленина, {i}",
+            latitude=latitude,
+            longitude=longitude,
+            # EWKB точки в hex, как его раньше отдавал geoalchemy2
+            wkb_hex=struct.pack("<BIIdd", 1, 0x20000001, 4326, longitude, latitude).hex(),
+        )
+        organizations.append(SimpleNamespace(
+            id=uuid4(),
+            name=f"ООО Организация {i}",
+            building_id=building_id,
+            building=building,
+            phones=[SimpleNamespace(id=uuid4(), phone="8-800-555-35-35") for _ in range(random.randint(1, 3))],
+            activities=random.sample(activities, random.randint(1, 5)),
+        ))
+    return organizations
+
+
+def legacy_wkb_decode(organizations: list) -> list:
+    """Прежний построчный разбор hex WKB (только координаты)"""
+    result = []
+    for org in organizations:
+        wkt = org.building.wkb_hex
+        try:
+            if wkt.startswith('0101000020'):
+                hex_data = wkt[18:]
+                longitude = struct.unpack('<d', bytes.fromhex(hex_data[:16]))[0]
+                latitude = struct.unpack('<d', bytes.fromhex(hex_data[16:32]))[0]
+                result.append({'latitude': latitude, 'longitude': longitude})
+        except (ValueError, IndexError, struct.error):
+            result.append(None)
+    return result
+
+
+def projected_decode(organizations: list) -> list:
+    """Координаты уже спроецированы запросом"""
+    return [
+        {'latitude': org.building.latitude, 'longitude': org.building.longitude}
+        for org in organizations
+    ]
+
+
+def models_response(service: OrganizationsService, organizations: list) -> bytes:
+    """Прежний путь: модели в сервисе, затем валидация и сериализация по response_model в FastAPI"""
+    page = OrganizationsPageResponse(
+        items=[OrganizationResponse(**document) for document in service._convert_organizations_to_response(organizations)],
+        next_cursor=None
+    )
+    validated = PAGE_ADAPTER.validate_python(page.model_dump())
+    content = PAGE_ADAPTER.dump_python(validated, mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def documents_response(service: OrganizationsService, organizations: list) -> bytes:
+    """Текущий путь: документы без валидации, сразу в байты"""
+    document = {"items": service._convert_organizations_to_response(organizations), "next_cursor": None}
+    return DocumentResponse(document).body
+
+
+def measure(func, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+
+    service = OrganizationsService(repository=None)
+    print(f"{'rows':>8}  {'case':<28}{'total, ms':>12}{'per row, us':>14}")
+    for size in args.sizes:
+        organizations = make_organizations(size)
+        cases = {
+            "legacy wkb decode": lambda: legacy_wkb_decode(organizations),
+            "projected st_x/st_y": lambda: projected_decode(organizations),
+            "convert to documents": lambda: service._convert_organizations_to_response(organizations),
+            "models + response_model": lambda: models_response(service, organizations),
+            "documents + to_json": lambda: documents_response(service, organizations),
+        }
+        if json.loads(models_response(service, organizations)) != json.loads(documents_response(service, organizations)):
+            raise SystemExit(f"{size}: response bodies differ")
+        for name, case in cases.items():
+            elapsed = measure(case)
+            print(f"{size:>8}  {name:<28}{elapsed * 1000:>12.1f}{elapsed / size * 1e6:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Всплеск одинаковых запросов с объединением одновременных вызовов и без него.
+
+    python -m benchmarks.single_flight --concurrency 300 --rounds 5
+
+На заполненной базе (см. app/fill_db.py) --concurrency одинаковых вызовов
+get_organizations_by_building для самого населенного здания запускаются
+одновременно, --rounds раз. Выводится время всплеска, число запросов к базе,
+наибольшее число занятых соединений пула и число таймаутов пула.
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import event
+
+from app.config import Settings
+from app.database.db_helper import AsyncDatabaseHelper
+from app.database.repositories.organisations import OrganizationsRepository
+from app.metrics import DB_POOL_TIMEOUTS
+from app.services.organizations import OrganizationsService
+from app.services.single_flight import SingleFlight
+from benchmarks.read_engines import sample_ids
+
+
+class PoolWatcher:
+    """Запросы к базе и наибольшее число одновременно занятых соединений"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = 0
+        self.peak_checked_out = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+        self.peak_checked_out = max(self.peak_checked_out, self.engine.pool.checkedout())
+
+    def reset(self) -> None:
+        self.statements = 0
+        self.peak_checked_out = 0
+
+
+def pool_timeouts() -> float:
+    return sum(DB_POOL_TIMEOUTS._values.values())
+
+
+async def burst(service: OrganizationsService, building_id, concurrency: int, limit: int) -> int:
+    results = await asyncio.gather(
+        *(service.get_organizations_by_building(building_id, limit) for _ in range(concurrency)),
+        return_exceptions=True
+    )
+    return sum(isinstance(result, Exception) for result in results)
+
+
+async def run(concurrency: int, rounds: int, limit: int, max_waiters: int):
+    settings = Settings()
+    db_helper = AsyncDatabaseHelper(settings.db_url)
+    await db_helper.connect()
+    watcher = PoolWatcher(db_helper.engine)
+    repository = OrganizationsRepository(db_helper)
+    try:
+        building_id = (await sample_ids(db_helper))["building_id"]
+        print(f"{'mode':<16}{'burst, ms':>11}{'queries':>9}{'peak pool':>11}{'timeouts':>10}{'errors':>8}")
+        for mode, single_flight in (("independent", None), ("single flight", SingleFlight(max_waiters))):
+            service = OrganizationsService(repository, single_flight=single_flight)
+            await burst(service, building_id, 1, limit)  # прогрев пула и кэшей запросов
+            watcher.reset()
+            timeouts_before = pool_timeouts()
+            errors = 0
+            started = time.perf_counter()
+            for _ in range(rounds):
+                errors += await burst(service, building_id, concurrency, limit)
+            elapsed = (time.perf_counter() - started) / rounds * 1000
+            print(
+                f"{mode:<16}{elapsed:>11.1f}{watcher.statements // rounds:>9}{watcher.peak_checked_out:>11}"
+                f"{pool_timeouts() - timeouts_before:>10.0f}{errors:>8}"
+            )
+    finally:
+        await db_helper.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=300)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--max-waiters", type=int, default=Settings().single_flight_max_waiters)
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.rounds, args.limit, args.max_waiters))
+
+
+if __name__ == "__main__":
+    main()
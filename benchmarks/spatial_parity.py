@@ -0,0 +1,95 @@
+"""Сверка in-memory индекса зданий с PostGIS на живой базе.
+
+    python -m benchmarks.spatial_parity --queries 200
+
+Для случайных кругов и прямоугольников в пределах Москвы сравнивает страницы
+организаций, полученные с кандидатами из BuildingSpatialIndex и через индексы
+buildings, и печатает время поиска кандидатов в памяти. Код возврата 1 при
+любом расхождении.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+from app.config import Settings
+from app.database.db_helper import AsyncDatabaseHelper
+from app.database.repositories.buildings import BuildingsRepository
+from app.database.repositories.organisations import OrganizationsRepository
+from app.services.spatial_index import BuildingSpatialIndex
+
+LATITUDE_RANGE = (55.5, 55.9)
+LONGITUDE_RANGE = (37.3, 37.9)
+
+
+async def collect(search, limit: int) -> list:
+    """Все страницы поиска, чтобы сравнить и порядок, и состав"""
+    ids, after = [], None
+    while True:
+        page = await search(after)
+        ids.extend(organization.id for organization in page.items)
+        if page.next_key is None:
+            return ids
+        after = page.next_key
+
+
+async def run(queries: int, limit: int, seed: int) -> bool:
+    settings = Settings()
+    db_helper = AsyncDatabaseHelper(settings.db_url)
+    await db_helper.connect()
+    repository = OrganizationsRepository(db_helper)
+    spatial_index = BuildingSpatialIndex(BuildingsRepository(db_helper), settings.spatial_index_cell_degrees)
+    rng = random.Random(seed)
+
+    mismatches, lookups = 0, []
+    try:
+        await spatial_index.refresh()
+        print(spatial_index.stats())
+
+        for i in range(queries):
+            latitude, longitude = rng.uniform(*LATITUDE_RANGE), rng.uniform(*LONGITUDE_RANGE)
+            if i % 2:
+                radius = rng.uniform(50, 3000)
+                started = time.perf_counter()
+                building_ids = spatial_index.circle(latitude, longitude, radius)
+                lookups.append(time.perf_counter() - started)
+                expected = await collect(lambda after: repository.organizations_in_circle(
+                    latitude, longitude, radius, limit, after), limit)
+                actual = await collect(lambda after: repository.organizations_in_circle(
+                    latitude, longitude, radius, limit, after, building_ids), limit)
+                query = f"circle({latitude:.5f}, {longitude:.5f}, {radius:.0f})"
+            else:
+                width, height = rng.uniform(100, 5000), rng.uniform(100, 5000)
+                started = time.perf_counter()
+                building_ids = spatial_index.rectangle(latitude, longitude, width, height)
+                lookups.append(time.perf_counter() - started)
+                expected = await collect(lambda after: repository.organizations_in_rectangle(
+                    latitude, longitude, width, height, limit, after), limit)
+                actual = await collect(lambda after: repository.organizations_in_rectangle(
+                    latitude, longitude, width, height, limit, after, building_ids), limit)
+                query = f"rectangle({latitude:.5f}, {longitude:.5f}, {width:.0f}, {height:.0f})"
+
+            if expected != actual:
+                mismatches += 1
+                print(f"MISMATCH {query}: postgis={len(expected)} memory={len(actual)}")
+    finally:
+        await db_helper.close()
+
+    print(f"{queries} queries, {mismatches} mismatches, "
+          f"candidate lookup p50 {statistics.median(lookups) * 1e3:.3f} ms")
+    return mismatches == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args.queries, args.limit, args.seed)) else 1)
+
+
+if __name__ == "__main__":
+    main()
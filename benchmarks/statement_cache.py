@@ -0,0 +1,101 @@
+"""Процессорное время Python на вызов горячих методов: запросы, построенные заново, против готовых.
+
+    python -m benchmarks.statement_cache --iterations 500 --limit 20
+
+"rebuild" строит конструкцию запроса на каждый вызов, как репозиторий до
+кэширования запросов: SQLAlchemy заново обходит ее дерево, чтобы вычислить
+ключ кэша компиляции. "cached" - текущий репозиторий с готовыми запросами.
+Время считается через time.process_time (только процессорное время процесса,
+без ожидания базы) последовательными вызовами. Маленький --limit подчеркивает
+накладные расходы запроса, а не гидрацию строк. С --no-db измеряется только
+подготовка запроса (построение и ключ кэша) без выполнения.
+"""
+import argparse
+import asyncio
+import time
+
+from app.config import Settings
+from app.database.db_helper import AsyncDatabaseHelper
+from app.database.repositories.organisations import OrganizationsRepository, Projection
+from app.database.repositories.organisations_json import OrganizationsJsonRepository
+from benchmarks.read_engines import sample_ids, workloads
+
+
+class RebuildingRepository(OrganizationsRepository):
+    """Поведение до кэширования: каждый вызов строит запрос заново"""
+
+    def _statement(self, name: str, *variant):
+        return getattr(self, f"_build_{name}")(*variant)
+
+
+class RebuildingJsonRepository(RebuildingRepository, OrganizationsJsonRepository):
+    pass
+
+
+async def cpu_per_call(call, repository, iterations: int) -> float:
+    await call(repository)  # прогрев пула, кэша компиляции и подготовленных запросов
+    started = time.process_time()
+    for _ in range(iterations):
+        await call(repository)
+    return (time.process_time() - started) / iterations * 1e6
+
+
+async def run(iterations: int, limit: int, engine: str):
+    settings = Settings()
+    db_helper = AsyncDatabaseHelper(
+        settings.db_url,
+        query_cache_size=settings.db_query_cache_size,
+        prepared_statement_cache_size=settings.db_prepared_statement_cache_size
+    )
+    await db_helper.connect()
+    if engine == "json":
+        rebuild, cached = RebuildingJsonRepository(db_helper), OrganizationsJsonRepository(db_helper)
+    else:
+        rebuild, cached = RebuildingRepository(db_helper), OrganizationsRepository(db_helper)
+
+    try:
+        await cached.warm_up()
+        ids = await sample_ids(db_helper)
+        print(f"{'method':<32}{'rebuild, us':>14}{'cached, us':>14}{'saved':>8}")
+        for name, call in workloads(ids, limit).items():
+            before = await cpu_per_call(call, rebuild, iterations)
+            after = await cpu_per_call(call, cached, iterations)
+            print(f"{name:<32}{before:>14.0f}{after:>14.0f}{(1 - after / before) * 100:>7.0f}%")
+    finally:
+        await db_helper.close()
+
+
+def prepare_only(iterations: int, engine: str):
+    """Построение запроса и ключ кэша компиляции - работа, которую готовый запрос не повторяет"""
+    rebuild_class, cached_class = (
+        (RebuildingJsonRepository, OrganizationsJsonRepository) if engine == "json"
+        else (RebuildingRepository, OrganizationsRepository)
+    )
+    rebuild, cached = rebuild_class(None), cached_class(None)
+    print(f"{'statement':<40}{'rebuild, us':>14}{'cached, us':>14}")
+    for key, _ in cached._warm_up_statements():
+        timings = []
+        for repository in (rebuild, cached):
+            started = time.process_time()
+            for _ in range(iterations):
+                repository._statement(*key)._generate_cache_key()
+            timings.append((time.process_time() - started) / iterations * 1e6)
+        label = str(tuple(part for part in key if not isinstance(part, Projection)))
+        print(f"{label:<40}{timings[0]:>14.1f}{timings[1]:>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--engine", choices=["orm", "json"], default="orm")
+    parser.add_argument("--no-db", action="store_true", help="Только подготовка запроса, без базы")
+    args = parser.parse_args()
+    if args.no_db:
+        prepare_only(args.iterations, args.engine)
+    else:
+        asyncio.run(run(args.iterations, args.limit, args.engine))
+
+
+if __name__ == "__main__":
+    main()
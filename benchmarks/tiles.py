@@ -0,0 +1,65 @@
+"""Размер и время генерации векторных тайлов по масштабам.
+
+    python -m benchmarks.tiles --zooms 8 10 12 14 15 17 --iterations 5
+
+На заполненной базе (см. app/fill_db.py) для каждого масштаба берется тайл
+с центром Москвы и его соседи 3x3 - как при открытии карты. Выводится
+медиана времени генерации тайла в базе и наибольший размер тайла: с
+кластеризацией размер ограничен сеткой, а не плотностью зданий.
+"""
+import argparse
+import asyncio
+import math
+import statistics
+import time
+
+from app.config import Settings
+from app.database.db_helper import AsyncDatabaseHelper
+from app.database.repositories.tiles import TilesRepository
+from app.services.tiles import TilesService
+from benchmarks.read_engines import LATITUDE, LONGITUDE
+
+
+def tile_of(latitude: float, longitude: float, z: int) -> tuple:
+    """Номер тайла z, содержащего точку"""
+    tiles_per_side = 1 << z
+    x = int((longitude + 180.0) / 360.0 * tiles_per_side)
+    y = int((1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * tiles_per_side)
+    return x, y
+
+
+async def run(zooms: list, iterations: int, cluster_max_zoom: int, grid: int):
+    settings = Settings()
+    db_helper = AsyncDatabaseHelper(settings.db_url)
+    await db_helper.connect()
+    service = TilesService(TilesRepository(db_helper), cluster_max_zoom, grid)
+    try:
+        print(f"{'z':>3}{'layer':>10}{'median, ms':>12}{'max bytes':>12}")
+        for z in zooms:
+            center_x, center_y = tile_of(LATITUDE, LONGITUDE, z)
+            tiles = [(center_x + dx, center_y + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+            timings, sizes = [], []
+            for _ in range(iterations):
+                for x, y in tiles:
+                    started = time.perf_counter()
+                    body = await service.get_tile(z, x, y)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    sizes.append(len(body))
+            layer = "clusters" if z <= cluster_max_zoom else "buildings"
+            print(f"{z:>3}{layer:>10}{statistics.median(timings):>12.1f}{max(sizes):>12}")
+    finally:
+        await db_helper.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--zooms", type=int, nargs="+", default=[8, 10, 12, 14, 15, 17])
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--cluster-max-zoom", type=int, default=Settings().tile_cluster_max_zoom)
+    parser.add_argument("--grid", type=int, default=Settings().tile_cluster_grid)
+    args = parser.parse_args()
+    asyncio.run(run(args.zooms, args.iterations, args.cluster_max_zoom, args.grid))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Общие настройки тестов.
+
+Тесты с меткой db идут на живой базе PostGIS с примененными миграциями и
+заполненными данными (см. app/fill_db.py): URL задается в TEST_DB_URL,
+без него такие тесты пропускаются. С TEST_SNAPSHOT и TEST_ADMIN_DB_URL
+тесты идут не на самой базе, а на ее клоне из снимка (см. app/snapshot_db.py),
+созданном на сессию pytest и удаляемом после нее.
+"""
+import asyncio
+import os
+
+import pytest
+from sqlalchemy.engine import make_url
+
+from app.database.snapshots import DatabaseSnapshots
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get("TEST_DB_URL"):
+        return
+    skip_db = pytest.mark.skip(reason="TEST_DB_URL не задан")
+    for item in items:
+        if "db" in item.keywords:
+            item.add_marker(skip_db)
+
+
+@pytest.fixture(scope="session")
+def test_db_url():
+    url = make_url(os.environ["TEST_DB_URL"])
+    snapshot = os.environ.get("TEST_SNAPSHOT")
+    if not snapshot:
+        yield url.render_as_string(hide_password=False)
+        return
+
+    snapshots = DatabaseSnapshots(os.environ["TEST_ADMIN_DB_URL"], url.database)
+    clone = f"{url.database}_test_{os.getpid()}"
+    asyncio.run(snapshots.clone(snapshot, clone))
+    try:
+        yield url.set(database=clone).render_as_string(hide_password=False)
+    finally:
+        asyncio.run(snapshots.drop_clone(clone))
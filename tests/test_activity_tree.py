@@ -0,0 +1,64 @@
+"""Проверка устаревания кэша дерева деятельностей по штампу таблицы"""
+import asyncio
+from uuid import UUID
+
+from app.services.activity_tree import ActivityTreeCache
+
+ROOT, CHILD, NEW_CHILD = UUID(int=1), UUID(int=2), UUID(int=3)
+
+
+class StubActivitiesRepository:
+    def __init__(self):
+        self.rows = [(ROOT, "Еда", None, 1), (CHILD, "Молочная продукция", ROOT, 2)]
+        self.stamp = (2, 100)
+        self.row_reads = 0
+
+    async def tree_stamp(self):
+        return self.stamp
+
+    async def all_activities(self):
+        self.row_reads += 1
+        return list(self.rows)
+
+
+def test_check_reads_rows_only_when_stamp_changes():
+    async def scenario():
+        repository = StubActivitiesRepository()
+        cache = ActivityTreeCache(repository)
+        await cache.reload()
+
+        assert await cache.check() is False
+        assert repository.row_reads == 1
+
+        repository.rows.append((NEW_CHILD, "Мясная продукция", ROOT, 2))
+        repository.stamp = (3, 101)
+        assert await cache.check() is True
+        assert repository.row_reads == 2
+        assert cache.subtree(ROOT) == {ROOT, CHILD, NEW_CHILD}
+
+    asyncio.run(scenario())
+
+
+def test_check_with_changed_stamp_but_same_tree_keeps_version():
+    async def scenario():
+        repository = StubActivitiesRepository()
+        cache = ActivityTreeCache(repository)
+        await cache.reload()
+        version = cache.version
+
+        # Например, UPDATE без изменения значений: новый xmin, то же дерево
+        repository.stamp = (2, 105)
+        assert await cache.check() is False
+        assert cache.version == version and cache.stamp == (2, 105)
+
+    asyncio.run(scenario())
+
+
+def test_unknown_activity_is_not_in_snapshot():
+    async def scenario():
+        cache = ActivityTreeCache(StubActivitiesRepository())
+        await cache.reload()
+        # Сервис уходит в таблицу замыкания, а не отвечает пустым поддеревом
+        assert cache.subtree(NEW_CHILD) is None
+
+    asyncio.run(scenario())
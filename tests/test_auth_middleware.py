@@ -0,0 +1,66 @@
+"""Проверка ключа API в чистом ASGI-middleware"""
+import asyncio
+import json
+
+import pytest
+
+from app.presentation.middleware import AuthMiddleware
+
+
+class StubApp:
+    """Приложение за middleware: отвечает 200 и запоминает, что до него дошли"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+def call(path: str, api_key=None, scope_type: str = "http"):
+    app = StubApp()
+    middleware = AuthMiddleware(app, api_keys=["primary-key", "", "rotated-key"])
+    headers = [(b"x-api-key", api_key.encode())] if api_key is not None else []
+    scope = {"type": scope_type, "method": "GET", "path": path, "headers": headers, "query_string": b""}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return app.calls, messages
+
+
+@pytest.mark.parametrize("api_key", ["primary-key", "rotated-key"])
+def test_valid_keys_pass(api_key):
+    calls, messages = call("/organizations/by-id/1", api_key)
+    assert calls == 1 and messages[0]["status"] == 200
+
+
+@pytest.mark.parametrize("api_key", [None, "", "wrong-key", "primary-key "])
+def test_missing_or_wrong_key_is_401(api_key):
+    calls, messages = call("/organizations/by-id/1", api_key)
+    assert calls == 0
+    assert messages[0]["status"] == 401
+    assert json.loads(messages[1]["body"]) == {"detail": "Invalid API key"}
+
+
+@pytest.mark.parametrize("path", sorted(AuthMiddleware.EXCLUDED_PATHS))
+def test_excluded_paths_pass_without_key(path):
+    calls, messages = call(path)
+    assert calls == 1 and messages[0]["status"] == 200
+
+
+def test_excluded_paths_match_exactly():
+    calls, messages = call("/docs/../organizations")
+    assert calls == 0 and messages[0]["status"] == 401
+
+
+def test_non_http_scopes_pass_through():
+    calls, _ = call("/", scope_type="lifespan")
+    assert calls == 1
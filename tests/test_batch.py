@@ -0,0 +1,60 @@
+"""Пакетный запрос организаций: порядок, повторы, ненайденные ID и кэш by-id"""
+import asyncio
+import json
+from uuid import UUID
+
+import pytest
+from pydantic import ValidationError
+
+from app.database.repositories.organisations import FULL_PROJECTION
+from app.presentation.api import get_organizations_batch
+from app.schemas import MAX_BATCH_IDS, OrganizationsBatchRequest
+from app.services.response_cache import LRUResponseCache
+
+FIRST, SECOND, THIRD, MISSING = (UUID(int=number) for number in (1, 2, 3, 4))
+
+
+class StubOrganizationsService:
+    """Организации FIRST..THIRD; отдает их в порядке, обратном запросу, как база без ORDER BY"""
+
+    def __init__(self):
+        self.requested = []
+
+    async def get_organizations_by_ids(self, organization_ids, projection):
+        self.requested.append(list(organization_ids))
+        known = [organization_id for organization_id in organization_ids if organization_id != MISSING]
+        return {organization_id: {"id": organization_id, "name": f"org {organization_id.int}"} for organization_id in reversed(known)}
+
+
+def batch(ids, service, cache=None) -> dict:
+    response = asyncio.run(get_organizations_batch(OrganizationsBatchRequest(ids=ids), FULL_PROJECTION, service, cache))
+    return json.loads(response.body)
+
+
+def test_order_follows_request_and_duplicates_collapse():
+    service = StubOrganizationsService()
+    body = batch([THIRD, FIRST, THIRD, SECOND, FIRST], service)
+    assert [item["id"] for item in body["items"]] == [str(THIRD), str(FIRST), str(SECOND)]
+    assert body["missing"] == []
+    assert service.requested == [[THIRD, FIRST, SECOND]]
+
+
+def test_missing_ids_are_listed():
+    body = batch([MISSING, FIRST, MISSING], StubOrganizationsService())
+    assert [item["id"] for item in body["items"]] == [str(FIRST)]
+    assert body["missing"] == [str(MISSING)]
+
+
+def test_cached_organizations_are_not_loaded_again():
+    service = StubOrganizationsService()
+    cache = LRUResponseCache(max_bytes=10_000, ttl=30)
+    batch([FIRST], service, cache)
+    body = batch([SECOND, FIRST], service, cache)
+    assert [item["id"] for item in body["items"]] == [str(SECOND), str(FIRST)]
+    assert service.requested == [[FIRST], [SECOND]]
+
+
+@pytest.mark.parametrize("ids", [[], [FIRST] * (MAX_BATCH_IDS + 1), ["not-a-uuid"]])
+def test_invalid_batches_are_rejected(ids):
+    with pytest.raises(ValidationError):
+        OrganizationsBatchRequest(ids=ids)
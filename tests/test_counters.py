@@ -0,0 +1,172 @@
+"""Счетчики организаций против точного подсчета COUNT(DISTINCT).
+
+Проверка идет в одной транзакции, которая откатывается: репозиторий получает
+хелпер, отдающий сессию этой транзакции, поэтому счетчики, обновленные
+триггерами, видны сразу после каждого изменения.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import text
+
+from app.database.db_helper import AsyncDatabaseHelper
+from app.database.repositories.organisations import OrganizationsRepository
+
+CIRCLE_RADIUS = 1000
+
+EXACT_BY_ACTIVITY_TYPE = text("""
+    SELECT count(DISTINCT l.organization_id)
+    FROM organization_activities l
+    INNER JOIN activity_closure c ON c.descendant_id = l.activity_id
+    WHERE c.ancestor_id = :activity_id
+""")
+EXACT_BY_BUILDING = text("SELECT count(*) FROM organizations WHERE building_id = :building_id")
+EXACT_IN_CIRCLE = text("""
+    SELECT count(*)
+    FROM organizations o INNER JOIN buildings b ON b.id = o.building_id
+    WHERE ST_DWithin(geography(b.location), geography(ST_SetSRID(ST_MakePoint(:longitude, :latitude), 4326)), :radius)
+""")
+
+
+class TransactionHelper:
+    """Хелпер БД для репозитория: все сессии - одна сессия откатываемой транзакции"""
+
+    def __init__(self, session):
+        self.session = session
+
+    @asynccontextmanager
+    async def read_session(self):
+        yield self.session
+
+    session_only = read_session
+
+
+class CounterCheck:
+    """Сравнение счетчиков репозитория с точным подсчетом в той же сессии"""
+
+    def __init__(self, session):
+        self.session = session
+        self.repository = OrganizationsRepository(TransactionHelper(session))
+
+    async def exact(self, statement, **parameters) -> int:
+        return (await self.session.execute(statement, parameters)).scalar()
+
+    async def mismatches(self, activity_ids, building_ids, circles) -> list:
+        mismatches = []
+        for activity_id in activity_ids:
+            expected = await self.exact(EXACT_BY_ACTIVITY_TYPE, activity_id=activity_id)
+            actual = await self.repository.organizations_count_by_activity_type(activity_id)
+            if actual != expected:
+                mismatches.append(f"activity {activity_id}: {actual} != {expected}")
+        for building_id in building_ids:
+            expected = await self.exact(EXACT_BY_BUILDING, building_id=building_id)
+            actual = await self.repository.organizations_count_by_building(building_id)
+            if actual != expected:
+                mismatches.append(f"building {building_id}: {actual} != {expected}")
+        for latitude, longitude, radius in circles:
+            expected = await self.exact(EXACT_IN_CIRCLE, latitude=latitude, longitude=longitude, radius=radius)
+            actual = await self.repository.organizations_count_in_circle(latitude, longitude, radius)
+            if actual != expected:
+                mismatches.append(f"circle {latitude}, {longitude}, {radius} m: {actual} != {expected}")
+        return mismatches
+
+
+@asynccontextmanager
+async def rolled_back_session(database_url: str):
+    db_helper = AsyncDatabaseHelper(database_url)
+    await db_helper.connect()
+    try:
+        async with db_helper.session_only() as session:
+            try:
+                yield session
+            finally:
+                await session.rollback()
+    finally:
+        await db_helper.close()
+
+
+async def check_counts(database_url: str, samples: int = 20) -> list:
+    async with rolled_back_session(database_url) as session:
+        activity_ids = list((await session.execute(text(
+            "SELECT id FROM activities ORDER BY level, id LIMIT :samples"
+        ), {"samples": samples})).scalars())
+        buildings = (await session.execute(text(
+            "SELECT id, ST_Y(location), ST_X(location) FROM buildings ORDER BY id LIMIT :samples"
+        ), {"samples": samples})).all()
+        circles = [(latitude, longitude, radius) for _, latitude, longitude in buildings[:3] for radius in (500, 5000)]
+        return await CounterCheck(session).mismatches(activity_ids, [row[0] for row in buildings], circles)
+
+
+async def check_maintenance(database_url: str) -> None:
+    async with rolled_back_session(database_url) as session:
+        check = CounterCheck(session)
+        # Лист с братом: у родителя листа не меньше двух детей, у дерева есть другой корень
+        leaf_id, sibling_id, parent_id, root_id = (await session.execute(text("""
+            SELECT leaf.id, sibling.id, leaf.parent_id,
+                   (SELECT ancestor_id FROM activity_closure WHERE descendant_id = leaf.id ORDER BY depth DESC LIMIT 1)
+            FROM activities leaf
+            INNER JOIN activities sibling ON sibling.parent_id = leaf.parent_id AND sibling.id <> leaf.id
+            WHERE NOT EXISTS (SELECT 1 FROM activities child WHERE child.parent_id = leaf.id)
+            LIMIT 1
+        """))).one()
+        other_root_id = (await session.execute(text(
+            "SELECT id FROM activities WHERE parent_id IS NULL AND id <> :root_id LIMIT 1"
+        ), {"root_id": root_id})).scalar()
+        first_building, second_building = (await session.execute(text(
+            "SELECT id, ST_Y(location), ST_X(location) FROM buildings ORDER BY id LIMIT 2"
+        ))).all()
+        activity_ids = [leaf_id, sibling_id, parent_id, root_id, other_root_id]
+        building_ids = [first_building[0], second_building[0]]
+        circles = [(latitude, longitude, CIRCLE_RADIUS) for _, latitude, longitude in (first_building, second_building)]
+
+        async def assert_counts(step: str) -> None:
+            assert await check.mismatches(activity_ids, building_ids, circles) == [], step
+
+        root_before = await check.repository.organizations_count_by_activity_type(root_id)
+        organization_id = uuid4()
+        await session.execute(text(
+            "INSERT INTO organizations (id, name, building_id) VALUES (:id, 'counter check', :building_id)"
+        ), {"id": organization_id, "building_id": first_building[0]})
+        # Две связи в одном поддереве: организация считается в корне один раз
+        await session.execute(text(
+            "INSERT INTO organization_activities (organization_id, activity_id) "
+            "SELECT :id, activity_id FROM unnest(CAST(:activity_ids AS uuid[])) AS activity_id"
+        ), {"id": organization_id, "activity_ids": [leaf_id, sibling_id]})
+        await assert_counts("insert")
+        assert await check.repository.organizations_count_by_activity_type(root_id) == root_before + 1
+
+        await session.execute(text(
+            "UPDATE organizations SET building_id = :building_id WHERE id = :id"
+        ), {"id": organization_id, "building_id": second_building[0]})
+        await assert_counts("move to another building")
+
+        await session.execute(text(
+            "UPDATE organization_activities SET activity_id = :other_root_id "
+            "WHERE organization_id = :id AND activity_id = :leaf_id"
+        ), {"id": organization_id, "leaf_id": leaf_id, "other_root_id": other_root_id})
+        await assert_counts("re-link to another tree")
+
+        await session.execute(text(
+            "UPDATE activities SET parent_id = :other_root_id WHERE id = :parent_id"
+        ), {"parent_id": parent_id, "other_root_id": other_root_id})
+        await assert_counts("re-parent a subtree")
+
+        # Обновление без смены родителя не должно ломать счетчики
+        await session.execute(text("UPDATE activities SET name = name WHERE id = :parent_id"), {"parent_id": parent_id})
+        await assert_counts("update without a move")
+
+        await session.execute(text("DELETE FROM organization_activities WHERE organization_id = :id"), {"id": organization_id})
+        await session.execute(text("DELETE FROM organizations WHERE id = :id"), {"id": organization_id})
+        await assert_counts("delete")
+
+
+@pytest.mark.db
+def test_counters_match_exact_counts(test_db_url):
+    assert asyncio.run(check_counts(test_db_url)) == []
+
+
+@pytest.mark.db
+def test_counters_follow_inserts_moves_and_deletes(test_db_url):
+    asyncio.run(check_maintenance(test_db_url))
@@ -0,0 +1,52 @@
+"""Планы геопоиска: запросы репозитория должны идти по GiST-индексам buildings.
+
+SQL, который выполняют organizations_in_circle и organizations_in_rectangle,
+перехватывается и выполняется в EXPLAIN с теми же параметрами. На маленьких
+таблицах планировщик может предпочесть Seq Scan, поэтому последовательное
+сканирование запрещается: проверяется, что индекс применим.
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import event
+
+from app.database.db_helper import AsyncDatabaseHelper
+from app.database.repositories.organisations import OrganizationsRepository
+
+LATITUDE, LONGITUDE = 55.7558, 37.6176
+
+
+async def explained_plan(database_url: str, search_name: str) -> str:
+    db_helper = AsyncDatabaseHelper(database_url)
+    await db_helper.connect()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db_helper.engine.sync_engine, "before_cursor_execute", record)
+    repository = OrganizationsRepository(db_helper)
+    searches = {
+        "in_circle": lambda: repository.organizations_in_circle(LATITUDE, LONGITUDE, 1000, 100),
+        "in_rectangle": lambda: repository.organizations_in_rectangle(LATITUDE, LONGITUDE, 2000, 2000, 100),
+    }
+    try:
+        await searches[search_name]()
+        event.remove(db_helper.engine.sync_engine, "before_cursor_execute", record)
+        statement, parameters = statements[0]
+        async with db_helper.engine.connect() as conn:
+            await conn.exec_driver_sql("SET enable_seqscan = off")
+            result = await conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+            return "\n".join(row[0] for row in result)
+    finally:
+        await db_helper.close()
+
+
+@pytest.mark.db
+@pytest.mark.parametrize("search_name", ["in_circle", "in_rectangle"])
+def test_geo_search_uses_buildings_location_index(test_db_url, search_name):
+    plan = asyncio.run(explained_plan(test_db_url, search_name))
+    assert any(
+        "Index" in line and "idx_buildings_location" in line
+        for line in plan.splitlines()
+    ), plan
@@ -0,0 +1,71 @@
+"""Курсоры keyset-пагинации: кодирование туда и обратно и отказ на поврежденных курсорах"""
+import base64
+import json
+from uuid import UUID
+
+import pytest
+
+from app.services.pagination import (
+    InvalidCursorError,
+    decode_distance_cursor,
+    decode_id_cursor,
+    decode_similarity_cursor,
+    encode_cursor
+)
+
+ORGANIZATION_ID = UUID("0b7e7c3e-3f3c-4d2a-9a57-6c1c2b8f9d10")
+
+
+def raw_cursor(payload: str) -> str:
+    """Курсор с произвольным содержимым, как его мог бы собрать клиент"""
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def test_id_cursor_round_trip():
+    assert decode_id_cursor(encode_cursor(ORGANIZATION_ID)) == ORGANIZATION_ID
+
+
+@pytest.mark.parametrize("decode", [decode_distance_cursor, decode_similarity_cursor])
+@pytest.mark.parametrize("score", [0.0, 1234.5678, 0.1 + 0.2])
+def test_score_cursor_round_trip(decode, score):
+    assert decode(encode_cursor(score, ORGANIZATION_ID)) == (score, ORGANIZATION_ID)
+
+
+def test_missing_cursor_is_first_page():
+    assert decode_id_cursor(None) is None
+    assert decode_distance_cursor(None) is None
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    raw_cursor("{}"),
+    raw_cursor("[]"),
+    raw_cursor('["not-a-uuid"]'),
+    raw_cursor(json.dumps([str(ORGANIZATION_ID), str(ORGANIZATION_ID)])),
+    raw_cursor("[123]"),
+])
+def test_tampered_id_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_id_cursor(cursor)
+
+
+@pytest.mark.parametrize("payload", [
+    f'["nan", "{ORGANIZATION_ID}"]',
+    f'["inf", "{ORGANIZATION_ID}"]',
+    f'["-Infinity", "{ORGANIZATION_ID}"]',
+    f'[NaN, "{ORGANIZATION_ID}"]',
+    f'[Infinity, "{ORGANIZATION_ID}"]',
+    f'["far", "{ORGANIZATION_ID}"]',
+    f'[null, "{ORGANIZATION_ID}"]',
+    '[1.5, "not-a-uuid"]',
+    f'[1.5, "{ORGANIZATION_ID}", 3]',
+    f'"{ORGANIZATION_ID}"',
+])
+def test_tampered_score_cursor_is_rejected(payload):
+    with pytest.raises(InvalidCursorError):
+        decode_distance_cursor(raw_cursor(payload))
+
+
+def test_id_cursor_is_not_accepted_as_score_cursor():
+    with pytest.raises(InvalidCursorError):
+        decode_similarity_cursor(encode_cursor(ORGANIZATION_ID))
@@ -0,0 +1,101 @@
+"""Разреженные документы организаций: параметры fields и expand, связи под raiseload"""
+import asyncio
+from uuid import UUID
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event, text
+from sqlalchemy.exc import InvalidRequestError
+
+from app.database.db_helper import AsyncDatabaseHelper
+from app.database.repositories.organisations import FULL_PROJECTION, OrganizationsRepository, Projection
+from app.presentation.api import get_projection
+from app.services.organizations import OrganizationsService
+
+
+class RaiseloadOrganization:
+    """Организация, у которой незагруженные поля падают при обращении, как под raiseload"""
+
+    def __init__(self, **loaded):
+        self.__dict__.update(loaded)
+
+    def __getattr__(self, name):
+        raise InvalidRequestError(f"'{name}' is not available due to lazy='raise'")
+
+
+def test_without_parameters_all_fields_are_returned():
+    assert get_projection(fields=None, expand=None) is FULL_PROJECTION
+
+
+def test_fields_always_keep_id_and_expand_may_be_empty():
+    projection = get_projection(fields="name", expand="")
+    assert projection.columns == {"id", "name"}
+    assert projection.relations == frozenset()
+    assert projection.fields() == ["id", "name"]
+
+
+def test_expand_only_keeps_all_columns():
+    projection = get_projection(fields=None, expand=" phones , building ")
+    assert projection.columns == FULL_PROJECTION.columns
+    assert projection.relations == {"building", "phones"}
+
+
+@pytest.mark.parametrize("fields, expand, unknown", [
+    ("name,address", None, "fields: address"),
+    (None, "phones,owner", "expand: owner"),
+    ("phones", None, "fields: phones"),
+])
+def test_unknown_field_names_are_rejected(fields, expand, unknown):
+    with pytest.raises(HTTPException) as error:
+        get_projection(fields=fields, expand=expand)
+    assert error.value.status_code == 400
+    assert f"Unknown {unknown}" in error.value.detail
+
+
+def test_document_contains_only_requested_fields_and_touches_nothing_else():
+    organization = RaiseloadOrganization(id=UUID(int=1), name="Рога и копыта", phones=[])
+    service = OrganizationsService(repository=None)
+
+    documents = service._convert_organizations_to_response(
+        [organization], Projection(columns=frozenset({"id", "name"}), relations=frozenset({"phones"}))
+    )
+    assert documents == [{"id": UUID(int=1), "name": "Рога и копыта", "phones": []}]
+
+
+async def statements_per_projection(database_url: str) -> dict:
+    db_helper = AsyncDatabaseHelper(database_url)
+    await db_helper.connect()
+    statements = []
+    event.listen(db_helper.engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    repository = OrganizationsRepository(db_helper)
+    service = OrganizationsService(repository)
+    counts = {}
+    try:
+        async with db_helper.session_only() as session:
+            organization_id = (await session.execute(text("SELECT id FROM organizations LIMIT 1"))).scalar()
+
+        bare = Projection(columns=frozenset({"id", "name"}), relations=frozenset())
+        statements.clear()
+        organizations = await repository.organizations_by_ids([organization_id], bare)
+        for relation in ("building", "phones", "activities"):
+            with pytest.raises(InvalidRequestError):
+                getattr(organizations[0], relation)
+        counts["repository"] = len(statements)
+
+        for name, projection in {"bare": bare, "full": FULL_PROJECTION}.items():
+            statements.clear()
+            document = await service.get_organization_by_id(organization_id, projection)
+            assert set(document) == set(projection.fields())
+            counts[name] = len(statements)
+    finally:
+        await db_helper.close()
+    return counts
+
+
+@pytest.mark.db
+def test_unrequested_relations_are_not_lazy_loaded(test_db_url):
+    counts = asyncio.run(statements_per_projection(test_db_url))
+    # Без связей - один запрос, обращение к связям не уходит в базу
+    assert counts["repository"] == 1
+    assert counts["bare"] == 1
+    assert counts["full"] >= counts["bare"]
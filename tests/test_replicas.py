@@ -0,0 +1,210 @@
+"""Маршрутизация чтения по репликам: выбор реплики, переключение при сбое, проверка доступности.
+
+Модульные тесты идут на заглушках движков и сессий. Тест с меткой db
+подключает к TEST_DB_URL основную базу и две реплики (TEST_REPLICA_URLS через
+запятую, по умолчанию - та же база через отдельные движки) и проверяет по
+событиям движков, какие базы выполняли запросы.
+"""
+import asyncio
+import os
+from collections import Counter
+
+import pytest
+from sqlalchemy import event, text
+
+from app.database.db_helper import AsyncDatabaseHelper, ReadReplica
+from app.database.repositories.fake_filler import FakeFillerRepository
+from app.database.repositories.organisations import OrganizationsRepository
+
+UNREACHABLE_URL = "postgresql://nobody@127.0.0.1:1/replica_down"
+
+
+class StubPool:
+    def __init__(self, checked_out: int = 0):
+        self.checked_out = checked_out
+
+    def checkedout(self) -> int:
+        return self.checked_out
+
+
+class StubConnection:
+    def __init__(self, engine: "StubEngine"):
+        self.engine = engine
+
+    async def __aenter__(self):
+        if self.engine.hangs:
+            await asyncio.Event().wait()
+        if self.engine.fails:
+            raise OSError("connection refused")
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, statement):
+        return None
+
+
+class StubEngine:
+    def __init__(self, checked_out: int = 0, fails: bool = False, hangs: bool = False):
+        self.pool = StubPool(checked_out)
+        self.fails = fails
+        self.hangs = hangs
+
+    def connect(self) -> StubConnection:
+        return StubConnection(self)
+
+
+class StubSession:
+    def __init__(self, database: str, fails: bool = False, hangs: bool = False):
+        self.database = database
+        self.fails = fails
+        self.hangs = hangs
+        self.closed = False
+
+    async def connection(self):
+        if self.hangs:
+            await asyncio.Event().wait()
+        if self.fails:
+            raise OSError("connection refused")
+
+    async def close(self):
+        self.closed = True
+
+    async def rollback(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+        return False
+
+
+def stub_replica(name: str, checked_out: int = 0, fails: bool = False, hangs: bool = False) -> ReadReplica:
+    replica = ReadReplica(name, StubEngine(checked_out, fails, hangs))
+    replica.session_factory = lambda: StubSession(name, fails, hangs)
+    return replica
+
+
+def stub_helper(*replicas: ReadReplica, strategy: str = "round_robin") -> AsyncDatabaseHelper:
+    db_helper = AsyncDatabaseHelper(
+        "postgresql://user@localhost/db", replica_strategy=strategy, replica_retry_seconds=60, replica_ping_timeout=0.05
+    )
+    db_helper.replicas = list(replicas)
+    db_helper.async_session_factory = lambda: StubSession("primary")
+    return db_helper
+
+
+async def read_database(db_helper: AsyncDatabaseHelper) -> str:
+    async with db_helper.read_session() as session:
+        return session.database
+
+
+def test_round_robin_alternates_replicas():
+    db_helper = stub_helper(stub_replica("replica1"), stub_replica("replica2"))
+    names = [db_helper._choose_replica().name for _ in range(4)]
+    assert sorted(names) == ["replica1", "replica1", "replica2", "replica2"]
+    assert names[0] != names[1]
+
+
+def test_least_loaded_picks_fewest_checked_out():
+    busy, idle = stub_replica("replica1", checked_out=7), stub_replica("replica2", checked_out=2)
+    db_helper = stub_helper(busy, idle, strategy="least_loaded")
+    assert db_helper._choose_replica() is idle
+    idle.engine.pool.checked_out = 9
+    assert db_helper._choose_replica() is busy
+
+
+def test_read_session_fails_over_to_next_replica():
+    down, up = stub_replica("replica1", fails=True), stub_replica("replica2")
+    db_helper = stub_helper(down, up)
+    databases = [asyncio.run(read_database(db_helper)) for _ in range(3)]
+    assert databases == ["replica2"] * 3
+    assert not down.available and "connection refused" in down.last_error
+    assert up.available
+
+
+def test_read_session_fails_over_from_hanging_replica():
+    hanging, up = stub_replica("replica1", hangs=True), stub_replica("replica2")
+    db_helper = stub_helper(hanging, up)
+    databases = [asyncio.run(read_database(db_helper)) for _ in range(2)]
+    assert databases == ["replica2", "replica2"]
+    assert not hanging.available
+
+
+def test_read_session_falls_back_to_primary_without_replicas():
+    db_helper = stub_helper(stub_replica("replica1", fails=True), stub_replica("replica2", fails=True))
+    assert asyncio.run(read_database(db_helper)) == "primary"
+    assert not any(replica.available for replica in db_helper.replicas)
+
+
+def test_check_replicas_marks_down_and_up():
+    refused, hanging = stub_replica("replica1", fails=True), stub_replica("replica2", hangs=True)
+    db_helper = stub_helper(refused, hanging)
+
+    status = asyncio.run(db_helper.check_replicas())
+    assert [replica["available"] for replica in status] == [False, False]
+
+    refused.engine.fails = False
+    hanging.engine.hangs = False
+    status = asyncio.run(db_helper.check_replicas())
+    assert [replica["available"] for replica in status] == [True, True]
+    assert all(replica["last_error"] is None for replica in status)
+
+
+class StatementCounter:
+    """Число выполненных запросов по базам, через события движков"""
+
+    def __init__(self, db_helper: AsyncDatabaseHelper):
+        self.statements = Counter()
+        self._names = {db_helper.engine.sync_engine: "primary"}
+        self._names.update({replica.engine.sync_engine: replica.name for replica in db_helper.replicas})
+        for engine in self._names:
+            event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements[self._names[conn.engine]] += 1
+
+    def take(self) -> Counter:
+        statements, self.statements = self.statements, Counter()
+        return statements
+
+
+async def check_routing(database_url: str, replica_urls: list):
+    db_helper = AsyncDatabaseHelper(database_url, replica_urls=[*replica_urls, UNREACHABLE_URL], replica_retry_seconds=60)
+    await db_helper.connect()
+    counter = StatementCounter(db_helper)
+    repository = OrganizationsRepository(db_helper)
+    try:
+        async with db_helper.session_only() as session:
+            organization_ids = list((await session.execute(text("SELECT id FROM organizations LIMIT 10"))).scalars())
+        counter.take()
+
+        await asyncio.gather(*(repository.organizations_by_ids(organization_ids) for _ in range(20)))
+        statements = counter.take()
+        live, down = db_helper.replicas[:len(replica_urls)], db_helper.replicas[-1]
+        assert statements["primary"] == 0, statements
+        assert all(statements[replica.name] > 0 for replica in live), statements
+        assert not down.available
+
+        await FakeFillerRepository(db_helper).get_organizations_count()
+        statements = counter.take()
+        assert set(statements) == {"primary"}, statements
+
+        for replica in db_helper.replicas:
+            replica.down_until = float("inf")
+        await repository.organizations_by_ids(organization_ids)
+        assert set(counter.take()) == {"primary"}
+
+        status = await db_helper.check_replicas()
+        assert [replica["available"] for replica in status] == [True] * len(live) + [False]
+    finally:
+        await db_helper.close()
+
+
+@pytest.mark.db
+def test_reads_go_to_replicas_and_fail_over(test_db_url):
+    replica_urls = os.environ.get("TEST_REPLICA_URLS", f"{test_db_url},{test_db_url}").split(",")
+    asyncio.run(check_routing(test_db_url, replica_urls))
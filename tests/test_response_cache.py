@@ -0,0 +1,107 @@
+"""Кэш ответов: попадания, TTL, вытеснение LRU и ETag с If-None-Match"""
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from app.presentation.api import cached_json_response, etag_matches
+from app.services import response_cache
+from app.services.response_cache import ENTRY_OVERHEAD_BYTES, LRUResponseCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "monotonic", clock.monotonic)
+    return clock
+
+
+def request_with(if_none_match=None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_hit_returns_same_entry(clock):
+    cache = LRUResponseCache(max_bytes=10_000, ttl=30)
+    assert cache.get("a") is None
+    entry = cache.put("a", b'{"id":1}')
+    assert cache.get("a") is entry
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = LRUResponseCache(max_bytes=10_000, ttl=30)
+    cache.put("a", b"body")
+    clock.now += 29.9
+    assert cache.get("a") is not None
+    clock.now += 0.1
+    assert cache.get("a") is None
+    assert cache.expirations == 1 and cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+
+
+def test_least_recently_used_is_evicted_by_size(clock):
+    body = b"x" * 100
+    cache = LRUResponseCache(max_bytes=2 * (len(body) + ENTRY_OVERHEAD_BYTES), ttl=30)
+    cache.put("a", body)
+    cache.put("b", body)
+    cache.get("a")  # a становится самой свежей
+    cache.put("c", body)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.evictions == 1
+
+
+def test_eviction_by_entry_count_and_oversized_bodies_are_not_cached(clock):
+    cache = LRUResponseCache(max_bytes=1000, ttl=30, max_entries=2)
+    for key in "abc":
+        cache.put(key, b"{}")
+    assert cache.get("a") is None and cache.stats()["entries"] == 2
+
+    entry = cache.put("big", b"x" * 1000)
+    assert entry.etag and cache.get("big") is None
+
+
+def test_etag_depends_on_body(clock):
+    cache = LRUResponseCache(max_bytes=10_000, ttl=30)
+    assert cache.put("a", b"1").etag == cache.put("b", b"1").etag
+    assert cache.put("a", b"1").etag != cache.put("a", b"2").etag
+
+
+@pytest.mark.parametrize("header, matches", [
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"other", W/"abc"', True),
+    ("*", True),
+    ('"other"', False),
+    (None, False),
+])
+def test_if_none_match_is_weak_comparison(header, matches):
+    assert etag_matches(request_with(header), '"abc"') is matches
+
+
+def test_cached_response_is_304_for_weak_etag_and_produced_once(clock):
+    cache = LRUResponseCache(max_bytes=10_000, ttl=30)
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        return {"id": 1}
+
+    async def scenario():
+        first = await cached_json_response(request_with(), cache, ("by-id", 1), produce)
+        assert first.status_code == 200 and first.headers["X-Cache"] == "MISS"
+        etag = first.headers["ETag"]
+
+        second = await cached_json_response(request_with(f"W/{etag}"), cache, ("by-id", 1), produce)
+        assert second.status_code == 304 and second.headers["X-Cache"] == "HIT" and second.body == b""
+
+    asyncio.run(scenario())
+    assert len(calls) == 1
@@ -0,0 +1,94 @@
+"""Поиск по названию: проверка входных данных, экранирование LIKE и бюджет времени"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy.exc import DBAPIError
+
+from app.database.repositories.organisations import QUERY_CANCELED, OrganizationsRepository, SearchTimeoutError, escape_like
+from app.presentation.api import MAX_PAGE_LIMIT, router, search_timeout_handler
+from app.services.organizations import OrganizationsService
+from app.services.pagination import InvalidCursorError, encode_cursor
+
+
+def search_parameter(name: str):
+    route = next(route for route in router.routes if route.path == "/organizations/search")
+    return next(parameter for parameter in route.dependant.query_params if parameter.name == name)
+
+
+def query_errors(name: str, value) -> list:
+    _, errors = search_parameter(name).validate(value, {}, loc=("query", name))
+    return [error["type"] for error in errors or []]
+
+
+@pytest.mark.parametrize("q, errors", [
+    ("ab", ["string_too_short"]),
+    ("abc", []),
+    ("a" * 200, []),
+    ("a" * 201, ["string_too_long"]),
+])
+def test_query_length_is_validated(q, errors):
+    assert query_errors("q", q) == errors
+
+
+@pytest.mark.parametrize("limit, valid", [(0, False), (1, True), (MAX_PAGE_LIMIT, True), (MAX_PAGE_LIMIT + 1, False)])
+def test_limit_is_bounded(limit, valid):
+    assert (query_errors("limit", limit) == []) is valid
+
+
+def test_like_wildcards_in_query_are_literal():
+    assert escape_like("100%_off\\") == "100\\%\\_off\\\\"
+    assert escape_like("Рога и копыта") == "Рога и копыта"
+
+
+class PgError(Exception):
+    def __init__(self, pgcode: str):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+class FailingSearchHelper:
+    """Сессия, в которой настройки поиска применяются, а сам запрос падает с ошибкой pgcode"""
+
+    def __init__(self, pgcode: str):
+        self.pgcode = pgcode
+        self.statements = 0
+
+    @asynccontextmanager
+    async def read_session(self):
+        helper = self
+
+        class Session:
+            async def execute(self, statement, parameters=None):
+                helper.statements += 1
+                if helper.statements > 1:
+                    raise DBAPIError("SELECT ...", parameters, PgError(helper.pgcode))
+
+        yield Session()
+
+
+def test_statement_timeout_becomes_search_timeout():
+    repository = OrganizationsRepository(FailingSearchHelper(QUERY_CANCELED))
+    with pytest.raises(SearchTimeoutError, match="250 ms"):
+        asyncio.run(repository.search_organizations("кофейня", 20, timeout_ms=250))
+
+
+def test_other_database_errors_are_not_masked():
+    repository = OrganizationsRepository(FailingSearchHelper("42P01"))
+    with pytest.raises(DBAPIError):
+        asyncio.run(repository.search_organizations("кофейня", 20))
+
+
+def test_search_timeout_is_503():
+    response = asyncio.run(search_timeout_handler(None, SearchTimeoutError("Search exceeded 250 ms")))
+    assert response.status_code == 503
+    assert json.loads(response.body) == {"detail": "Search exceeded 250 ms"}
+
+
+def test_id_cursor_is_rejected_before_querying():
+    helper = FailingSearchHelper(QUERY_CANCELED)
+    service = OrganizationsService(OrganizationsRepository(helper))
+    with pytest.raises(InvalidCursorError):
+        asyncio.run(service.search_organizations("кофейня", 20, encode_cursor("not-a-score")))
+    assert helper.statements == 0
@@ -0,0 +1,40 @@
+"""Объединение одинаковых одновременных вызовов декоратором coalesced"""
+import asyncio
+
+from app.services.single_flight import SingleFlight, coalesced
+
+
+class StubService:
+    def __init__(self):
+        self.single_flight = SingleFlight()
+        self.calls = 0
+
+    @coalesced
+    async def organizations(self, building_id: int, limit: int = 10, offset: int = 0):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return building_id, limit, offset
+
+
+def test_equivalent_calls_share_one_execution():
+    async def scenario():
+        service = StubService()
+        results = await asyncio.gather(
+            service.organizations(1),
+            service.organizations(1, 10),
+            service.organizations(1, limit=10),
+            service.organizations(building_id=1, offset=0),
+        )
+        assert service.calls == 1
+        assert results == [(1, 10, 0)] * 4
+
+    asyncio.run(scenario())
+
+
+def test_different_arguments_are_not_coalesced():
+    async def scenario():
+        service = StubService()
+        await asyncio.gather(service.organizations(1), service.organizations(1, 20), service.organizations(2))
+        assert service.calls == 3
+
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+"""Журнал медленных запросов: значения параметров не попадают в журнал без log_parameters"""
+import time
+from types import SimpleNamespace
+from uuid import UUID
+
+from app.database.slow_queries import SlowQueryRecorder
+
+STATEMENT = "SELECT id FROM organizations WHERE name ILIKE $1 AND building_id = $2"
+PARAMETERS = ("%секретный поиск%", UUID(int=7))
+
+
+def record(recorder: SlowQueryRecorder) -> dict:
+    context = SimpleNamespace(_slow_query_started=time.perf_counter() - 1, execution_options={})
+    recorder._after_cursor_execute(None, None, STATEMENT, PARAMETERS, context, executemany=True)
+    return recorder.recent(1)[0]
+
+
+def test_parameters_are_redacted_by_default():
+    entry = record(SlowQueryRecorder(threshold_ms=10, explain_sample_rate=0))
+    assert entry["parameters"] == ["<str>", "<UUID>"]
+    assert entry["statement"] == STATEMENT
+    assert "секретный" not in repr(entry)
+
+
+def test_parameters_are_logged_when_enabled():
+    entry = record(SlowQueryRecorder(threshold_ms=10, explain_sample_rate=0, log_parameters=True))
+    assert entry["parameters"] == [repr(PARAMETERS[0]), repr(PARAMETERS[1])]
+
+
+def test_fast_queries_are_not_recorded():
+    recorder = SlowQueryRecorder(threshold_ms=5000, explain_sample_rate=0)
+    record_context = SimpleNamespace(_slow_query_started=time.perf_counter(), execution_options={})
+    recorder._after_cursor_execute(None, None, STATEMENT, PARAMETERS, record_context, executemany=False)
+    assert recorder.recent(10) == [] and recorder.recorded == 0
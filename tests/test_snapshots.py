@@ -0,0 +1,69 @@
+"""Защита от удаления и перезаписи баз, не созданных clone"""
+import asyncio
+
+import pytest
+
+from app.database.snapshots import CLONE_COMMENT, DatabaseSnapshots, SnapshotError
+
+
+class StubResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class StubConnection:
+    """Подключение администратора: комментарии баз и выполненные DROP DATABASE"""
+
+    def __init__(self, comments: dict):
+        self.comments = comments
+        self.dropped = []
+
+    async def execute(self, statement, parameters=None):
+        sql = str(statement)
+        if "shobj_description" in sql:
+            return StubResult(self.comments.get(parameters["name"]))
+        if "FROM pg_database" in sql:
+            return StubResult(1 if parameters["name"] in self.comments else None)
+        if sql.startswith("DROP DATABASE"):
+            self.dropped.append(sql)
+        return StubResult(None)
+
+
+def drop_clone(comments: dict, target: str) -> StubConnection:
+    conn = StubConnection(comments)
+    snapshots = DatabaseSnapshots("postgresql://admin@localhost/postgres", "organizations_db")
+    snapshots._quote = lambda conn, identifier: f'"{identifier}"'
+
+    class AdminConnection:
+        async def __aenter__(self):
+            return conn
+
+        async def __aexit__(self, *exc_info):
+            return False
+
+    snapshots._admin_connection = AdminConnection
+    asyncio.run(snapshots.drop_clone(target))
+    return conn
+
+
+def test_drop_clone_drops_tagged_clone():
+    conn = drop_clone({"organizations_db_test": CLONE_COMMENT.format("organizations_db")}, "organizations_db_test")
+    assert conn.dropped == ['DROP DATABASE "organizations_db_test"']
+
+
+@pytest.mark.parametrize("target, comments", [
+    ("postgres", {"postgres": "default administrative connection database"}),
+    ("other_app", {"other_app": None}),
+    ("organizations_db", {"organizations_db": CLONE_COMMENT.format("organizations_db")}),
+    ("foreign_clone", {"foreign_clone": CLONE_COMMENT.format("other_app")}),
+])
+def test_drop_clone_refuses_untagged_databases(target, comments):
+    with pytest.raises(SnapshotError):
+        drop_clone(comments, target)
+
+
+def test_drop_clone_of_missing_database_is_noop():
+    assert drop_clone({}, "organizations_db_test").dropped == []
@@ -0,0 +1,210 @@
+"""Сетка in-memory индекса зданий против перебора всех точек и против PostGIS (метка db)"""
+import asyncio
+import math
+import random
+from uuid import UUID
+
+import pytest
+
+from app.database.db_helper import AsyncDatabaseHelper
+from app.database.repositories.buildings import BuildingsRepository
+from app.database.repositories.organisations import EARTH_RADIUS, SPHEROID_MARGIN, OrganizationsRepository, degree_bounds
+from app.services.spatial_index import BuildingSpatialIndex, GridSnapshot
+
+
+def haversine(latitude_1: float, longitude_1: float, latitude_2: float, longitude_2: float) -> float:
+    """Расстояние по большому кругу в метрах"""
+    phi_1, phi_2 = math.radians(latitude_1), math.radians(latitude_2)
+    value = (
+        math.sin((phi_2 - phi_1) / 2) ** 2
+        + math.cos(phi_1) * math.cos(phi_2) * math.sin(math.radians(longitude_2 - longitude_1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(value, 1.0)))
+
+
+def random_points(rng: random.Random, count: int, latitudes: tuple, longitudes: tuple) -> list:
+    return [(UUID(int=rng.getrandbits(128)), rng.uniform(*latitudes), rng.uniform(*longitudes)) for _ in range(count)]
+
+
+def make_index(points: list, cell_degrees: float) -> BuildingSpatialIndex:
+    index = BuildingSpatialIndex(repository=None, cell_degrees=cell_degrees)
+    index.snapshot = GridSnapshot.build(points, cell_degrees)
+    return index
+
+
+@pytest.mark.parametrize("cell_degrees", [0.001, 0.01, 0.5])
+def test_circle_matches_brute_force_haversine(cell_degrees):
+    rng = random.Random(1)
+    points = random_points(rng, 5000, (55.5, 55.9), (37.3, 37.9))
+    index = make_index(points, cell_degrees)
+
+    for _ in range(100):
+        latitude, longitude = rng.uniform(55.4, 56.0), rng.uniform(37.2, 38.0)
+        radius = rng.choice([50, 500, 2000, 10000, 50000])
+        # Индекс отбирает кандидатов с запасом на эллипсоид, как && по envelope в PostGIS
+        expected = {
+            point_id for point_id, point_latitude, point_longitude in points
+            if haversine(latitude, longitude, point_latitude, point_longitude) <= radius * SPHEROID_MARGIN
+        }
+        assert set(index.circle(latitude, longitude, radius)) == expected
+
+
+def test_circle_covers_every_point_within_radius_worldwide():
+    rng = random.Random(2)
+    points = random_points(rng, 5000, (-80.0, 80.0), (-170.0, 170.0))
+    index = make_index(points, 1.0)
+
+    for _ in range(100):
+        latitude, longitude = rng.uniform(-75.0, 75.0), rng.uniform(-160.0, 160.0)
+        radius = rng.choice([10000, 100000, 500000])
+        found = set(index.circle(latitude, longitude, radius))
+        for point_id, point_latitude, point_longitude in points:
+            distance = haversine(latitude, longitude, point_latitude, point_longitude)
+            if distance <= radius:
+                assert point_id in found
+            elif distance > radius * SPHEROID_MARGIN:
+                assert point_id not in found
+
+
+@pytest.mark.parametrize("cell_degrees", [0.001, 0.01, 0.5])
+def test_rectangle_matches_brute_force_bounds(cell_degrees):
+    rng = random.Random(3)
+    points = random_points(rng, 5000, (55.5, 55.9), (37.3, 37.9))
+    index = make_index(points, cell_degrees)
+
+    for _ in range(100):
+        latitude, longitude = rng.uniform(55.4, 56.0), rng.uniform(37.2, 38.0)
+        width, height = rng.uniform(10, 30000), rng.uniform(10, 30000)
+        min_longitude, min_latitude, max_longitude, max_latitude = degree_bounds(
+            latitude, longitude, width / 2, height / 2, width_latitude=latitude
+        )
+        expected = {
+            point_id for point_id, point_latitude, point_longitude in points
+            if min_latitude <= point_latitude <= max_latitude and min_longitude <= point_longitude <= max_longitude
+        }
+        assert set(index.rectangle(latitude, longitude, width, height)) == expected
+
+
+def test_points_on_cell_and_grid_edges():
+    points = [(UUID(int=number), latitude, longitude) for number, (latitude, longitude) in enumerate([
+        (55.0, 37.0), (55.01, 37.01), (55.02, 37.0), (55.0, 37.02), (55.02, 37.02)
+    ])]
+    snapshot = GridSnapshot.build(points, 0.01)
+
+    # Границы включительно, как ST_Intersects
+    assert sorted(snapshot.within_bounds(37.0, 55.0, 37.02, 55.02)) == list(range(5))
+    assert list(snapshot.within_bounds(37.005, 55.005, 37.015, 55.015)) == [1]
+    assert len(snapshot.within_bounds(38.0, 56.0, 39.0, 57.0)) == 0
+
+
+def test_empty_snapshot():
+    index = make_index([], 0.01)
+    assert index.circle(55.75, 37.62, 1000) == []
+    assert index.rectangle(55.75, 37.62, 1000, 1000) == []
+    assert index.stats()["buildings"] == 0
+
+
+def test_degree_bounds_clamps_at_poles():
+    min_longitude, min_latitude, max_longitude, max_latitude = degree_bounds(89.99, 10.0, 5000, 5000)
+    assert max_latitude == 90.0
+    # Ширина считается по параллели у полюса: долгота покрывает весь мир
+    assert (min_longitude, max_longitude) == (-180.0, 180.0)
+
+    assert degree_bounds(-89.99, 10.0, 5000, 5000)[1] == -90.0
+
+
+def test_degree_bounds_clamps_at_antimeridian():
+    min_longitude, _, max_longitude, _ = degree_bounds(0.0, 179.99, 10000, 10000)
+    assert max_longitude == 180.0 and min_longitude < 179.99
+
+    min_longitude, _, max_longitude, _ = degree_bounds(0.0, -179.99, 10000, 10000)
+    assert min_longitude == -180.0 and max_longitude > -179.99
+
+
+def test_circle_near_pole_finds_points_at_any_longitude():
+    points = [(UUID(int=number), 89.999, longitude) for number, longitude in enumerate(range(-180, 180, 30))]
+    index = make_index(points, 0.5)
+
+    assert len(index.circle(90.0, 0.0, 1000)) == len(points)
+
+
+class StubBuildingsRepository:
+    def __init__(self, rows: list):
+        self.rows = rows
+        self.stamp = (len(rows), 100)
+        self.reads = 0
+
+    async def locations_stamp(self):
+        return self.stamp
+
+    async def building_locations(self):
+        self.reads += 1
+        return list(self.rows)
+
+
+def test_check_rereads_buildings_only_when_stamp_changes():
+    async def scenario():
+        repository = StubBuildingsRepository([(UUID(int=1), 55.75, 37.61)])
+        index = BuildingSpatialIndex(repository, cell_degrees=0.01)
+        await index.refresh()
+
+        assert await index.check() is False
+        assert repository.reads == 1
+
+        repository.rows.append((UUID(int=2), 55.7501, 37.6101))
+        repository.stamp = (2, 101)
+        assert await index.check() is True
+        assert repository.reads == 2
+        assert set(index.circle(55.75, 37.61, 100)) == {UUID(int=1), UUID(int=2)}
+
+    asyncio.run(scenario())
+
+
+async def collect_ids(search) -> set:
+    """id организаций со всех страниц поиска"""
+    ids, after = set(), None
+    while True:
+        page = await search(after)
+        ids.update(organization.id for organization in page.items)
+        if page.next_key is None:
+            return ids
+        after = page.next_key
+
+
+async def postgis_mismatches(database_url: str, queries: int = 40, seed: int = 0) -> list:
+    db_helper = AsyncDatabaseHelper(database_url)
+    await db_helper.connect()
+    repository = OrganizationsRepository(db_helper)
+    index = BuildingSpatialIndex(BuildingsRepository(db_helper))
+    rng = random.Random(seed)
+    mismatches = []
+    try:
+        await index.refresh()
+        for number in range(queries):
+            latitude, longitude = rng.uniform(55.5, 55.9), rng.uniform(37.3, 37.9)
+            if number % 2:
+                radius = rng.uniform(50, 3000)
+                building_ids = index.circle(latitude, longitude, radius)
+                expected = await collect_ids(lambda after: repository.organizations_in_circle(
+                    latitude, longitude, radius, 500, after))
+                actual = await collect_ids(lambda after: repository.organizations_in_circle(
+                    latitude, longitude, radius, 500, after, building_ids))
+                query = f"circle({latitude:.5f}, {longitude:.5f}, {radius:.0f})"
+            else:
+                width, height = rng.uniform(100, 5000), rng.uniform(100, 5000)
+                building_ids = index.rectangle(latitude, longitude, width, height)
+                expected = await collect_ids(lambda after: repository.organizations_in_rectangle(
+                    latitude, longitude, width, height, 500, after))
+                actual = await collect_ids(lambda after: repository.organizations_in_rectangle(
+                    latitude, longitude, width, height, 500, after, building_ids))
+                query = f"rectangle({latitude:.5f}, {longitude:.5f}, {width:.0f}, {height:.0f})"
+            if expected != actual:
+                mismatches.append(f"{query}: postgis={len(expected)} memory={len(actual)}")
+    finally:
+        await db_helper.close()
+    return mismatches
+
+
+@pytest.mark.db
+def test_grid_matches_postgis_search(test_db_url):
+    assert asyncio.run(postgis_mismatches(test_db_url)) == []